@@ -0,0 +1,321 @@
+from typing import Any, AsyncIterator, Dict, List
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
+from ReusableWallet.databases.pg.dto.ledger import LedgerBalance, CreateLedgerDTO
+from ReusableWallet.databases.pg.dto.transaction import CreateTransactionDTO
+from ReusableWallet.databases.pg.engine import PoolConfig, PoolStats, get_async_engine
+from ReusableWallet.databases.pg.enums import ClerkType, TransactionType, TransactionStatus, LockingMode, PartitionMode
+from ReusableWallet.databases.pg.exceptions import EntityNotFound, InsufficientBalance
+from ReusableWallet.databases.pg.instrumentation import (
+    NULL_SINK, InstrumentationSink, InstrumentedManager, instrument_engine, instrumented
+)
+from ReusableWallet.databases.pg.locking import ContentionStats, async_retry_on_conflict
+from ReusableWallet.databases.pg.managers.asset import AsyncAssetManager
+from ReusableWallet.databases.pg.managers.balance import AsyncBalanceManager
+from ReusableWallet.databases.pg.managers.ledger import AsyncLedgerManager
+from ReusableWallet.databases.pg.managers.transaction import AsyncTransactionManager
+from ReusableWallet.databases.pg.partitioning import create_schema
+from ReusableWallet.databases.pg.schema import Ledger, Transaction
+
+
+class AsyncPgWallet:
+    """PgWallet for asyncio applications, on SQLAlchemy's asyncio extension and asyncpg.
+
+    Operations take an AsyncSession first, like PgWallet's take a Session.
+    Objects cannot lazy-load under asyncio, so sessions should come from
+    self.Session, which does not expire objects on commit.
+    """
+
+    def __init__(self, uri: str, locking: LockingMode = LockingMode.NONE, max_retries: int = 3,
+                 pool_config: PoolConfig = None, instrumentation: InstrumentationSink = None):
+        self.locking = locking
+        self.max_retries = max_retries
+        self.contention = ContentionStats()
+        self.asset_manager = AsyncAssetManager
+        self.transaction_manager = AsyncTransactionManager
+        self.ledger_manager = AsyncLedgerManager
+        self.balance_manager = AsyncBalanceManager
+        self.engine = get_async_engine(self.async_uri(uri), pool_config)
+        self.Session = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.instrumentation = instrumentation or NULL_SINK
+        if self.instrumentation.enabled:
+            instrument_engine(self.engine.sync_engine)
+            for attribute in ('asset_manager', 'transaction_manager', 'ledger_manager', 'balance_manager'):
+                setattr(self, attribute, InstrumentedManager(getattr(self, attribute), attribute))
+
+    @staticmethod
+    def async_uri(uri: str) -> str:
+        url = make_url(uri)
+        if url.drivername in ('postgresql', 'postgresql+psycopg2', 'postgres'):
+            url = url.set(drivername='postgresql+asyncpg')
+        return str(url)
+
+    async def setup_database(self, partitioning: PartitionMode = PartitionMode.NONE) -> None:
+        async with self.engine.begin() as connection:
+            await connection.run_sync(create_schema, partitioning)
+
+    def get_engine_instance(self):
+        return self.engine
+
+    def pool_stats(self) -> PoolStats:
+        return self.engine.sync_engine.pool.stats()
+
+    @instrumented
+    async def create_asset(self, session: AsyncSession, user_id: str, symbol: str):
+        asset = await self.asset_manager.create_asset(user_id, symbol, session)
+        await session.commit()
+        return asset
+
+    @instrumented
+    async def fetch_user_asset(self, session: AsyncSession, user_id: str, symbol: str):
+        return await self.asset_manager.fetch_user_asset(user_id, symbol, session)
+
+    @instrumented
+    async def fetch_balance(self, session: AsyncSession, asset_id: str) -> LedgerBalance:
+        return await self._read_balance(session, asset_id)
+
+    @instrumented
+    async def fetch_balances(self, session: AsyncSession, asset_ids: List[str]) -> Dict[Any, LedgerBalance]:
+        return await self.balance_manager.fetch_balances(asset_ids, session)
+
+    @instrumented
+    async def fetch_user_balances(self, session: AsyncSession, user_id: str) -> Dict[Any, LedgerBalance]:
+        return await self.balance_manager.fetch_user_balances(user_id, session)
+
+    @instrumented
+    async def find_transactions_by_metadata(self, session: AsyncSession, key: str, value: Any,
+                                            limit: int = 100) -> List[Transaction]:
+        return await self.transaction_manager.find_by_metadata(key, value, session, limit=limit)
+
+    @instrumented
+    async def fetch_transactions_page(self, session: AsyncSession, asset_id: str,
+                                      history_filter: HistoryFilter = None, after: HistoryCursor = None,
+                                      page_size: int = 500) -> HistoryPage:
+        return await self.transaction_manager.fetch_transactions_page(
+            asset_id, history_filter or HistoryFilter(), after, page_size, session
+        )
+
+    def iter_transactions(self, session: AsyncSession, asset_id: str, history_filter: HistoryFilter = None,
+                          page_size: int = 500) -> AsyncIterator[Transaction]:
+        return self.transaction_manager.iter_transactions(
+            asset_id, history_filter or HistoryFilter(), page_size, session
+        )
+
+    @instrumented
+    async def fetch_ledgers_page(self, session: AsyncSession, asset_id: str, history_filter: HistoryFilter = None,
+                                 after: HistoryCursor = None, page_size: int = 500) -> HistoryPage:
+        return await self.ledger_manager.fetch_ledgers_page(
+            asset_id, history_filter or HistoryFilter(), after, page_size, session
+        )
+
+    def iter_ledgers(self, session: AsyncSession, asset_id: str, history_filter: HistoryFilter = None,
+                     page_size: int = 500) -> AsyncIterator[Ledger]:
+        return self.ledger_manager.iter_ledgers(asset_id, history_filter or HistoryFilter(), page_size, session)
+
+    async def _read_balance(self, session: AsyncSession, asset_id: str, for_update: bool = False) -> LedgerBalance:
+        if not for_update:
+            balance = await self.balance_manager.fetch_total_balance(asset_id, session)
+        elif self.locking is LockingMode.PESSIMISTIC:
+            balance = await self.balance_manager.lock_balance(asset_id, session)
+        else:
+            balance = await self.balance_manager.fetch_balance(asset_id, session)
+        if not balance:
+            return LedgerBalance(pending_balance=0, available_balance=0)
+        return LedgerBalance(
+            pending_balance=balance.pending_balance,
+            available_balance=balance.available_balance
+        )
+
+    async def _create_ledger(self, session: AsyncSession, payload: CreateLedgerDTO):
+        # The balance row is written in the same DB transaction as the ledger it mirrors
+        ledger = await self.ledger_manager.create_ledger(payload, session)
+        await self.balance_manager.update_balance(
+            payload.asset_id, payload.pending_balance, payload.available_balance, session
+        )
+        return ledger
+
+    @staticmethod
+    def _check_writable(asset) -> None:
+        # Balance buckets are only written by PgWallet
+        if asset.balance_buckets > 1:
+            raise ValueError(f"Asset with id {asset.id} has balance buckets; write it through PgWallet")
+
+    async def _fetch_transaction(self, session: AsyncSession, transaction_id: str, type: TransactionType):
+        transaction = await self.transaction_manager.fetch_transaction_by_id(transaction_id, session)
+        if not transaction:
+            raise EntityNotFound('Transaction')
+        if transaction.type is not type:
+            raise Exception(f"Transaction is not a {type.value.replace('_', ' ').lower()}")
+        return transaction
+
+    @instrumented
+    @async_retry_on_conflict
+    async def initiate_fund_asset(
+            self,
+            session: AsyncSession,
+            asset_id: str,
+            amount: float,
+            fee: float = 0,
+            reason: str = None,
+            description: str = None,
+            metadata: Dict[str, Any] = None,
+    ):
+        asset = await self.asset_manager.fetch_asset_by_id(asset_id, session)
+        if not asset:
+            raise ValueError(f"Asset with id {asset_id} not found")
+        self._check_writable(asset)
+        transaction = await self.transaction_manager.create_transaction(CreateTransactionDTO(
+            user=asset.user,
+            asset_id=asset.id,
+            symbol=asset.symbol,
+            amount=amount,
+            fee=fee,
+            total_amount=fee + amount,
+            clerk_type=ClerkType.CREDIT,
+            type=TransactionType.WALLET_FUND,
+            reason=reason,
+            description=description,
+            metadata=metadata,
+        ), session)
+        balance = await self._read_balance(session, asset.id, for_update=True)
+        ledger = await self._create_ledger(session, CreateLedgerDTO(
+            asset_id=asset.id,
+            clerk_type=ClerkType.CREDIT,
+            entry_type=TransactionType.WALLET_FUND,
+            transaction_id=transaction.id,
+            pending_balance=balance.pending_balance + amount,
+            pending_delta=amount,
+            available_delta=0,
+            available_balance=balance.available_balance
+        ))
+        await session.commit()
+        return ledger
+
+    @instrumented
+    @async_retry_on_conflict
+    async def validate_fund_asset(self, session: AsyncSession, transaction_id: str):
+        transaction = await self._fetch_transaction(session, transaction_id, TransactionType.WALLET_FUND)
+        balance = await self._read_balance(session, transaction.asset_id, for_update=True)
+        ledger = await self._create_ledger(session, CreateLedgerDTO(
+            asset_id=transaction.asset_id,
+            clerk_type=ClerkType.CREDIT,
+            entry_type=TransactionType.WALLET_FUND,
+            transaction_id=transaction.id,
+            available_balance=balance.available_balance + transaction.amount,
+            available_delta=transaction.amount,
+            pending_delta=0,
+            pending_balance=balance.pending_balance
+        ))
+        transaction.status = TransactionStatus.SUCCESSFUL
+        await session.commit()
+        return ledger
+
+    @instrumented
+    @async_retry_on_conflict
+    async def initiate_charge_asset(
+            self,
+            session: AsyncSession,
+            asset_id: str,
+            amount: float,
+            fee: float = 0,
+            reason: str = None,
+            description: str = None,
+            metadata: Dict[str, Any] = None,
+    ):
+        asset = await self.asset_manager.fetch_asset_by_id(asset_id, session)
+        if not asset:
+            raise ValueError(f"Asset with id {asset_id} not found")
+        self._check_writable(asset)
+        balance = await self._read_balance(session, asset.id, for_update=True)
+        if amount > balance.available_balance:
+            raise InsufficientBalance(asset_id)
+        transaction = await self.transaction_manager.create_transaction(CreateTransactionDTO(
+            user=asset.user,
+            asset_id=asset.id,
+            symbol=asset.symbol,
+            amount=amount,
+            fee=fee,
+            total_amount=fee + amount,
+            clerk_type=ClerkType.DEBIT,
+            type=TransactionType.WITHDRAWAL,
+            reason=reason,
+            description=description,
+            metadata=metadata,
+        ), session)
+        ledger = await self._create_ledger(session, CreateLedgerDTO(
+            asset_id=asset.id,
+            clerk_type=ClerkType.DEBIT,
+            entry_type=TransactionType.WITHDRAWAL,
+            transaction_id=transaction.id,
+            available_balance=balance.available_balance - amount,
+            available_delta=-amount,
+            pending_balance=balance.pending_balance,
+            pending_delta=0,
+        ))
+        await session.commit()
+        return ledger
+
+    @instrumented
+    @async_retry_on_conflict
+    async def validate_charge_asset(self, session: AsyncSession, transaction_id: str):
+        transaction = await self._fetch_transaction(session, transaction_id, TransactionType.WITHDRAWAL)
+        balance = await self._read_balance(session, transaction.asset_id, for_update=True)
+        ledger = await self._create_ledger(session, CreateLedgerDTO(
+            asset_id=transaction.asset_id,
+            clerk_type=ClerkType.DEBIT,
+            entry_type=TransactionType.WITHDRAWAL,
+            transaction_id=transaction.id,
+            pending_balance=balance.pending_balance - transaction.amount,
+            pending_delta=-transaction.amount,
+            available_balance=balance.available_balance,
+            available_delta=0
+        ))
+        transaction.status = TransactionStatus.SUCCESSFUL
+        await session.commit()
+        return ledger
+
+    @instrumented
+    @async_retry_on_conflict
+    async def reverse_charge_asset(
+            self,
+            session: AsyncSession,
+            transaction_id: str,
+            amount: float,
+            fee: float,
+            reason: str = None,
+            description: str = None,
+            metadata: Dict[str, Any] = None,
+    ):
+        charge = await self._fetch_transaction(session, transaction_id, TransactionType.WITHDRAWAL)
+        asset = await self.asset_manager.fetch_asset_by_id(charge.asset_id, session)
+        self._check_writable(asset)
+        balance = await self._read_balance(session, asset.id, for_update=True)
+        transaction = await self.transaction_manager.create_transaction(CreateTransactionDTO(
+            user=asset.user,
+            asset_id=asset.id,
+            symbol=asset.symbol,
+            amount=amount,
+            fee=fee,
+            total_amount=fee + amount,
+            clerk_type=ClerkType.CREDIT,
+            type=TransactionType.WITHDRAWAL_REVERSAL,
+            reason=reason,
+            description=description,
+            metadata=metadata,
+        ), session)
+        ledger = await self._create_ledger(session, CreateLedgerDTO(
+            asset_id=asset.id,
+            clerk_type=ClerkType.CREDIT,
+            entry_type=TransactionType.WITHDRAWAL_REVERSAL,
+            transaction_id=transaction.id,
+            available_balance=balance.available_balance + amount,
+            available_delta=amount,
+            pending_delta=0,
+            pending_balance=balance.pending_balance,
+        ))
+        await session.commit()
+        return ledger
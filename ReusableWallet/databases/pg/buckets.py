@@ -0,0 +1,64 @@
+import logging
+import threading
+from typing import Optional
+
+from ReusableWallet.databases.pg.engine import PoolConfig
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+logger = logging.getLogger(__name__)
+
+
+class BucketRebalancer:
+    """Background job that evens out the balance buckets of hot assets.
+
+    Credits pile up on whichever bucket was free and debits drain the
+    fullest ones, so buckets drift apart; a debit larger than what one
+    bucket holds still succeeds, but locks every bucket anyway. Each pass
+    spreads every bucketed asset's balance evenly and refreshes its
+    asset_balances row, which writes to bucketed assets do not update.
+    start() runs a pass every interval seconds on a daemon thread.
+    run_once() runs a single pass, e.g. from cron through
+    `python -m ReusableWallet.databases.pg.setup rebalance-buckets`.
+    """
+
+    def __init__(self, uri: str, interval: float = 60.0, pool_config: PoolConfig = None):
+        self.wallet = PgWallet(uri, pool_config=pool_config)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """Rebalance every bucketed asset, one DB transaction each; returns the number of ledgers written."""
+        written = 0
+        with self.wallet.Session() as session:
+            asset_ids = self.wallet.bucket_manager.fetch_bucketed_asset_ids(session)
+            session.commit()
+            for asset_id in asset_ids:
+                try:
+                    written += len(self.wallet.rebalance_buckets(session, asset_id))
+                except Exception:
+                    session.rollback()
+                    logger.exception("Rebalancing the buckets of asset %s failed", asset_id)
+        return written
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='balance-buckets', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                written = self.run_once()
+                logger.debug("Wrote %d bucket transfer ledgers", written)
+            except Exception:
+                # A failed pass is retried on the next interval; the job must not die with it
+                logger.exception("Balance bucket pass failed")
+            self._stopped.wait(self.interval)
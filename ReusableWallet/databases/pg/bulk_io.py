@@ -0,0 +1,98 @@
+import time
+from typing import IO
+
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.dto.bulk_io import CopyFilter, CopyReport
+from ReusableWallet.databases.pg.engine import PoolConfig, get_engine
+from ReusableWallet.databases.pg.enums import CopyFormat
+from ReusableWallet.databases.pg.managers.balance import BalanceManager
+from ReusableWallet.databases.pg.managers.bucket import BucketManager
+from ReusableWallet.databases.pg.managers.bulk_io import BulkIOManager
+from ReusableWallet.databases.pg.schema import Ledger, Transaction
+
+_TABLES = {table.name: table for table in (Transaction.__table__, Ledger.__table__)}
+
+
+class BulkIO:
+    """Export and import transactions and ledgers with Postgres COPY.
+
+    Exports stream COPY ... TO STDOUT straight into a binary file object,
+    so memory stays flat however many rows match. Imports stream the file
+    into a temporary staging table with COPY ... FROM STDIN and check it
+    there before anything reaches the real tables:
+    - rows whose id is already present are skipped, so an interrupted
+      import can be run again;
+    - every asset (and, for ledgers, transaction) referenced must exist,
+      so import transactions before their ledgers;
+    - ledgers must continue their chains: none may come before an
+      existing ledger of the same asset and bucket. The imported assets'
+      balance rows, and buckets, are locked before this check, so writers
+      cannot extend a chain between the check and the load;
+    - running balances are replayed from the deltas onto the end of each
+      existing chain, and rewritten where they disagree (recompute=True)
+      or rejected (recompute=False).
+    The load, and the rebuild of the imported assets' balance rows, happen
+    in the same transaction, so a rejected import leaves nothing behind.
+    Files are read back in the column order export writes them.
+    """
+
+    def __init__(self, uri: str, pool_config: PoolConfig = None, tolerance: float = 1e-6):
+        self.engine = get_engine(uri, pool_config)
+        self.tolerance = tolerance
+
+    def export_rows(self, table: str, output: IO[bytes], format: CopyFormat = CopyFormat.CSV,
+                    copy_filter: CopyFilter = None) -> CopyReport:
+        report = CopyReport(table=table, format=format)
+        started = time.perf_counter()
+        with Session(self.engine) as session:
+            report.rows = BulkIOManager.copy_out(_table(table), copy_filter or CopyFilter(), format, output, session)
+            session.commit()
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def import_rows(self, table: str, source: IO[bytes], format: CopyFormat = CopyFormat.CSV,
+                    recompute: bool = True) -> CopyReport:
+        report = CopyReport(table=table, format=format)
+        started = time.perf_counter()
+        target = _table(table)
+        with Session(self.engine) as session:
+            staging = BulkIOManager.copy_in(target, format, source, session)
+            report.skipped_rows = BulkIOManager.delete_existing(target, staging, session)
+            self._check_references(staging, 'asset_id', 'assets', session)
+            if target is Ledger.__table__:
+                self._check_references(staging, 'transaction_id', 'transactions', session)
+                asset_ids = BulkIOManager.fetch_staged_asset_ids(staging, session)
+                self._lock_chains(asset_ids, session)
+                interleaved = BulkIOManager.fetch_interleaved_asset(staging, session)
+                if interleaved is not None:
+                    raise ValueError(f"Imported ledgers of asset {interleaved} come before its existing ledgers")
+                report.corrected_rows = BulkIOManager.replay_balances(staging, self.tolerance, recompute, session)
+                if report.corrected_rows and not recompute:
+                    raise ValueError(f"{report.corrected_rows} imported ledgers break their running balances")
+                report.rows = BulkIOManager.load(target, staging, session)
+                BalanceManager.rebuild_balances(session, asset_ids)
+            else:
+                report.rows = BulkIOManager.load(target, staging, session)
+            session.commit()
+        report.seconds = time.perf_counter() - started
+        return report
+
+    @staticmethod
+    def _lock_chains(asset_ids, session: Session) -> None:
+        # Same order as single writes: balance rows, then the buckets of bucketed assets
+        BalanceManager.lock_balances(sorted(asset_ids), session)
+        for asset_id in BucketManager.fetch_bucketed_asset_ids(session, asset_ids):
+            BucketManager.lock_buckets(asset_id, session)
+
+    @staticmethod
+    def _check_references(staging: str, column: str, referenced: str, session: Session) -> None:
+        unknown = BulkIOManager.fetch_unknown_references(staging, column, referenced, session)
+        if unknown:
+            raise ValueError(f"Imported rows reference unknown {referenced}: {', '.join(map(str, unknown))}")
+
+
+def _table(name: str):
+    if name not in _TABLES:
+        raise ValueError(f"Only {' and '.join(_TABLES)} can be exported and imported")
+    return _TABLES[name]
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ReusableWallet.databases.pg.schema import Asset
+
+# Column attributes copied into a snapshot; relationships are left to lazy-load
+_ASSET_COLUMNS = tuple(attribute.key for attribute in inspect(Asset).column_attrs)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class AssetCache:
+    """In-process LRU cache of asset rows, keyed by id and by (user, symbol).
+
+    Entries are plain snapshots of the asset's columns, so one cache can be
+    shared by several wallets and threads. An entry is dropped after ttl
+    seconds, when max_size is exceeded (least recently used first), or when
+    the asset is invalidated. Invalidation only reaches this process; ttl
+    bounds how long a change made elsewhere can go unseen.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # str(asset id) -> (expires at, column snapshot)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._ids_by_user_symbol: Dict[Tuple[str, str], str] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_by_id(self, asset_id, session: Session) -> Optional[Asset]:
+        with self._lock:
+            snapshot = self._lookup(str(asset_id))
+        return self._attach(snapshot, session)
+
+    def get_by_user_symbol(self, user_id: str, symbol: str, session: Session) -> Optional[Asset]:
+        with self._lock:
+            key = self._ids_by_user_symbol.get((user_id, symbol))
+            snapshot = self._lookup(key) if key else self._miss()
+        return self._attach(snapshot, session)
+
+    def put(self, asset: Asset) -> None:
+        state = inspect(asset)
+        # Pending or partially expired objects would cache values that are not in the database
+        if state.key is None or state.unloaded.intersection(_ASSET_COLUMNS):
+            return
+        snapshot = {column: state.dict[column] for column in _ASSET_COLUMNS}
+        key = str(asset.id)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (self.clock() + self.ttl, snapshot)
+            self._ids_by_user_symbol[(asset.user, asset.symbol)] = key
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def invalidate(self, asset_id=None, user_id: str = None, symbol: str = None) -> None:
+        with self._lock:
+            keys = {str(asset_id)} if asset_id is not None else set()
+            if user_id is not None and symbol is not None:
+                key = self._ids_by_user_symbol.pop((user_id, symbol), None)
+                if key:
+                    keys.add(key)
+            for key in keys:
+                if self._remove(key):
+                    self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._ids_by_user_symbol.clear()
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return self._miss()
+        expires_at, snapshot = entry
+        if expires_at <= self.clock():
+            self._remove(key)
+            return self._miss()
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return snapshot
+
+    def _miss(self) -> None:
+        self.stats.misses += 1
+        return None
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        snapshot = entry[1]
+        user_symbol = (snapshot['user'], snapshot['symbol'])
+        if self._ids_by_user_symbol.get(user_symbol) == key:
+            del self._ids_by_user_symbol[user_symbol]
+        return True
+
+    @staticmethod
+    def _attach(snapshot: Optional[Dict[str, Any]], session: Session) -> Optional[Asset]:
+        if snapshot is None:
+            return None
+        asset = Asset(**snapshot)
+        make_transient_to_detached(asset)
+        # Returns the session's own copy if it already has one; never emits a query
+        return session.merge(asset, load=False)
@@ -0,0 +1,72 @@
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.engine import PoolConfig, get_engine
+from ReusableWallet.databases.pg.managers.checkpoint import CheckpointManager
+from ReusableWallet.databases.pg.schema import Asset
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointWorker:
+    """Background job that keeps every asset's balance checkpoints current.
+
+    Each pass walks all assets in batches of batch_size. For each batch it
+    checkpoints every spacing-th ledger since the asset's last checkpoint,
+    and commits per batch. start() runs a pass every interval seconds on a
+    daemon thread. run_once() runs a single pass, e.g. from cron through
+    `python -m ReusableWallet.databases.pg.setup checkpoint`.
+    """
+
+    def __init__(self, uri: str, spacing: int = 10000, interval: float = 300.0, margin_seconds: float = 60.0,
+                 batch_size: int = 500, pool_config: PoolConfig = None):
+        self.engine = get_engine(uri, pool_config)
+        self.spacing = spacing
+        self.interval = interval
+        self.margin_seconds = margin_seconds
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        written = 0
+        last_id = None
+        with Session(self.engine) as session:
+            while True:
+                statement = select(Asset.id).order_by(Asset.id).limit(self.batch_size)
+                if last_id is not None:
+                    statement = statement.where(Asset.id > last_id)
+                asset_ids = list(session.execute(statement).scalars())
+                if not asset_ids:
+                    return written
+                written += CheckpointManager.write_checkpoints(
+                    asset_ids, self.spacing, self.margin_seconds, session
+                )
+                session.commit()
+                last_id = asset_ids[-1]
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='balance-checkpoints', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                written = self.run_once()
+                logger.debug("Wrote %d balance checkpoints", written)
+            except Exception:
+                # A failed pass is retried on the next interval; the job must not die with it
+                logger.exception("Balance checkpoint pass failed")
+            self._stopped.wait(self.interval)
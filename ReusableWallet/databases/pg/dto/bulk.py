@@ -0,0 +1,28 @@
+from typing import Optional, Any, Dict
+
+from dataclasses import dataclass, field
+
+from ReusableWallet.databases.pg.schema import Ledger
+
+
+@dataclass
+class BulkItemDTO:
+    asset_id: str
+    amount: float
+    fee: float = 0
+    reason: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class BulkItemResult:
+    item: BulkItemDTO
+    # Detached Ledger holding the written row, or None when the item failed
+    ledger: Optional[Ledger] = None
+    error: Optional[str] = None
+    # The exception error was taken from, for callers that re-raise it
+    exception: Optional[Exception] = field(default=None, repr=False, compare=False)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import List, Optional
+
+from dataclasses import dataclass
+
+from ReusableWallet.databases.pg.enums import CopyFormat
+
+
+@dataclass
+class CopyFilter:
+    """Which rows an export covers; unset fields do not filter."""
+    asset_ids: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    # created_at range, start inclusive and end exclusive
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+@dataclass
+class CopyReport:
+    table: str
+    format: CopyFormat
+    # Rows exported, or rows loaded by an import
+    rows: int = 0
+    # Imported rows whose id was already in the table, left out so an import can be repeated
+    skipped_rows: int = 0
+    # Imported ledgers whose running balances did not match the replayed chain and were rewritten
+    corrected_rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return self.rows / self.seconds if self.seconds else None
@@ -0,0 +1,50 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import Any, Generic, List, Optional, Sequence, TypeVar
+
+from dataclasses import dataclass, field
+
+from ReusableWallet.databases.pg.enums import ClerkType, TransactionStatus, TransactionType
+
+T = TypeVar('T')
+
+
+@dataclass
+class HistoryFilter:
+    # Transaction type, or ledger entry type
+    types: Optional[Sequence[TransactionType]] = None
+    # Transactions only
+    statuses: Optional[Sequence[TransactionStatus]] = None
+    clerk_types: Optional[Sequence[ClerkType]] = None
+    # created_at range; start is inclusive, end exclusive
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    newest_first: bool = True
+
+
+@dataclass(frozen=True)
+class HistoryCursor:
+    # Position of the last row returned; the next page starts strictly after it
+    created_at: datetime
+    id: uuid.UUID
+
+    def to_token(self) -> str:
+        raw = f"{self.created_at.isoformat()}|{self.id}".encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @classmethod
+    def from_token(cls, token: str) -> 'HistoryCursor':
+        created_at, row_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+        return cls(created_at=datetime.fromisoformat(created_at), id=uuid.UUID(row_id))
+
+    @classmethod
+    def of(cls, row: Any) -> 'HistoryCursor':
+        return cls(created_at=row.created_at, id=row.id)
+
+
+@dataclass
+class HistoryPage(Generic[T]):
+    items: List[T] = field(default_factory=list)
+    # None on the last page
+    next_cursor: Optional[HistoryCursor] = None
@@ -1,4 +1,6 @@
-from typing import Optional
+import uuid
+from datetime import datetime
+from typing import NamedTuple, Optional
 
 from dataclasses import dataclass, asdict
 
@@ -16,12 +18,44 @@ class CreateLedgerDTO:
     pending_delta: Optional[float] = 0
     available_balance: Optional[float] = 0
     available_delta: Optional[float] = 0
+    bucket: int = 0
 
     def to_dict(self):
         return asdict(self)
 
 
+class LedgerRecord(NamedTuple):
+    """A ledger row written by the lean write engine.
+
+    It has the attributes of a Ledger, but is a plain tuple: no identity map
+    entry, instance state or relationships.
+    """
+    id: uuid.UUID
+    asset_id: uuid.UUID
+    clerk_type: ClerkType
+    entry_type: TransactionType
+    transaction_id: uuid.UUID
+    pending_balance: float
+    pending_delta: float
+    available_balance: float
+    available_delta: float
+    bucket: int
+    created_at: datetime
+
+
 @dataclass
 class LedgerBalance:
     pending_balance: float
     available_balance: float
+
+
+@dataclass
+class BalanceDiscrepancy:
+    asset_id: str
+    # None when the asset has no materialized balance row
+    pending_balance: Optional[float]
+    available_balance: Optional[float]
+    ledger_pending_balance: float
+    ledger_available_balance: float
+    # Set when the row compared is one of the asset's balance buckets
+    bucket: Optional[int] = None
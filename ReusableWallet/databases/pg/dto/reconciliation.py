@@ -0,0 +1,70 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from dataclasses import dataclass, field
+
+from ReusableWallet.databases.pg.dto.ledger import BalanceDiscrepancy
+from ReusableWallet.databases.pg.enums import TransactionStatus, TransactionType
+
+
+@dataclass
+class LedgerChainBreak:
+    """A ledger whose running balance is not the previous balance plus its delta."""
+    asset_id: uuid.UUID
+    ledger_id: uuid.UUID
+    created_at: datetime
+    # 'pending' or 'available'
+    balance: str
+    previous_balance: float
+    delta: float
+    recorded_balance: float
+
+
+@dataclass
+class TransactionMismatch:
+    """A transaction whose ledger deltas do not add up to what its type and status imply."""
+    asset_id: uuid.UUID
+    transaction_id: uuid.UUID
+    type: TransactionType
+    status: TransactionStatus
+    amount: float
+    expected_pending_delta: float
+    pending_delta: float
+    expected_available_delta: float
+    available_delta: float
+    ledgers: int
+    # True when one of the transaction's ledgers belongs to another asset
+    foreign_ledgers: bool
+
+
+@dataclass
+class ReconciliationReport:
+    assets: int = 0
+    ledgers: int = 0
+    transactions: int = 0
+    seconds: float = 0.0
+    chain_breaks: List[LedgerChainBreak] = field(default_factory=list)
+    transaction_mismatches: List[TransactionMismatch] = field(default_factory=list)
+    # Assets whose balance row disagrees with the end of their ledger chain
+    balance_discrepancies: List[BalanceDiscrepancy] = field(default_factory=list)
+    # Assets that could not be checked, with the error
+    failed_assets: List[str] = field(default_factory=list)
+
+    @property
+    def consistent(self) -> bool:
+        return not (self.chain_breaks or self.transaction_mismatches
+                    or self.balance_discrepancies or self.failed_assets)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return self.ledgers / self.seconds if self.seconds else None
+
+    def merge(self, other: 'ReconciliationReport') -> None:
+        self.assets += other.assets
+        self.ledgers += other.ledgers
+        self.transactions += other.transactions
+        self.chain_breaks.extend(other.chain_breaks)
+        self.transaction_mismatches.extend(other.transaction_mismatches)
+        self.balance_discrepancies.extend(other.balance_discrepancies)
+        self.failed_assets.extend(other.failed_assets)
@@ -0,0 +1,13 @@
+from typing import List
+
+from dataclasses import dataclass, field
+
+from ReusableWallet.databases.pg.schema import Ledger
+
+
+@dataclass
+class SettlementResult:
+    # Detached Ledger objects, one per settled transaction
+    ledgers: List[Ledger] = field(default_factory=list)
+    # Unknown, already settled or non-settleable transaction ids, and those of assets with balance buckets
+    skipped: List[str] = field(default_factory=list)
@@ -0,0 +1,27 @@
+from typing import List, Optional
+
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ShardMove:
+    """A user whose assets live on source but whose owner shard is now target."""
+    user_id: str
+    source: str
+    target: str
+
+
+@dataclass
+class RebalanceReport:
+    moves: List[ShardMove] = field(default_factory=list)
+    users_moved: int = 0
+    assets_moved: int = 0
+    # Rows copied across all tables, assets included
+    rows_copied: int = 0
+    # "<user_id>: <error>" for every user whose move failed and was rolled back on the target
+    failed_users: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return self.rows_copied / self.seconds if self.seconds else None
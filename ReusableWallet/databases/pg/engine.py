@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from ReusableWallet.databases.pg.enums import PartitionMode
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_pre_ping: bool = False
+    # Seconds after which a connection is replaced on checkout; -1 keeps connections forever
+    pool_recycle: int = -1
+    statement_timeout_ms: Optional[int] = None
+
+
+@dataclass
+class PoolStats:
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    checkout_wait_seconds: float
+    max_checkout_wait_seconds: float
+
+    @property
+    def mean_checkout_wait_seconds(self) -> float:
+        return self.checkout_wait_seconds / self.checkouts if self.checkouts else 0.0
+
+
+class _TimedCheckout:
+    """Pool mixin recording how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._timing_lock = threading.Lock()
+        self.reset_timings()
+
+    def reset_timings(self) -> None:
+        with self._timing_lock:
+            self.checkouts = 0
+            self.checkout_wait_seconds = 0.0
+            self.max_checkout_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self._timing_lock:
+                self.checkouts += 1
+                self.checkout_wait_seconds += waited
+                self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, waited)
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            size=self.size(),
+            checked_in=self.checkedin(),
+            checked_out=self.checkedout(),
+            overflow=self.overflow(),
+            checkouts=self.checkouts,
+            checkout_wait_seconds=self.checkout_wait_seconds,
+            max_checkout_wait_seconds=self.max_checkout_wait_seconds,
+        )
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class EngineRegistry:
+    """One engine per (URI, PoolConfig), shared by every wallet in the process.
+
+    After fork() the child drops the pooled connections it inherited without
+    closing them, since they still belong to the parent, and opens its own on
+    first use. This keeps gunicorn/celery prefork workers off their parent's
+    sockets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines: Dict[Tuple[str, PoolConfig, bool], Any] = {}
+        self._schemas_created = set()
+        self._pid = os.getpid()
+
+    def get_engine(self, uri: str, pool_config: PoolConfig = None) -> Engine:
+        return self._get(uri, pool_config or PoolConfig(), is_async=False)
+
+    def get_async_engine(self, uri: str, pool_config: PoolConfig = None) -> AsyncEngine:
+        return self._get(uri, pool_config or PoolConfig(), is_async=True)
+
+    def schema_created(self, uri: str, partitioning: PartitionMode) -> bool:
+        """Whether this process already set up the schema of a URI with the given partitioning."""
+        with self._lock:
+            return (uri, partitioning) in self._schemas_created
+
+    def mark_schema_created(self, uri: str, partitioning: PartitionMode) -> None:
+        """Record that the schema of a URI was set up; call it only once that succeeded."""
+        with self._lock:
+            self._schemas_created.add((uri, partitioning))
+
+    def pool_stats(self) -> Dict[Tuple[str, PoolConfig], PoolStats]:
+        with self._lock:
+            engines = dict(self._engines)
+        return {
+            (uri, pool_config): self._sync_engine(engine).pool.stats()
+            for (uri, pool_config, _), engine in engines.items()
+        }
+
+    def dispose_all(self) -> None:
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for engine in engines:
+            self._sync_engine(engine).dispose()
+
+    def after_fork(self) -> None:
+        # Another thread of the parent may have held the lock at fork time, so the child starts a fresh one
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        for engine in self._engines.values():
+            # Swaps in a new, empty pool (with fresh checkout timings) without closing the parent's connections
+            self._sync_engine(engine).dispose(close=False)
+
+    def _get(self, uri: str, pool_config: PoolConfig, is_async: bool):
+        if self._pid != os.getpid():
+            # Interpreters without os.register_at_fork
+            self.after_fork()
+        key = (uri, pool_config, is_async)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = self._create(uri, pool_config, is_async)
+                self._engines[key] = engine
+            return engine
+
+    @staticmethod
+    def _create(uri: str, pool_config: PoolConfig, is_async: bool):
+        options = dict(
+            pool_size=pool_config.pool_size,
+            max_overflow=pool_config.max_overflow,
+            pool_timeout=pool_config.pool_timeout,
+            pool_pre_ping=pool_config.pool_pre_ping,
+            pool_recycle=pool_config.pool_recycle,
+        )
+        if is_async:
+            if pool_config.statement_timeout_ms is not None:
+                options["connect_args"] = {
+                    "server_settings": {"statement_timeout": str(pool_config.statement_timeout_ms)}
+                }
+            return create_async_engine(uri, poolclass=TimedAsyncAdaptedQueuePool, **options)
+        if pool_config.statement_timeout_ms is not None:
+            options["connect_args"] = {"options": f"-c statement_timeout={pool_config.statement_timeout_ms}"}
+        return create_engine(uri, poolclass=TimedQueuePool, **options)
+
+    @staticmethod
+    def _sync_engine(engine) -> Engine:
+        return engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+
+engine_registry = EngineRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=engine_registry.after_fork)
+
+
+def get_engine(uri: str, pool_config: PoolConfig = None) -> Engine:
+    return engine_registry.get_engine(uri, pool_config)
+
+
+def get_async_engine(uri: str, pool_config: PoolConfig = None) -> AsyncEngine:
+    return engine_registry.get_async_engine(uri, pool_config)
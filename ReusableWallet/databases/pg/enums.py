@@ -17,6 +17,8 @@ class TransactionType(Enum):
     WITHDRAWAL_REVERSAL = 'WITHDRAWAL_REVERSAL'
     PURCHASE_REFUND = 'PURCHASE_REFUND'
     WALLET_FUND = 'WALLET_FUND'
+    # Moves balance between the buckets of one asset; nets to zero
+    BUCKET_TRANSFER = 'BUCKET_TRANSFER'
 
 
 class TransactionStatus(Enum):
@@ -25,3 +27,38 @@ class TransactionStatus(Enum):
     FAILED = 'FAILED'
     PROCESSING = 'PROCESSING'
     PROVIDER_PROCESSING = 'PROVIDER_PROCESSING'
+
+
+class LockingMode(Enum):
+    NONE = 'NONE'
+    PESSIMISTIC = 'PESSIMISTIC'
+    OPTIMISTIC = 'OPTIMISTIC'
+
+
+class WriteEngine(Enum):
+    ORM = 'ORM'
+    STATEMENT = 'STATEMENT'
+    # Cached Core statements returning LedgerRecord tuples; no ORM objects or dataclass copies per write
+    LEAN = 'LEAN'
+
+
+class ReconciliationMethod(Enum):
+    # Window functions in Postgres; only broken rows are sent back
+    SQL = 'SQL'
+    # Ledger chunks are streamed to the client and checked with NumPy
+    NUMPY = 'NUMPY'
+
+
+class PartitionMode(Enum):
+    NONE = 'NONE'
+    # Range partitions of transactions and ledgers by calendar month of created_at
+    MONTHLY = 'MONTHLY'
+    # A fixed number of partitions by hash of asset_id
+    HASH = 'HASH'
+
+
+class CopyFormat(Enum):
+    # With a header row; readable by spreadsheets and other databases
+    CSV = 'CSV'
+    # Postgres' binary COPY format; smaller and faster, but only read back by Postgres
+    BINARY = 'BINARY'
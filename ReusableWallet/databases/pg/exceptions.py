@@ -2,3 +2,16 @@ class EntityNotFound(BaseException):
     def __init__(self, entity: str):
         message = f"{entity} entity not found"
         super().__init__(message)
+
+
+class ConcurrentUpdateError(Exception):
+    def __init__(self, entity: str, attempts: int):
+        message = f"{entity} entity was concurrently updated, gave up after {attempts} attempts"
+        super().__init__(message)
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, asset_id: str):
+        message = "Insufficient balance"
+        super().__init__(message)
+        self.asset_id = asset_id
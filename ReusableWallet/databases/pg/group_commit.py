@@ -0,0 +1,218 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from ReusableWallet.databases.pg.dto.bulk import BulkItemDTO
+from ReusableWallet.databases.pg.enums import ClerkType, TransactionType
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+logger = logging.getLogger(__name__)
+
+# Queued in place of an operation to wake a worker up and make it exit
+_STOP = object()
+
+
+@dataclass
+class _Operation:
+    clerk_type: ClerkType
+    item: BulkItemDTO
+    future: Future
+
+
+@dataclass
+class GroupCommitStats:
+    batches: int = 0
+    operations: int = 0
+    # Batches that hit a database error and were written again one operation per transaction
+    split_batches: int = 0
+
+    @property
+    def mean_batch_size(self) -> Optional[float]:
+        return self.operations / self.batches if self.batches else None
+
+
+class GroupCommitQueue:
+    """Front-end for PgWallet that shares one commit between many small fund and charge calls.
+
+    submit_fund and submit_charge queue an initiate_fund_asset or
+    initiate_charge_asset and return a concurrent.futures.Future at once.
+    Worker threads take up to max_batch_size queued operations, waiting at
+    most max_wait seconds after the first for more to arrive, and write them
+    in one DB transaction, so the batch pays a single commit and fsync.
+    Balances are chained in memory in submission order through the wallet's
+    bulk write path; each future then resolves to its detached Ledger or
+    raises its own error (InsufficientBalance, ValueError for unknown
+    assets). If the batch's transaction fails as a whole, its operations
+    are retried one per transaction, so one bad operation cannot fail the
+    others.
+
+    A larger batch or longer wait means fewer commits and higher throughput
+    at the price of latency; benchmarks.group_commit measures the trade-off.
+    From asyncio, await asyncio.wrap_future(queue.submit_charge(...)).
+    """
+
+    def __init__(self, wallet: PgWallet, max_batch_size: int = 100, max_wait: float = 0.005, workers: int = 1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.wallet = wallet
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.stats = GroupCommitStats()
+        self._queue: queue.Queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._accepting = False
+
+    def __enter__(self) -> 'GroupCommitQueue':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def submit_fund(self, asset_id: str, amount: float, fee: float = 0, reason: str = None,
+                    metadata: Dict[str, Any] = None) -> Future:
+        return self._submit(ClerkType.CREDIT, BulkItemDTO(asset_id, amount, fee, reason, metadata))
+
+    def submit_charge(self, asset_id: str, amount: float, fee: float = 0, reason: str = None,
+                      metadata: Dict[str, Any] = None) -> Future:
+        return self._submit(ClerkType.DEBIT, BulkItemDTO(asset_id, amount, fee, reason, metadata))
+
+    def _submit(self, clerk_type: ClerkType, item: BulkItemDTO) -> Future:
+        future = Future()
+        # Under the lock, so no operation can be queued behind the stop sentinels
+        with self._submit_lock:
+            if not self._accepting:
+                raise RuntimeError("GroupCommitQueue is not running; call start() first")
+            self._queue.put(_Operation(clerk_type, item, future))
+        return future
+
+    def start(self) -> None:
+        with self._submit_lock:
+            if self._threads:
+                return
+            self._accepting = True
+            self._threads = [
+                threading.Thread(target=self._run, name=f'group-commit-{index}', daemon=True)
+                for index in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop accepting operations, write everything already queued, then stop the workers.
+
+        If the workers do not finish within timeout they are left to finish
+        on their own. Otherwise any operation still queued fails with a
+        RuntimeError, so no future is left unresolved.
+        """
+        with self._submit_lock:
+            self._accepting = False
+            threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+        if any(thread.is_alive() for thread in threads):
+            return
+        while True:
+            try:
+                operation = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if operation is not _STOP and not operation.future.done():
+                operation.future.set_exception(RuntimeError("GroupCommitQueue stopped before the operation ran"))
+
+    def _run(self) -> None:
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as error:
+                    # The worker must outlive a failed batch; its callers get the error
+                    logger.exception("Group commit batch failed")
+                    for operation in batch:
+                        if not operation.future.done():
+                            operation.future.set_exception(error)
+            if stopping:
+                return
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                operation = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if operation is _STOP:
+                return batch, True
+            batch.append(operation)
+        return batch, False
+
+    def _write(self, batch: List[_Operation]) -> None:
+        with self.wallet.Session() as session:
+            try:
+                self._lock_balances(session, batch)
+                results = []
+                # Consecutive operations of one kind share a bulk write, which keeps submission order
+                start = 0
+                while start < len(batch):
+                    clerk_type = batch[start].clerk_type
+                    end = start
+                    while end < len(batch) and batch[end].clerk_type is clerk_type:
+                        end += 1
+                    type = TransactionType.WITHDRAWAL if clerk_type is ClerkType.DEBIT else TransactionType.WALLET_FUND
+                    results.extend(self.wallet._bulk_write_chunk(
+                        session, [operation.item for operation in batch[start:end]], clerk_type, type
+                    ))
+                    start = end
+                session.commit()
+            except SQLAlchemyError as error:
+                session.rollback()
+                if len(batch) == 1:
+                    batch[0].future.set_exception(error)
+                    self._count(1)
+                    return
+                with self._stats_lock:
+                    self.stats.split_batches += 1
+                for operation in batch:
+                    self._write([operation])
+                return
+        self._count(len(batch))
+        for operation, result in zip(batch, results):
+            if result.succeeded:
+                operation.future.set_result(result.ledger)
+            else:
+                operation.future.set_exception(result.exception or ValueError(result.error))
+
+    def _lock_balances(self, session, batch: List[_Operation]) -> None:
+        # Every balance row of the batch in one pass in asset id order. The runs' bulk writes then
+        # find their rows already held, so two workers never each hold part of the other's assets.
+        asset_ids = set()
+        for operation in batch:
+            try:
+                asset_ids.add(uuid.UUID(str(operation.item.asset_id)))
+            except ValueError:
+                continue
+        assets = self.wallet.asset_manager.fetch_assets_by_ids(list(asset_ids), session)
+        self.wallet.balance_manager.lock_balances(sorted(assets), session)
+
+    def _count(self, operations: int) -> None:
+        with self._stats_lock:
+            self.stats.batches += 1
+            self.stats.operations += operations
@@ -0,0 +1,310 @@
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# The span of the wallet operation running in this thread or asyncio task, if it is instrumented
+_current_span: contextvars.ContextVar[Optional['OperationSpan']] = contextvars.ContextVar('wallet_span', default=None)
+
+
+@dataclass
+class OperationSpan:
+    operation: str
+    duration_seconds: float = 0.0
+    statements: int = 0
+    # Rows returned or affected, as reported by the driver
+    rows: int = 0
+    sql_seconds: float = 0.0
+    # Time spent in statements that take row locks (FOR UPDATE); an upper bound on lock wait
+    lock_seconds: float = 0.0
+    # Seconds per step, e.g. "ledger_manager.create_ledger", "flush", "commit"; steps may nest
+    phases: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    # Exception class name when the operation raised
+    error: Optional[str] = None
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] += seconds
+
+
+class InstrumentationSink:
+    """Receives one OperationSpan per finished wallet operation.
+
+    Subclasses override record(). It is called on the thread or task that ran
+    the operation, so it should be quick and thread-safe. A sink whose
+    enabled is False is never called, and the wallet does no bookkeeping.
+    """
+    enabled = True
+
+    def record(self, span: OperationSpan) -> None:
+        raise NotImplementedError
+
+
+class NullSink(InstrumentationSink):
+    enabled = False
+
+    def record(self, span: OperationSpan) -> None:
+        pass
+
+
+NULL_SINK = NullSink()
+
+
+class MultiSink(InstrumentationSink):
+    def __init__(self, sinks: Iterable[InstrumentationSink]):
+        self.sinks = [sink for sink in sinks if sink.enabled]
+
+    def record(self, span: OperationSpan) -> None:
+        for sink in self.sinks:
+            sink.record(span)
+
+
+class SlowOperationLog(InstrumentationSink):
+    """Logs a warning with the span's breakdown for operations slower than threshold_seconds."""
+
+    def __init__(self, threshold_seconds: float, log: logging.Logger = None):
+        self.threshold_seconds = threshold_seconds
+        self.log = log or logger
+
+    def record(self, span: OperationSpan) -> None:
+        if span.duration_seconds < self.threshold_seconds:
+            return
+        phases = ", ".join(f"{name}={seconds * 1000:.1f}ms"
+                           for name, seconds in sorted(span.phases.items(), key=lambda item: -item[1]))
+        self.log.warning(
+            "Slow wallet operation %s took %.1fms: statements=%d rows=%d sql=%.1fms lock=%.1fms error=%s phases=[%s]",
+            span.operation, span.duration_seconds * 1000, span.statements, span.rows,
+            span.sql_seconds * 1000, span.lock_seconds * 1000, span.error, phases,
+        )
+
+
+class PrometheusSink(InstrumentationSink):
+    """Aggregates spans and renders them in the Prometheus text exposition format.
+
+    Serve render() from the application's /metrics endpoint.
+    """
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, prefix: str = 'wallet', buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._bucket_counts: Dict[str, List[int]] = {}
+        self._duration_sums: Dict[str, float] = defaultdict(float)
+        self._totals: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._phase_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+
+    def record(self, span: OperationSpan) -> None:
+        with self._lock:
+            self._calls[(span.operation, span.error or 'ok')] += 1
+            counts = self._bucket_counts.setdefault(span.operation, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if span.duration_seconds <= bound:
+                    counts[index] += 1
+            self._duration_sums[span.operation] += span.duration_seconds
+            self._totals[(span.operation, 'statements')] += span.statements
+            self._totals[(span.operation, 'rows')] += span.rows
+            self._totals[(span.operation, 'sql_seconds')] += span.sql_seconds
+            self._totals[(span.operation, 'lock_seconds')] += span.lock_seconds
+            for phase, seconds in span.phases.items():
+                self._phase_seconds[(span.operation, phase)] += seconds
+
+    def render(self) -> str:
+        name = self.prefix
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {name}_operations_total counter")
+            for (operation, outcome), count in sorted(self._calls.items()):
+                lines.append(f'{name}_operations_total{{operation="{operation}",outcome="{outcome}"}} {count}')
+
+            lines.append(f"# TYPE {name}_operation_duration_seconds histogram")
+            for operation, counts in sorted(self._bucket_counts.items()):
+                total = sum(count for (op, _), count in self._calls.items() if op == operation)
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{name}_operation_duration_seconds_bucket{{operation="{operation}",le="{bound}"}} {count}')
+                lines.append(f'{name}_operation_duration_seconds_bucket{{operation="{operation}",le="+Inf"}} {total}')
+                lines.append(f'{name}_operation_duration_seconds_sum{{operation="{operation}"}} '
+                             f'{self._duration_sums[operation]}')
+                lines.append(f'{name}_operation_duration_seconds_count{{operation="{operation}"}} {total}')
+
+            for metric in ('statements', 'rows', 'sql_seconds', 'lock_seconds'):
+                lines.append(f"# TYPE {name}_{metric}_total counter")
+                for (operation, key), value in sorted(self._totals.items()):
+                    if key == metric:
+                        lines.append(f'{name}_{metric}_total{{operation="{operation}"}} {value}')
+
+            lines.append(f"# TYPE {name}_phase_seconds_total counter")
+            for (operation, phase), seconds in sorted(self._phase_seconds.items()):
+                lines.append(f'{name}_phase_seconds_total{{operation="{operation}",phase="{phase}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+
+def instrumented(method):
+    """Record a wallet method as one OperationSpan on the wallet's instrumentation sink.
+
+    Calls made while another instrumented operation is running, such as
+    retries or a bulk write's inner steps, count towards that operation.
+    """
+    name = method.__name__
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            if not self.instrumentation.enabled or _current_span.get() is not None:
+                return await method(self, *args, **kwargs)
+            span, token, started = _start(name)
+            try:
+                return await method(self, *args, **kwargs)
+            except BaseException as error:
+                span.error = type(error).__name__
+                raise
+            finally:
+                _finish(self.instrumentation, span, token, started)
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.instrumentation.enabled or _current_span.get() is not None:
+            return method(self, *args, **kwargs)
+        span, token, started = _start(name)
+        try:
+            return method(self, *args, **kwargs)
+        except BaseException as error:
+            span.error = type(error).__name__
+            raise
+        finally:
+            _finish(self.instrumentation, span, token, started)
+    return wrapper
+
+
+def _start(name: str):
+    span = OperationSpan(name)
+    return span, _current_span.set(span), time.perf_counter()
+
+
+def _finish(sink: InstrumentationSink, span: OperationSpan, token, started: float) -> None:
+    span.duration_seconds = time.perf_counter() - started
+    _current_span.reset(token)
+    sink.record(span)
+
+
+class InstrumentedManager:
+    """Proxy that times every call to a manager as a phase of the running span."""
+
+    def __init__(self, manager, name: str):
+        self._manager = manager
+        self._name = name
+
+    def __getattr__(self, attribute):
+        value = getattr(self._manager, attribute)
+        if not callable(value) or inspect.isgeneratorfunction(value) or inspect.isasyncgenfunction(value):
+            return value
+        phase = f"{self._name}.{attribute}"
+
+        if inspect.iscoroutinefunction(value):
+            async def timed_coroutine(*args, **kwargs):
+                span = _current_span.get()
+                if span is None:
+                    return await value(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await value(*args, **kwargs)
+                finally:
+                    span.add_phase(phase, time.perf_counter() - started)
+            return timed_coroutine
+
+        def timed(*args, **kwargs):
+            span = _current_span.get()
+            if span is None:
+                return value(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                span.add_phase(phase, time.perf_counter() - started)
+        return timed
+
+
+_listened_engines = weakref.WeakSet()
+_listen_lock = threading.Lock()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count statements, rows and SQL time of an engine into the running span. Idempotent."""
+    with _listen_lock:
+        if not _listened_engines:
+            _listen_sessions()
+        if engine in _listened_engines:
+            return
+        _listened_engines.add(engine)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if _current_span.get() is not None:
+        connection.info.setdefault('wallet_statement_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    span = _current_span.get()
+    if span is None:
+        return
+    elapsed = time.perf_counter() - connection.info['wallet_statement_started'].pop()
+    span.statements += 1
+    span.sql_seconds += elapsed
+    if cursor.rowcount and cursor.rowcount > 0:
+        span.rows += cursor.rowcount
+    if 'FOR UPDATE' in statement:
+        span.lock_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if _current_span.get() is not None and connection is not None:
+        started = connection.info.get('wallet_statement_started')
+        if started:
+            started.pop()
+
+
+def _listen_sessions() -> None:
+    # Class-level, so it also covers sessions the caller built and the sync side of an AsyncSession
+    event.listen(Session, 'before_flush', _phase_started('flush'))
+    event.listen(Session, 'after_flush_postexec', _phase_ended('flush'))
+    event.listen(Session, 'before_commit', _phase_started('commit'))
+    event.listen(Session, 'after_commit', _phase_ended('commit'))
+    event.listen(Session, 'after_soft_rollback', _phase_abandoned)
+
+
+def _phase_started(phase: str):
+    def listener(session, *args):
+        if _current_span.get() is not None:
+            session.info[f'wallet_{phase}_started'] = time.perf_counter()
+    return listener
+
+
+def _phase_ended(phase: str):
+    def listener(session, *args):
+        span = _current_span.get()
+        started = session.info.pop(f'wallet_{phase}_started', None)
+        if span is not None and started is not None:
+            span.add_phase(phase, time.perf_counter() - started)
+    return listener
+
+
+def _phase_abandoned(session, previous_transaction):
+    session.info.pop('wallet_flush_started', None)
+    session.info.pop('wallet_commit_started', None)
@@ -0,0 +1,78 @@
+import functools
+import threading
+from dataclasses import dataclass
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from ReusableWallet.databases.pg.enums import LockingMode
+from ReusableWallet.databases.pg.exceptions import ConcurrentUpdateError
+
+
+@dataclass
+class ContentionStats:
+    operations: int = 0
+    retries: int = 0
+    conflicts: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record(self, retries: int, conflicted: bool = False) -> None:
+        with self._lock:
+            self.operations += 1
+            self.retries += retries
+            self.conflicts += int(conflicted)
+
+    @property
+    def retry_rate(self) -> float:
+        return self.retries / self.operations if self.operations else 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self.operations = self.retries = self.conflicts = 0
+
+
+def retry_on_conflict(method):
+    """Re-run a balance-changing wallet operation when its balance row went stale.
+
+    A stale version only surfaces at flush time, after the operation read the
+    balance. Under LockingMode.OPTIMISTIC the session is rolled back and the
+    whole operation is retried up to the wallet's max_retries; in the other
+    modes the conflict is reported straight away.
+    """
+    @functools.wraps(method)
+    def wrapper(self, session, *args, **kwargs):
+        retries = 0
+        while True:
+            try:
+                result = method(self, session, *args, **kwargs)
+            except StaleDataError:
+                session.rollback()
+                if self.locking is not LockingMode.OPTIMISTIC or retries >= self.max_retries:
+                    self.contention.record(retries, conflicted=True)
+                    raise ConcurrentUpdateError('AssetBalance', retries + 1)
+                retries += 1
+            else:
+                self.contention.record(retries)
+                return result
+    return wrapper
+
+
+def async_retry_on_conflict(method):
+    """retry_on_conflict for coroutine methods taking an AsyncSession."""
+    @functools.wraps(method)
+    async def wrapper(self, session, *args, **kwargs):
+        retries = 0
+        while True:
+            try:
+                result = await method(self, session, *args, **kwargs)
+            except StaleDataError:
+                await session.rollback()
+                if self.locking is not LockingMode.OPTIMISTIC or retries >= self.max_retries:
+                    self.contention.record(retries, conflicted=True)
+                    raise ConcurrentUpdateError('AssetBalance', retries + 1)
+                retries += 1
+            else:
+                self.contention.record(retries)
+                return result
+    return wrapper
@@ -1,5 +1,11 @@
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ReusableWallet.databases.pg.schema import Asset
+from ReusableWallet.databases.pg.cache import AssetCache
+from ReusableWallet.databases.pg.enums import ActivityStatus
+from ReusableWallet.databases.pg.schema import Asset, AssetBalance
 
 
 class AssetManager:
@@ -19,7 +25,7 @@ class AssetManager:
         Returns:
         Asset: The created Asset object.
         """
-        new_asset = Asset(user=user_id, symbol=symbol)
+        new_asset = Asset(user=user_id, symbol=symbol, balance=AssetBalance(pending_balance=0, available_balance=0))
         session.add(new_asset)
         return new_asset
 
@@ -42,6 +48,19 @@ class AssetManager:
         fetched_asset = session.query(Asset).filter(Asset.user == user_id).filter(Asset.symbol == symbol).first()
         return fetched_asset
 
+    @staticmethod
+    def fetch_user_assets(user_id: str, session: Session) -> List[Asset]:
+        """Fetch every asset of a user.
+
+        Parameters:
+        user_id (str): The user identifier for whom the assets belong.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        List[Asset]: The user's assets, ordered by symbol.
+        """
+        return session.query(Asset).filter(Asset.user == user_id).order_by(Asset.symbol).all()
+
     @staticmethod
     def fetch_asset_by_id(asset_id: str, session: Session) -> Asset:
         """Fetch a user asset by id.
@@ -59,3 +78,155 @@ class AssetManager:
         """
         fetched_asset = session.query(Asset).filter(Asset.id == asset_id).first()
         return fetched_asset
+
+    @staticmethod
+    def fetch_assets_by_ids(asset_ids: List[str], session: Session) -> Dict[str, Asset]:
+        """Fetch several assets by id in one query.
+
+        Parameters:
+        asset_ids (List[str]): The asset identifiers.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Dict[str, Asset]: The fetched assets keyed by id; unknown ids are left out.
+        """
+        if not asset_ids:
+            return {}
+        fetched_assets = session.query(Asset).filter(Asset.id.in_(asset_ids)).all()
+        return {asset.id: asset for asset in fetched_assets}
+
+    @staticmethod
+    def update_withdrawal_activity(asset_id: str, status: ActivityStatus, session: Session) -> Asset:
+        """Set whether withdrawals are allowed on an asset.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        status (ActivityStatus): The new withdrawal activity status.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Asset: The updated Asset object, or None if it does not exist.
+        """
+        fetched_asset = session.query(Asset).filter(Asset.id == asset_id).first()
+        if fetched_asset:
+            fetched_asset.withdrawal_activity = status
+        return fetched_asset
+
+    @staticmethod
+    def lock_asset(asset_id: str, session: Session) -> Asset:
+        """Fetch an asset with SELECT ... FOR NO KEY UPDATE, re-reading it even if the session holds it.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Asset: The locked Asset object, or None if it does not exist.
+        """
+        return (session.query(Asset)
+                .filter(Asset.id == asset_id)
+                .with_for_update(key_share=True)
+                .populate_existing()
+                .first())
+
+    @staticmethod
+    def update_balance_buckets(asset_id: str, buckets: int, session: Session) -> Asset:
+        """Set how many balance buckets an asset's balance is split into.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        buckets (int): The new number of balance buckets.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Asset: The updated Asset object, or None if it does not exist.
+        """
+        fetched_asset = session.query(Asset).filter(Asset.id == asset_id).first()
+        if fetched_asset:
+            fetched_asset.balance_buckets = buckets
+        return fetched_asset
+
+
+class CachedAssetManager:
+    """AssetManager that answers asset lookups from an AssetCache.
+
+    It has the same methods as AssetManager, so a wallet can use either.
+    Cache hits are merged into the caller's session without a query.
+    """
+
+    def __init__(self, cache: AssetCache):
+        self.cache = cache
+
+    def create_asset(self, user_id: str, symbol: str, session: Session) -> Asset:
+        self.cache.invalidate(user_id=user_id, symbol=symbol)
+        return AssetManager.create_asset(user_id, symbol, session)
+
+    def fetch_user_asset(self, user_id: str, symbol: str, session: Session) -> Asset:
+        asset = self.cache.get_by_user_symbol(user_id, symbol, session)
+        if asset is None:
+            asset = AssetManager.fetch_user_asset(user_id, symbol, session)
+            if asset is not None:
+                self.cache.put(asset)
+        return asset
+
+    def fetch_user_assets(self, user_id: str, session: Session) -> List[Asset]:
+        # The cache cannot tell whether it holds all of a user's assets, so this always queries
+        assets = AssetManager.fetch_user_assets(user_id, session)
+        for asset in assets:
+            self.cache.put(asset)
+        return assets
+
+    def fetch_asset_by_id(self, asset_id: str, session: Session) -> Asset:
+        asset = self.cache.get_by_id(asset_id, session)
+        if asset is None:
+            asset = AssetManager.fetch_asset_by_id(asset_id, session)
+            if asset is not None:
+                self.cache.put(asset)
+        return asset
+
+    def fetch_assets_by_ids(self, asset_ids: List[str], session: Session) -> Dict[str, Asset]:
+        assets = {}
+        missing = []
+        for asset_id in asset_ids:
+            asset = self.cache.get_by_id(asset_id, session)
+            if asset is None:
+                missing.append(asset_id)
+            else:
+                assets[asset.id] = asset
+        for asset_id, asset in AssetManager.fetch_assets_by_ids(missing, session).items():
+            self.cache.put(asset)
+            assets[asset_id] = asset
+        return assets
+
+    def update_withdrawal_activity(self, asset_id: str, status: ActivityStatus, session: Session) -> Asset:
+        # The wallet invalidates again after commit, so no other session re-caches the old status meanwhile
+        self.cache.invalidate(asset_id)
+        return AssetManager.update_withdrawal_activity(asset_id, status, session)
+
+    def lock_asset(self, asset_id: str, session: Session) -> Asset:
+        # A lock must see the row as committed, never a cached copy
+        return AssetManager.lock_asset(asset_id, session)
+
+    def update_balance_buckets(self, asset_id: str, buckets: int, session: Session) -> Asset:
+        self.cache.invalidate(asset_id)
+        return AssetManager.update_balance_buckets(asset_id, buckets, session)
+
+
+class AsyncAssetManager:
+    """AssetManager counterpart for an asyncio AsyncSession."""
+
+    @staticmethod
+    async def create_asset(user_id: str, symbol: str, session: AsyncSession) -> Asset:
+        new_asset = Asset(user=user_id, symbol=symbol, balance=AssetBalance(pending_balance=0, available_balance=0))
+        session.add(new_asset)
+        return new_asset
+
+    @staticmethod
+    async def fetch_user_asset(user_id: str, symbol: str, session: AsyncSession) -> Asset:
+        result = await session.execute(select(Asset).filter(Asset.user == user_id).filter(Asset.symbol == symbol))
+        return result.scalars().first()
+
+    @staticmethod
+    async def fetch_asset_by_id(asset_id: str, session: AsyncSession) -> Asset:
+        result = await session.execute(select(Asset).filter(Asset.id == asset_id))
+        return result.scalars().first()
@@ -0,0 +1,419 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import bindparam, desc, func, or_, select, text, true, update
+from sqlalchemy.engine import Row
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from ReusableWallet.databases.pg.dto.ledger import BalanceDiscrepancy, LedgerBalance
+from ReusableWallet.databases.pg.schema import Asset, AssetBalance, AssetBalanceBucket, Ledger
+
+
+# An asset and its balance row as one plain row. Key-sharing the asset row makes a locking read that
+# waited for the balance lock re-read balance_buckets, which enable_balance_buckets may have raised.
+_BALANCE_RECORD = """
+    SELECT a.id, a."user", a.symbol, a.balance_buckets, b.pending_balance, b.available_balance, b.version
+    FROM assets a JOIN asset_balances b ON b.asset_id = a.id
+    WHERE a.id = CAST(:asset_id AS uuid)
+"""
+# Built once at import; every call only binds parameters
+_FETCH_BALANCE_RECORD = text(_BALANCE_RECORD)
+_LOCK_BALANCE_RECORD = text(_BALANCE_RECORD + "FOR UPDATE OF b FOR KEY SHARE OF a")
+_WRITE_BALANCE = (update(AssetBalance.__table__)
+                  .where(AssetBalance.__table__.c.asset_id == bindparam('balance_asset_id'))
+                  .where(AssetBalance.__table__.c.version == bindparam('balance_version'))
+                  .values(pending_balance=bindparam('new_pending_balance'),
+                          available_balance=bindparam('new_available_balance'),
+                          version=AssetBalance.__table__.c.version + 1,
+                          updated_at=func.now()))
+
+
+class BalanceManager:
+    @staticmethod
+    def fetch_balance(asset_id: str, session: Session) -> AssetBalance:
+        """Fetch the materialized balance row of an asset.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        AssetBalance: The balance row, or None if the asset has none yet.
+        """
+        fetched_balance = session.query(AssetBalance).filter(AssetBalance.asset_id == asset_id).first()
+        return fetched_balance
+
+    @staticmethod
+    def fetch_total_balance(asset_id: str, session: Session) -> Optional[LedgerBalance]:
+        """Fetch an asset's balance in one query, summing its buckets if it has any.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        LedgerBalance: The balance, or None if the asset has no balance row yet.
+        """
+        row = session.execute(BalanceManager._total_balance(asset_id)).first()
+        return LedgerBalance(pending_balance=row[0], available_balance=row[1]) if row is not None else None
+
+    @staticmethod
+    def fetch_balances(asset_ids: Sequence, session: Session) -> Dict[Any, LedgerBalance]:
+        """Fetch the balances of many assets with one query.
+
+        Parameters:
+        asset_ids (Sequence): The asset identifiers; thousands per call are fine.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Dict[Any, LedgerBalance]: The balances keyed by asset id; unknown ids are left out.
+        """
+        if not asset_ids:
+            return {}
+        return BalanceManager._balances_by_asset(
+            session.execute(BalanceManager._asset_balances(Asset.id.in_(list(asset_ids))))
+        )
+
+    @staticmethod
+    def fetch_user_balances(user_id: str, session: Session) -> Dict[Any, LedgerBalance]:
+        """Fetch the balances of every asset of a user with one query.
+
+        Parameters:
+        user_id (str): The user identifier for whom the assets belong.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Dict[Any, LedgerBalance]: The balances keyed by asset id, in symbol order.
+        """
+        return BalanceManager._balances_by_asset(
+            session.execute(BalanceManager._asset_balances(Asset.user == user_id).order_by(Asset.symbol))
+        )
+
+    @staticmethod
+    def _asset_balances(condition):
+        # The materialized balance of each matching asset, or the sum of its buckets when it has any;
+        # the lateral subquery only reads the buckets of the assets selected
+        buckets = (select(func.sum(AssetBalanceBucket.pending_balance).label('pending_balance'),
+                          func.sum(AssetBalanceBucket.available_balance).label('available_balance'))
+                   .where(AssetBalanceBucket.asset_id == Asset.id)
+                   .lateral('buckets'))
+        return (select(Asset.id,
+                       func.coalesce(buckets.c.pending_balance, AssetBalance.pending_balance, 0),
+                       func.coalesce(buckets.c.available_balance, AssetBalance.available_balance, 0))
+                .select_from(Asset)
+                .outerjoin(AssetBalance, AssetBalance.asset_id == Asset.id)
+                .join(buckets, true())
+                .where(condition))
+
+    @staticmethod
+    def _balances_by_asset(rows) -> Dict[Any, LedgerBalance]:
+        return {asset_id: LedgerBalance(pending_balance=pending, available_balance=available)
+                for asset_id, pending, available in rows}
+
+    @staticmethod
+    def _total_balance(asset_id: str):
+        buckets = BalanceManager._bucket_totals(asset_id)
+        return (select(func.coalesce(buckets.c.pending_balance, AssetBalance.pending_balance),
+                       func.coalesce(buckets.c.available_balance, AssetBalance.available_balance))
+                .join(buckets, true())
+                .where(AssetBalance.asset_id == asset_id))
+
+    @staticmethod
+    def lock_balance(asset_id: str, session: Session) -> AssetBalance:
+        """Fetch the balance row of an asset with SELECT ... FOR UPDATE.
+
+        The row lock is held until the session's transaction ends, so writers
+        of the same asset serialize while other assets are unaffected. A zero
+        balance row is created first if the asset has none yet. The row is
+        always re-read, even if the session already holds it, so the balance
+        returned is the one committed before the lock was granted.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        AssetBalance: The locked balance row.
+        """
+        query = (session.query(AssetBalance)
+                 .filter(AssetBalance.asset_id == asset_id)
+                 .with_for_update()
+                 .populate_existing())
+        fetched_balance = query.first()
+        if fetched_balance is None:
+            session.execute(
+                insert(AssetBalance)
+                .values(asset_id=asset_id, pending_balance=0, available_balance=0)
+                .on_conflict_do_nothing(index_elements=[AssetBalance.asset_id])
+            )
+            fetched_balance = query.first()
+        return fetched_balance
+
+    @staticmethod
+    def lock_balances(asset_ids: List[str], session: Session) -> Dict[str, AssetBalance]:
+        """Fetch the balance rows of several assets with SELECT ... FOR UPDATE.
+
+        Rows are locked in asset id order so that concurrent batches touching
+        overlapping assets cannot deadlock. Missing rows are created first.
+
+        Parameters:
+        asset_ids (List[str]): The asset identifiers.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        Dict[str, AssetBalance]: The locked balance rows keyed by asset id.
+        """
+        if not asset_ids:
+            return {}
+        query = (session.query(AssetBalance)
+                 .filter(AssetBalance.asset_id.in_(asset_ids))
+                 .order_by(AssetBalance.asset_id)
+                 .with_for_update()
+                 .populate_existing())
+        fetched_balances = {balance.asset_id: balance for balance in query}
+        missing = [asset_id for asset_id in asset_ids if asset_id not in fetched_balances]
+        if missing:
+            session.execute(
+                insert(AssetBalance)
+                .values([{'asset_id': asset_id, 'pending_balance': 0, 'available_balance': 0}
+                         for asset_id in missing])
+                .on_conflict_do_nothing(index_elements=[AssetBalance.asset_id])
+            )
+            fetched_balances.update(
+                (balance.asset_id, balance) for balance in query.filter(AssetBalance.asset_id.in_(missing))
+            )
+        return fetched_balances
+
+    @staticmethod
+    def fetch_balance_record(asset_id, session: Session, for_update: bool = False) -> Optional[Row]:
+        """Fetch an asset's user, symbol and bucket count with its balance row, as one plain row.
+
+        Used by the lean write engine in place of an Asset and an AssetBalance
+        object. Columns are id, user, symbol, balance_buckets,
+        pending_balance, available_balance and version.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        session (Session): An SQLAlchemy Session object; its connection runs the statement.
+        for_update (bool): Lock the balance row until the transaction ends.
+
+        Returns:
+        Row: The asset and balance, or None if either does not exist.
+        """
+        statement = _LOCK_BALANCE_RECORD if for_update else _FETCH_BALANCE_RECORD
+        return session.connection().execute(statement, {"asset_id": str(asset_id)}).first()
+
+    @staticmethod
+    def write_balance(asset_id, pending_balance: float, available_balance: float, version: int,
+                      session: Session) -> None:
+        """Set an asset's balance row with a cached Core UPDATE, if it is still at version.
+
+        Raises StaleDataError otherwise, as the flush of a stale AssetBalance
+        would, so retry_on_conflict treats both write engines alike.
+        """
+        written = session.connection().execute(_WRITE_BALANCE, {
+            "balance_asset_id": asset_id,
+            "balance_version": version,
+            "new_pending_balance": pending_balance,
+            "new_available_balance": available_balance,
+        }).rowcount
+        if written != 1:
+            raise StaleDataError(f"asset_balances row of {asset_id} is no longer at version {version}")
+
+    @staticmethod
+    def update_balance(asset_id: str, pending_balance: float, available_balance: float,
+                       session: Session) -> AssetBalance:
+        """Set the materialized balance of an asset.
+
+        The change is only added to the session, so it is committed in the
+        same database transaction as the ledger entry it mirrors.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        pending_balance (float): The new pending balance.
+        available_balance (float): The new available balance.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        AssetBalance: The updated balance row.
+        """
+        balance = session.get(AssetBalance, asset_id)
+        if balance is None:
+            balance = AssetBalance(asset_id=asset_id)
+            session.add(balance)
+        balance.pending_balance = pending_balance
+        balance.available_balance = available_balance
+        return balance
+
+    @staticmethod
+    def _last_bucket_ledgers():
+        return (select(Ledger.asset_id, Ledger.bucket, Ledger.pending_balance, Ledger.available_balance)
+                .distinct(Ledger.asset_id, Ledger.bucket)
+                .order_by(Ledger.asset_id, Ledger.bucket, desc(Ledger.created_at))
+                .subquery())
+
+    @staticmethod
+    def _last_ledgers():
+        # An asset's balance is the sum of its buckets' last balances; one bucket unless it is hot
+        last = BalanceManager._last_bucket_ledgers()
+        return (select(last.c.asset_id,
+                       func.sum(last.c.pending_balance).label('pending_balance'),
+                       func.sum(last.c.available_balance).label('available_balance'))
+                .group_by(last.c.asset_id)
+                .subquery())
+
+    @staticmethod
+    def _bucket_totals(asset_id=None):
+        columns = [func.sum(AssetBalanceBucket.pending_balance).label('pending_balance'),
+                   func.sum(AssetBalanceBucket.available_balance).label('available_balance')]
+        if asset_id is not None:
+            # No GROUP BY, so the subquery yields one row, NULLs when the asset has no buckets
+            return select(*columns).where(AssetBalanceBucket.asset_id == asset_id).subquery()
+        return select(AssetBalanceBucket.asset_id, *columns).group_by(AssetBalanceBucket.asset_id).subquery()
+
+    @staticmethod
+    def rebuild_balances(session: Session, asset_ids: Sequence = None) -> int:
+        """Backfill every asset balance from its last ledger entry.
+
+        Assets without any ledger entry get a zero balance row. Hot assets get
+        the sum of their buckets, and each bucket is set from the bucket's
+        last ledger entry.
+
+        Parameters:
+        session (Session): An SQLAlchemy Session object.
+        asset_ids (Sequence, optional): Only rebuild these assets, e.g. after an import.
+
+        Returns:
+        int: The number of balance rows written.
+        """
+        last_ledgers = BalanceManager._last_ledgers()
+        source = (select(Asset.id,
+                         func.coalesce(last_ledgers.c.pending_balance, 0),
+                         func.coalesce(last_ledgers.c.available_balance, 0))
+                  .outerjoin(last_ledgers, last_ledgers.c.asset_id == Asset.id))
+        if asset_ids is not None:
+            source = source.where(Asset.id.in_(list(asset_ids)))
+        statement = insert(AssetBalance).from_select(
+            ['asset_id', 'pending_balance', 'available_balance'], source
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[AssetBalance.asset_id],
+            set_={
+                'pending_balance': statement.excluded.pending_balance,
+                'available_balance': statement.excluded.available_balance,
+                'version': AssetBalance.version + 1,
+                'updated_at': func.now(),
+            },
+        )
+        result = session.execute(statement)
+        last_bucket_ledgers = BalanceManager._last_bucket_ledgers()
+        bucket_update = (update(AssetBalanceBucket)
+                         .where(AssetBalanceBucket.asset_id == last_bucket_ledgers.c.asset_id)
+                         .where(AssetBalanceBucket.bucket == last_bucket_ledgers.c.bucket)
+                         .values(pending_balance=last_bucket_ledgers.c.pending_balance,
+                                 available_balance=last_bucket_ledgers.c.available_balance,
+                                 updated_at=func.now()))
+        if asset_ids is not None:
+            bucket_update = bucket_update.where(AssetBalanceBucket.asset_id.in_(list(asset_ids)))
+        buckets = session.execute(bucket_update)
+        return result.rowcount + buckets.rowcount
+
+    @staticmethod
+    def find_discrepancies(session: Session) -> List[BalanceDiscrepancy]:
+        """Compare every asset balance with the last ledger entry of the asset.
+
+        For hot assets the sum of the buckets is compared with the sum of each
+        bucket's last ledger entry.
+
+        Parameters:
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        List[BalanceDiscrepancy]: The assets whose balance row is missing or
+        does not match their last ledger entry.
+        """
+        last_ledgers = BalanceManager._last_ledgers()
+        ledger_pending = func.coalesce(last_ledgers.c.pending_balance, 0)
+        ledger_available = func.coalesce(last_ledgers.c.available_balance, 0)
+        buckets = BalanceManager._bucket_totals()
+        pending = func.coalesce(buckets.c.pending_balance, AssetBalance.pending_balance)
+        available = func.coalesce(buckets.c.available_balance, AssetBalance.available_balance)
+        rows = session.execute(
+            select(Asset.id, pending, available, ledger_pending, ledger_available)
+            .outerjoin(AssetBalance, AssetBalance.asset_id == Asset.id)
+            .outerjoin(buckets, buckets.c.asset_id == Asset.id)
+            .outerjoin(last_ledgers, last_ledgers.c.asset_id == Asset.id)
+            .where(or_(AssetBalance.asset_id.is_(None),
+                       pending != ledger_pending,
+                       available != ledger_available))
+        )
+        return [
+            BalanceDiscrepancy(
+                asset_id=str(asset_id),
+                pending_balance=pending_balance,
+                available_balance=available_balance,
+                ledger_pending_balance=ledger_pending_balance,
+                ledger_available_balance=ledger_available_balance,
+            )
+            for asset_id, pending_balance, available_balance, ledger_pending_balance, ledger_available_balance in rows
+        ]
+
+
+class AsyncBalanceManager:
+    """BalanceManager counterpart for an asyncio AsyncSession."""
+
+    @staticmethod
+    async def fetch_balance(asset_id: str, session: AsyncSession) -> AssetBalance:
+        # AsyncPgWallet sessions keep objects across commits, so refresh one already in the identity map
+        result = await session.execute(select(AssetBalance)
+                                       .filter(AssetBalance.asset_id == asset_id)
+                                       .execution_options(populate_existing=True))
+        return result.scalars().first()
+
+    @staticmethod
+    async def fetch_total_balance(asset_id: str, session: AsyncSession) -> Optional[LedgerBalance]:
+        row = (await session.execute(BalanceManager._total_balance(asset_id))).first()
+        return LedgerBalance(pending_balance=row[0], available_balance=row[1]) if row is not None else None
+
+    @staticmethod
+    async def fetch_balances(asset_ids: Sequence, session: AsyncSession) -> Dict[Any, LedgerBalance]:
+        if not asset_ids:
+            return {}
+        return BalanceManager._balances_by_asset(
+            await session.execute(BalanceManager._asset_balances(Asset.id.in_(list(asset_ids))))
+        )
+
+    @staticmethod
+    async def fetch_user_balances(user_id: str, session: AsyncSession) -> Dict[Any, LedgerBalance]:
+        return BalanceManager._balances_by_asset(
+            await session.execute(BalanceManager._asset_balances(Asset.user == user_id).order_by(Asset.symbol))
+        )
+
+    @staticmethod
+    async def lock_balance(asset_id: str, session: AsyncSession) -> AssetBalance:
+        statement = (select(AssetBalance)
+                     .filter(AssetBalance.asset_id == asset_id)
+                     .with_for_update()
+                     .execution_options(populate_existing=True))
+        fetched_balance = (await session.execute(statement)).scalars().first()
+        if fetched_balance is None:
+            await session.execute(
+                insert(AssetBalance)
+                .values(asset_id=asset_id, pending_balance=0, available_balance=0)
+                .on_conflict_do_nothing(index_elements=[AssetBalance.asset_id])
+            )
+            fetched_balance = (await session.execute(statement)).scalars().first()
+        return fetched_balance
+
+    @staticmethod
+    async def update_balance(asset_id: str, pending_balance: float, available_balance: float,
+                             session: AsyncSession) -> AssetBalance:
+        balance = await session.get(AssetBalance, asset_id)
+        if balance is None:
+            balance = AssetBalance(asset_id=asset_id)
+            session.add(balance)
+        balance.pending_balance = pending_balance
+        balance.available_balance = available_balance
+        return balance
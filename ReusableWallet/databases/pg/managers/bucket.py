@@ -0,0 +1,114 @@
+import random
+from typing import List, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.dto.ledger import LedgerBalance
+from ReusableWallet.databases.pg.schema import Asset, AssetBalanceBucket
+
+
+class BucketManager:
+    @staticmethod
+    def create_buckets(asset_id, buckets: int, balance: LedgerBalance, session: Session) -> int:
+        """Create an asset's missing balance buckets, numbered 0 to buckets - 1.
+
+        A new bucket 0 takes the asset's whole current balance, so the
+        existing ledger chain carries on as bucket 0's chain. Other new
+        buckets start empty.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        buckets (int): The number of buckets the asset should have.
+        balance (LedgerBalance): The asset's balance before it had buckets.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        int: The number of buckets created.
+        """
+        rows = [
+            {'asset_id': asset_id, 'bucket': bucket,
+             'pending_balance': balance.pending_balance if bucket == 0 else 0,
+             'available_balance': balance.available_balance if bucket == 0 else 0}
+            for bucket in range(buckets)
+        ]
+        statement = insert(AssetBalanceBucket).values(rows).on_conflict_do_nothing()
+        return session.execute(statement).rowcount
+
+    @staticmethod
+    def lock_free_bucket(asset_id, buckets: int, session: Session) -> AssetBalanceBucket:
+        """Lock one bucket of an asset, preferring buckets no other transaction holds.
+
+        Buckets locked by concurrent writers are skipped, so up to `buckets`
+        writers of the asset proceed without waiting. Only when every bucket
+        is held does this wait, on a random one.
+        """
+        query = session.query(AssetBalanceBucket).filter(AssetBalanceBucket.asset_id == asset_id).populate_existing()
+        bucket = query.order_by(func.random()).limit(1).with_for_update(skip_locked=True).first()
+        if bucket is None:
+            bucket = query.filter(AssetBalanceBucket.bucket == random.randrange(buckets)).with_for_update().first()
+        return bucket
+
+    @staticmethod
+    def lock_buckets(asset_id, session: Session) -> List[AssetBalanceBucket]:
+        """Lock every bucket of an asset, in bucket order so that multi-bucket writers cannot deadlock."""
+        return (session.query(AssetBalanceBucket)
+                .filter(AssetBalanceBucket.asset_id == asset_id)
+                .order_by(AssetBalanceBucket.bucket)
+                .with_for_update()
+                .populate_existing()
+                .all())
+
+    @staticmethod
+    def allocate(buckets: List[AssetBalanceBucket], pending_delta: float,
+                 available_delta: float) -> List[Tuple[AssetBalanceBucket, float, float]]:
+        """Split a balance change over locked buckets.
+
+        An increase goes to the first bucket. A decrease is taken from the
+        fullest buckets first, and whatever they cannot cover is left on the
+        first bucket.
+
+        Returns:
+        List[Tuple[AssetBalanceBucket, float, float]]: Each bucket that changes,
+        with its pending and available delta, in bucket order.
+        """
+        shares = {bucket.bucket: [bucket, 0.0, 0.0] for bucket in buckets}
+        for index, delta in ((1, pending_delta), (2, available_delta)):
+            if delta >= 0:
+                shares[buckets[0].bucket][index] += delta
+                continue
+            remaining = -delta
+            attribute = 'pending_balance' if index == 1 else 'available_balance'
+            for bucket in sorted(buckets, key=lambda bucket: -getattr(bucket, attribute)):
+                taken = min(remaining, max(getattr(bucket, attribute), 0.0))
+                shares[bucket.bucket][index] -= taken
+                remaining -= taken
+                if remaining <= 0:
+                    break
+            if remaining > 0:
+                shares[buckets[0].bucket][index] -= remaining
+        return [(bucket, pending, available) for bucket, pending, available in
+                (shares[bucket.bucket] for bucket in buckets) if pending or available]
+
+    @staticmethod
+    def fetch_buckets(asset_id, session: Session) -> List[AssetBalanceBucket]:
+        return (session.query(AssetBalanceBucket)
+                .filter(AssetBalanceBucket.asset_id == asset_id)
+                .order_by(AssetBalanceBucket.bucket)
+                .all())
+
+    @staticmethod
+    def fetch_bucketed_asset_ids(session: Session, asset_ids: Sequence = None) -> List:
+        """Return the ids of assets with balance buckets, of all assets or only of asset_ids.
+
+        This always reads assets.balance_buckets from the database, never from
+        an AssetCache, so once a writer holds an asset's balance lock it tells
+        whether enable_balance_buckets has committed in the meantime.
+        """
+        statement = select(Asset.id).where(Asset.balance_buckets > 1).order_by(Asset.id)
+        if asset_ids is not None:
+            if not asset_ids:
+                return []
+            statement = statement.where(Asset.id.in_(list(asset_ids)))
+        return list(session.execute(statement).scalars())
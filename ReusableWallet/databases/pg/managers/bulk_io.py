@@ -0,0 +1,181 @@
+from typing import IO, List
+
+from sqlalchemy import Table, text
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.dto.bulk_io import CopyFilter
+from ReusableWallet.databases.pg.enums import CopyFormat
+
+# The first staged ledger of each chain; no existing ledger of the chain may come after it
+_FIRST_STAGED = """
+    SELECT DISTINCT ON (asset_id, bucket) asset_id, bucket, created_at, id
+    FROM {staging}
+    ORDER BY asset_id, bucket, created_at, id
+"""
+
+_INTERLEAVED = """
+WITH first_staged AS ({first_staged})
+SELECT f.asset_id FROM first_staged f
+WHERE EXISTS (SELECT 1 FROM ledgers l
+              WHERE l.asset_id = f.asset_id AND l.bucket = f.bucket
+                AND (l.created_at, l.id) > (f.created_at, f.id))
+LIMIT 1
+"""
+
+# Staged ledgers replayed onto the last existing ledger of their chain; :tolerance picks the
+# rows whose recorded running balances disagree with the replay
+_REPLAY = """
+WITH chain_start AS (
+    SELECT DISTINCT ON (l.asset_id, l.bucket) l.asset_id, l.bucket, l.pending_balance, l.available_balance
+    FROM ledgers l
+    WHERE (l.asset_id, l.bucket) IN (SELECT DISTINCT asset_id, bucket FROM {staging})
+    ORDER BY l.asset_id, l.bucket, l.created_at DESC, l.id DESC
+),
+replayed AS (
+    SELECT s.id,
+           COALESCE(c.pending_balance, 0) + SUM(s.pending_delta) OVER w AS pending_balance,
+           COALESCE(c.available_balance, 0) + SUM(s.available_delta) OVER w AS available_balance
+    FROM {staging} s LEFT JOIN chain_start c ON c.asset_id = s.asset_id AND c.bucket = s.bucket
+    WINDOW w AS (PARTITION BY s.asset_id, s.bucket ORDER BY s.created_at, s.id)
+)
+{action}
+"""
+
+_CORRECT = """
+UPDATE {staging} s
+SET pending_balance = r.pending_balance, available_balance = r.available_balance
+FROM replayed r
+WHERE s.id = r.id AND (ABS(s.pending_balance - r.pending_balance) > :tolerance
+                       OR ABS(s.available_balance - r.available_balance) > :tolerance)
+"""
+
+_COUNT_WRONG = """
+SELECT COUNT(*)
+FROM {staging} s JOIN replayed r ON r.id = s.id
+WHERE ABS(s.pending_balance - r.pending_balance) > :tolerance
+   OR ABS(s.available_balance - r.available_balance) > :tolerance
+"""
+
+
+def _copy_options(format: CopyFormat) -> str:
+    return "FORMAT csv, HEADER true" if format is CopyFormat.CSV else "FORMAT binary"
+
+
+class BulkIOManager:
+    @staticmethod
+    def copy_out(table: Table, copy_filter: CopyFilter, format: CopyFormat, output: IO[bytes],
+                 session: Session) -> int:
+        """Stream a table's rows matching copy_filter into output with COPY ... TO STDOUT.
+
+        Rows are written in (asset_id, created_at, id) order, the order of
+        each asset's ledger chain, as Postgres produces them, so memory use
+        does not grow with the export.
+
+        Parameters:
+        table (Table): The transactions or ledgers table.
+        copy_filter (CopyFilter): Assets, user and created_at range to export.
+        format (CopyFormat): CSV with a header row, or Postgres binary.
+        output (IO[bytes]): A binary file-like object to write to.
+        session (Session): An SQLAlchemy Session object on a psycopg2 engine.
+
+        Returns:
+        int: The number of rows exported.
+        """
+        cursor = session.connection().connection.cursor()
+        columns = BulkIOManager._columns(table, session)
+        conditions, parameters = [], []
+        if copy_filter.asset_ids is not None:
+            conditions.append("asset_id = ANY(%s::uuid[])")
+            parameters.append([str(asset_id) for asset_id in copy_filter.asset_ids])
+        if copy_filter.user_id is not None:
+            conditions.append('asset_id IN (SELECT id FROM assets WHERE "user" = %s)')
+            parameters.append(copy_filter.user_id)
+        if copy_filter.start is not None:
+            conditions.append("created_at >= %s")
+            parameters.append(copy_filter.start)
+        if copy_filter.end is not None:
+            conditions.append("created_at < %s")
+            parameters.append(copy_filter.end)
+        query = f"SELECT {columns} FROM {table.name}"
+        if conditions:
+            # COPY takes no bind parameters, so the driver inlines them safely
+            query += " WHERE " + cursor.mogrify(" AND ".join(conditions), parameters).decode()
+        query += " ORDER BY asset_id, created_at, id"
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH ({_copy_options(format)})", output)
+        return cursor.rowcount
+
+    @staticmethod
+    def copy_in(table: Table, format: CopyFormat, source: IO[bytes], session: Session) -> str:
+        """Stream a file written by copy_out into a temporary staging copy of table and return its name.
+
+        The staging table is dropped when the session's transaction ends.
+        """
+        staging = f"staging_{table.name}"
+        session.execute(text(
+            f"CREATE TEMP TABLE {staging} (LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ))
+        cursor = session.connection().connection.cursor()
+        cursor.copy_expert(
+            f"COPY {staging} ({BulkIOManager._columns(table, session)}) FROM STDIN WITH ({_copy_options(format)})",
+            source,
+        )
+        return staging
+
+    @staticmethod
+    def delete_existing(table: Table, staging: str, session: Session) -> int:
+        """Drop staged rows whose id is already in table, so that repeating an import loads nothing twice."""
+        return session.execute(text(
+            f"DELETE FROM {staging} s USING {table.name} t WHERE t.id = s.id"
+        )).rowcount
+
+    @staticmethod
+    def fetch_unknown_references(staging: str, column: str, referenced: str, session: Session) -> List:
+        """Return up to ten staged values of column that are not an id of the referenced table."""
+        return list(session.execute(text(
+            f"SELECT DISTINCT s.{column} FROM {staging} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {referenced} r WHERE r.id = s.{column}) LIMIT 10"
+        )).scalars())
+
+    @staticmethod
+    def fetch_interleaved_asset(staging: str, session: Session):
+        """Return an asset whose staged ledgers start before its last existing ledger, or None."""
+        return session.execute(text(
+            _INTERLEAVED.format(first_staged=_FIRST_STAGED.format(staging=staging))
+        )).scalar()
+
+    @staticmethod
+    def replay_balances(staging: str, tolerance: float, correct: bool, session: Session) -> int:
+        """Replay staged ledgers' deltas onto the end of each existing chain.
+
+        Parameters:
+        staging (str): The staging table of copy_in.
+        tolerance (float): The largest difference still treated as equal.
+        correct (bool): Rewrite the running balances that disagree with the
+        replay, rather than only counting them.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        int: The number of staged ledgers whose running balances disagree.
+        """
+        if correct:
+            statement = _REPLAY.format(staging=staging, action=_CORRECT.format(staging=staging))
+            return session.execute(text(statement), {"tolerance": tolerance}).rowcount
+        statement = _REPLAY.format(staging=staging, action=_COUNT_WRONG.format(staging=staging))
+        return session.execute(text(statement), {"tolerance": tolerance}).scalar()
+
+    @staticmethod
+    def load(table: Table, staging: str, session: Session) -> int:
+        columns = BulkIOManager._columns(table, session)
+        return session.execute(text(
+            f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {staging} ORDER BY asset_id, created_at, id"
+        )).rowcount
+
+    @staticmethod
+    def fetch_staged_asset_ids(staging: str, session: Session) -> List:
+        return list(session.execute(text(f"SELECT DISTINCT asset_id FROM {staging}")).scalars())
+
+    @staticmethod
+    def _columns(table: Table, session: Session) -> str:
+        # Named explicitly so exports and imports agree whatever the physical column order
+        quote = session.get_bind().dialect.identifier_preparer.quote
+        return ", ".join(quote(column.name) for column in table.columns)
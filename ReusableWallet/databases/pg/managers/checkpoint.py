@@ -0,0 +1,143 @@
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.dto.ledger import LedgerBalance
+from ReusableWallet.databases.pg.schema import BalanceCheckpoint, Ledger
+
+# Ledgers after each asset's last checkpoint, replayed onto it: the last checkpoint plus the
+# running sum of deltas, the same arithmetic fetch_balance_at uses. The laterals run per asset, so
+# the checkpoint is a constant there and (created_at, id) > (...) bounds the index scan on
+# ix_ledgers_asset_id_created_at_id; assets without a checkpoint start from -infinity.
+_REPLAY = """
+WITH replayed AS (
+    SELECT a.asset_id, l.id AS ledger_id, l.created_at,
+           COALESCE(c.pending_balance, 0) + SUM(l.pending_delta) OVER w AS pending_balance,
+           COALESCE(c.available_balance, 0) + SUM(l.available_delta) OVER w AS available_balance,
+           ROW_NUMBER() OVER w AS position,
+           COUNT(*) OVER (PARTITION BY a.asset_id) AS replayed_rows
+    FROM ({assets}) a
+    LEFT JOIN LATERAL (
+        SELECT created_at, ledger_id, pending_balance, available_balance
+        FROM balance_checkpoints
+        WHERE asset_id = a.asset_id
+        ORDER BY created_at DESC, ledger_id DESC
+        LIMIT 1
+    ) c ON true
+    JOIN LATERAL (
+        SELECT id, created_at, pending_delta, available_delta
+        FROM ledgers
+        WHERE asset_id = a.asset_id
+          AND (created_at, id) > (COALESCE(c.created_at, '-infinity'),
+                                  COALESCE(c.ledger_id, '00000000-0000-0000-0000-000000000000'))
+          AND created_at < {bound}
+    ) l ON true
+    WINDOW w AS (PARTITION BY a.asset_id ORDER BY l.created_at, l.id)
+)
+INSERT INTO balance_checkpoints (asset_id, created_at, ledger_id, pending_balance, available_balance,
+                                 ledgers, taken_at)
+SELECT asset_id, created_at, ledger_id, pending_balance, available_balance, {ledgers}, now()
+FROM replayed
+WHERE {selection}
+ON CONFLICT DO NOTHING
+"""
+
+# Every spacing-th ledger of the given assets, up to margin_seconds ago
+_WRITE_CHECKPOINTS = text(_REPLAY.format(
+    assets="SELECT unnest(CAST(:asset_ids AS uuid[])) AS asset_id",
+    bound="now() - CAST(:margin_seconds AS double precision) * INTERVAL '1 second'",
+    ledgers=":spacing",
+    selection="position % :spacing = 0",
+))
+
+# The last ledger of every asset before a cut-off
+_WRITE_BOUNDARY_CHECKPOINTS = text(_REPLAY.format(
+    assets="SELECT id AS asset_id FROM assets",
+    bound="CAST(:before AS timestamp)",
+    ledgers="position",
+    selection="position = replayed_rows",
+))
+
+
+class CheckpointManager:
+    @staticmethod
+    def write_checkpoints(asset_ids: Sequence, spacing: int, margin_seconds: float, session: Session) -> int:
+        """Checkpoint every spacing-th ledger written since each asset's last checkpoint.
+
+        Only ledgers stamped more than margin_seconds ago, by the database
+        clock, are considered. A writer still holding a lock can commit a
+        ledger stamped slightly in the past, so the margin should exceed the
+        longest write transaction.
+
+        Parameters:
+        asset_ids (Sequence): The assets to checkpoint.
+        spacing (int): Ledgers between two checkpoints of an asset.
+        margin_seconds (float): How far behind the present checkpoints stay.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        int: The number of checkpoints written.
+        """
+        if not asset_ids:
+            return 0
+        result = session.execute(_WRITE_CHECKPOINTS, {
+            "asset_ids": [str(asset_id) for asset_id in asset_ids], "spacing": spacing, "margin_seconds": margin_seconds,
+        })
+        return result.rowcount
+
+    @staticmethod
+    def write_boundary_checkpoints(before: datetime, session: Session) -> int:
+        """Checkpoint every asset at its last ledger stamped before `before`.
+
+        Run before ledgers older than `before` are archived, so replays from
+        the checkpoint never need them.
+
+        Parameters:
+        before (datetime): The archival cut-off, exclusive.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        int: The number of checkpoints written.
+        """
+        return session.execute(_WRITE_BOUNDARY_CHECKPOINTS, {"before": before}).rowcount
+
+    @staticmethod
+    def fetch_balance_at(asset_id: str, at: datetime, session: Session) -> LedgerBalance:
+        """Compute an asset's balances as of a point in time, ledgers stamped at `at` included.
+
+        Starts from the latest checkpoint at or before `at` and adds the
+        deltas of the ledgers after it, so at most one checkpoint spacing of
+        ledgers is read whatever the length of the history.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        at (datetime): The point in time.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        LedgerBalance: The balances; zero before the asset's first ledger.
+        """
+        checkpoint = session.execute(
+            select(BalanceCheckpoint)
+            .where(BalanceCheckpoint.asset_id == asset_id)
+            .where(BalanceCheckpoint.created_at <= at)
+            .order_by(BalanceCheckpoint.created_at.desc(), BalanceCheckpoint.ledger_id.desc())
+            .limit(1)
+        ).scalars().first()
+        deltas = (select(func.coalesce(func.sum(Ledger.pending_delta), 0),
+                         func.coalesce(func.sum(Ledger.available_delta), 0))
+                  .where(Ledger.asset_id == asset_id)
+                  .where(Ledger.created_at <= at))
+        if checkpoint is not None:
+            # A plain row comparison, so both ends bound the scan of ix_ledgers_asset_id_created_at_id
+            deltas = deltas.where(tuple_(Ledger.created_at, Ledger.id) > tuple_(checkpoint.created_at,
+                                                                                checkpoint.ledger_id))
+        pending_delta, available_delta = session.execute(deltas).one()
+        if checkpoint is None:
+            return LedgerBalance(pending_balance=pending_delta, available_balance=available_delta)
+        return LedgerBalance(
+            pending_balance=checkpoint.pending_balance + pending_delta,
+            available_balance=checkpoint.available_balance + available_delta,
+        )
@@ -1,10 +1,28 @@
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+import uuid
+from datetime import timedelta
+from typing import Any, AsyncIterator, Iterator, List, Mapping
 
-from ReusableWallet.databases.pg.dto.ledger import CreateLedgerDTO
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
+from ReusableWallet.databases.pg.dto.ledger import CreateLedgerDTO, LedgerRecord
+from ReusableWallet.databases.pg.pagination import aiter_pages, iter_pages, keyset_select, to_page
 from ReusableWallet.databases.pg.schema import Ledger
 
 
+def _history_select(asset_id: str, history_filter: HistoryFilter, after: HistoryCursor, page_size: int):
+    statement = select(Ledger).filter(Ledger.asset_id == asset_id)
+    if history_filter.types:
+        statement = statement.filter(Ledger.entry_type.in_(history_filter.types))
+    return keyset_select(statement, Ledger, history_filter, after, page_size)
+
+
+# Built once at import; every call only binds parameters
+_INSERT_LEDGER = insert(Ledger.__table__).returning(*(Ledger.__table__.c[name] for name in LedgerRecord._fields))
+
+
 class LedgerManager:
     @staticmethod
     def create_ledger(payload: CreateLedgerDTO, session: Session) -> Ledger:
@@ -12,6 +30,55 @@ class LedgerManager:
         session.add(new_ledger)
         return new_ledger
 
+    @staticmethod
+    def create_ledgers(payloads: List[CreateLedgerDTO], session: Session) -> List[Ledger]:
+        """Insert several ledgers with one multi-row INSERT ... RETURNING.
+
+        Ledgers are stamped in list order, so entries chained for the same
+        asset keep their order even though they share a transaction.
+
+        Returns:
+        List[Ledger]: Detached Ledger objects in payload order.
+        """
+        if not payloads:
+            return []
+        rows = []
+        for offset, payload in enumerate(payloads):
+            row = payload.to_dict()
+            row["id"] = uuid.uuid4()
+            row["created_at"] = func.clock_timestamp() + timedelta(microseconds=offset)
+            rows.append(row)
+        statement = insert(Ledger.__table__).values(rows).returning(*Ledger.__table__.columns)
+        written = {row["id"]: row for row in session.execute(statement).mappings()}
+        return [LedgerManager.load_ledger(written[row["id"]]) for row in rows]
+
+    @staticmethod
+    def insert_ledger(row: Mapping[str, Any], session: Session) -> LedgerRecord:
+        """Insert one ledger with a cached Core INSERT ... RETURNING, for the lean write engine.
+
+        Parameters:
+        row (Mapping[str, Any]): Column values keyed by column name; created_at is stamped by the database.
+        session (Session): An SQLAlchemy Session object; its connection runs the statement.
+
+        Returns:
+        LedgerRecord: The row as written, with no ORM object behind it.
+        """
+        return LedgerRecord(*session.connection().execute(_INSERT_LEDGER, row).one())
+
+    @staticmethod
+    def load_ledger(values: Mapping[str, Any], session: Session = None) -> Ledger:
+        """Build a Ledger from a row that is already in the database.
+
+        The object is marked as loaded rather than pending, so no INSERT or
+        refresh query is issued for it. If a session is given the ledger is
+        attached to it, otherwise it stays detached.
+        """
+        ledger = Ledger(**{column.key: values[column.key] for column in Ledger.__table__.columns})
+        make_transient_to_detached(ledger)
+        if session is not None:
+            session.add(ledger)
+        return ledger
+
     @staticmethod
     def fetch_last_ledger(asset_id: str, session: Session) -> Ledger:
         fetched_ledger = (session.query(Ledger)
@@ -19,3 +86,63 @@ class LedgerManager:
                           .order_by(desc(Ledger.created_at))
                           .first())
         return fetched_ledger
+
+    @staticmethod
+    def fetch_ledgers_page(asset_id: str, history_filter: HistoryFilter, after: HistoryCursor,
+                           page_size: int, session: Session) -> HistoryPage:
+        """Fetch one page of an asset's ledger entries, ordered on (created_at, id).
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        history_filter (HistoryFilter): Entry types, clerk types, date range and direction.
+        after (HistoryCursor): The next_cursor of the previous page, or None for the first page.
+        page_size (int): The maximum number of ledgers in the page.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        HistoryPage: The ledgers and the cursor of the following page.
+        """
+        rows = session.execute(_history_select(asset_id, history_filter, after, page_size)).scalars().all()
+        return to_page(rows, page_size)
+
+    @staticmethod
+    def iter_ledgers(asset_id: str, history_filter: HistoryFilter, page_size: int,
+                     session: Session) -> Iterator[Ledger]:
+        """Yield an asset's ledger entries page by page, holding one page at a time.
+
+        Every page runs in the session's current transaction; callers
+        scrolling a long history should end it between pages themselves.
+        """
+        return iter_pages(lambda after: LedgerManager.fetch_ledgers_page(
+            asset_id, history_filter, after, page_size, session
+        ))
+
+
+class AsyncLedgerManager:
+    """LedgerManager counterpart for an asyncio AsyncSession."""
+
+    @staticmethod
+    async def create_ledger(payload: CreateLedgerDTO, session: AsyncSession) -> Ledger:
+        new_ledger = Ledger(**payload.to_dict())
+        session.add(new_ledger)
+        return new_ledger
+
+    @staticmethod
+    async def fetch_last_ledger(asset_id: str, session: AsyncSession) -> Ledger:
+        result = await session.execute(
+            select(Ledger).filter(Ledger.asset_id == asset_id).order_by(desc(Ledger.created_at)).limit(1)
+        )
+        return result.scalars().first()
+
+    @staticmethod
+    async def fetch_ledgers_page(asset_id: str, history_filter: HistoryFilter, after: HistoryCursor,
+                                 page_size: int, session: AsyncSession) -> HistoryPage:
+        result = await session.execute(_history_select(asset_id, history_filter, after, page_size))
+        return to_page(result.scalars().all(), page_size)
+
+    @staticmethod
+    def iter_ledgers(asset_id: str, history_filter: HistoryFilter, page_size: int,
+                     session: AsyncSession) -> AsyncIterator[Ledger]:
+        return aiter_pages(lambda after: AsyncLedgerManager.fetch_ledgers_page(
+            asset_id, history_filter, after, page_size, session
+        ))
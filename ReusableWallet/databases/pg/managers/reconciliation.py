@@ -0,0 +1,224 @@
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, and_, case, func, select, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.dto.history import HistoryCursor
+from ReusableWallet.databases.pg.dto.reconciliation import LedgerChainBreak, TransactionMismatch
+from ReusableWallet.databases.pg.enums import TransactionStatus, TransactionType
+from ReusableWallet.databases.pg.schema import Asset, Ledger, Transaction
+
+# Ledger rows of one asset's balance bucket after a cursor, in chain order; unbucketed assets only use bucket 0
+_CHUNK = """
+    SELECT id, created_at, pending_balance, pending_delta, available_balance, available_delta
+    FROM ledgers
+    WHERE asset_id = CAST(:asset_id AS uuid) AND bucket = :bucket {after}
+    ORDER BY created_at, id
+    LIMIT :chunk_size
+"""
+_AFTER = "AND (created_at, id) > (CAST(:after_created_at AS timestamp), CAST(:after_id AS uuid))"
+
+# The chunk's broken rows plus its last row, which carries the balances into the next chunk
+_CHAIN_CHECK = """
+WITH chunk AS ({chunk}),
+checked AS (
+    SELECT *,
+           COALESCE(LAG(pending_balance) OVER w, :carry_pending) AS previous_pending,
+           COALESCE(LAG(available_balance) OVER w, :carry_available) AS previous_available,
+           ROW_NUMBER() OVER w AS position,
+           COUNT(*) OVER () AS chunk_rows
+    FROM chunk
+    WINDOW w AS (ORDER BY created_at, id)
+),
+flagged AS (
+    SELECT *,
+           ABS(pending_balance - previous_pending - pending_delta) > :tolerance AS pending_broken,
+           ABS(available_balance - previous_available - available_delta) > :tolerance AS available_broken
+    FROM checked
+)
+SELECT * FROM flagged
+WHERE pending_broken OR available_broken OR position = chunk_rows
+ORDER BY created_at, id
+"""
+
+# The balances an asset's remaining chain starts from: the latest checkpoint before its first
+# ledger, left behind when older ledgers were archived
+_CHAIN_START = text("""
+WITH first_ledger AS (
+    SELECT created_at, id FROM ledgers
+    WHERE asset_id = CAST(:asset_id AS uuid)
+    ORDER BY created_at, id
+    LIMIT 1
+)
+SELECT c.pending_balance, c.available_balance
+FROM balance_checkpoints c, first_ledger f
+WHERE c.asset_id = CAST(:asset_id AS uuid) AND (c.created_at, c.ledger_id) < (f.created_at, f.id)
+ORDER BY c.created_at DESC, c.ledger_id DESC
+LIMIT 1
+""").columns(pending_balance=Float, available_balance=Float)
+
+_CHAIN_COLUMNS = dict(
+    id=UUID(as_uuid=True), created_at=DateTime, pending_balance=Float, pending_delta=Float,
+    available_balance=Float, available_delta=Float, previous_pending=Float, previous_available=Float,
+    position=Integer, chunk_rows=Integer, pending_broken=Boolean, available_broken=Boolean,
+)
+
+
+def _chunk_statement(after: bool) -> str:
+    return _CHUNK.format(after=_AFTER if after else "")
+
+
+_CHAIN_FIRST = text(_CHAIN_CHECK.format(chunk=_chunk_statement(False))).columns(**_CHAIN_COLUMNS)
+_CHAIN_NEXT = text(_CHAIN_CHECK.format(chunk=_chunk_statement(True))).columns(**_CHAIN_COLUMNS)
+_CHUNK_FIRST = text(_chunk_statement(False)).columns(**{
+    key: _CHAIN_COLUMNS[key]
+    for key in ('id', 'created_at', 'pending_balance', 'pending_delta', 'available_balance', 'available_delta')
+})
+_CHUNK_NEXT = text(_chunk_statement(True)).columns(*_CHUNK_FIRST.selected_columns)
+
+
+def _expected_signs(type: TransactionType, status: TransactionStatus) -> Optional[Tuple[int, int]]:
+    """Net (pending, available) ledger movement of a transaction, in units of its amount.
+
+    Mirrors the entries the wallet writes: funding credits pending and, once
+    successful, available; a charge debits available and, once successful,
+    pending; failing either undoes its first entry. Purchases are not written
+    by the wallet and are not checked.
+    """
+    settled = status in (TransactionStatus.SUCCESSFUL, TransactionStatus.FAILED)
+    if type is TransactionType.WALLET_FUND:
+        if status is TransactionStatus.SUCCESSFUL:
+            return 1, 1
+        return (0, 0) if settled else (1, 0)
+    if type is TransactionType.WITHDRAWAL:
+        if status is TransactionStatus.SUCCESSFUL:
+            return -1, -1
+        return (0, 0) if settled else (0, -1)
+    if type is TransactionType.WITHDRAWAL_REVERSAL:
+        return 0, 1
+    if type is TransactionType.BUCKET_TRANSFER:
+        return 0, 0
+    return None
+
+
+_EXPECTED_SIGNS = {
+    (type, status): signs
+    for type in TransactionType for status in TransactionStatus
+    for signs in [_expected_signs(type, status)] if signs is not None
+}
+
+
+class ReconciliationManager:
+    @staticmethod
+    def find_chain_breaks(asset_id, after: Optional[HistoryCursor], carry: Tuple[float, float],
+                          chunk_size: int, tolerance: float, session: Session, bucket: int = 0):
+        """Check one chunk of an asset's ledger chain with window functions.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        after (HistoryCursor): The last ledger of the previous chunk, or None for the first chunk.
+        carry (Tuple[float, float]): Pending and available balance of that ledger, or fetch_chain_start's for the first chunk.
+        chunk_size (int): The number of ledgers to check.
+        tolerance (float): The largest difference still treated as equal.
+        session (Session): An SQLAlchemy Session object.
+        bucket (int): The balance bucket whose chain to check.
+
+        Returns:
+        Tuple[List[LedgerChainBreak], int, HistoryCursor, Tuple[float, float]]: The breaks
+        found, the number of ledgers checked, and the cursor and balances to continue from.
+        """
+        parameters = dict(asset_id=str(asset_id), bucket=bucket, chunk_size=chunk_size, tolerance=tolerance,
+                          carry_pending=carry[0], carry_available=carry[1])
+        if after is not None:
+            parameters.update(after_created_at=after.created_at, after_id=str(after.id))
+        rows = session.execute(_CHAIN_NEXT if after is not None else _CHAIN_FIRST, parameters).all()
+        if not rows:
+            return [], 0, after, carry
+        breaks = []
+        for row in rows:
+            if row.pending_broken:
+                breaks.append(LedgerChainBreak(asset_id, row.id, row.created_at, 'pending',
+                                               row.previous_pending, row.pending_delta, row.pending_balance))
+            if row.available_broken:
+                breaks.append(LedgerChainBreak(asset_id, row.id, row.created_at, 'available',
+                                               row.previous_available, row.available_delta, row.available_balance))
+        last = rows[-1]
+        return breaks, last.chunk_rows, HistoryCursor.of(last), (last.pending_balance, last.available_balance)
+
+    @staticmethod
+    def fetch_chain_start(asset_id, session: Session) -> Tuple[float, float]:
+        """Pending and available balance before an asset's first ledger, (0, 0) unless it was archived."""
+        row = session.execute(_CHAIN_START, dict(asset_id=str(asset_id))).first()
+        return (row.pending_balance, row.available_balance) if row is not None else (0.0, 0.0)
+
+    @staticmethod
+    def fetch_ledger_chunk(asset_id, after: Optional[HistoryCursor], chunk_size: int, session: Session,
+                           bucket: int = 0) -> List:
+        """Fetch one chunk of an asset's (or one of its balance buckets') ledger chain as plain rows."""
+        parameters = dict(asset_id=str(asset_id), bucket=bucket, chunk_size=chunk_size)
+        if after is not None:
+            parameters.update(after_created_at=after.created_at, after_id=str(after.id))
+        return session.execute(_CHUNK_NEXT if after is not None else _CHUNK_FIRST, parameters).all()
+
+    @staticmethod
+    def find_transaction_mismatches(asset_id, tolerance: float, session: Session) -> List[TransactionMismatch]:
+        """Match an asset's transactions against the ledger entries written for them.
+
+        Aggregation happens in Postgres, and only mismatching transactions are returned.
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        tolerance (float): The largest difference still treated as equal.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        List[TransactionMismatch]: The transactions whose ledgers do not add up.
+        """
+        def expected(index):
+            return case(
+                *[(and_(Transaction.type == type, Transaction.status == status), signs[index] * Transaction.amount)
+                  for (type, status), signs in _EXPECTED_SIGNS.items()],
+                else_=None,
+            )
+
+        pending = func.coalesce(func.sum(Ledger.pending_delta), 0)
+        available = func.coalesce(func.sum(Ledger.available_delta), 0)
+        foreign = func.coalesce(func.bool_or(Ledger.asset_id != Transaction.asset_id), False)
+        totals = (select(Transaction.id, Transaction.type, Transaction.status, Transaction.amount,
+                         expected(0).label('expected_pending'), pending.label('pending'),
+                         expected(1).label('expected_available'), available.label('available'),
+                         func.count(Ledger.id).label('ledgers'), foreign.label('foreign_ledgers'))
+                  .outerjoin(Ledger, Ledger.transaction_id == Transaction.id)
+                  .where(Transaction.asset_id == asset_id)
+                  .group_by(Transaction.id)
+                  .subquery())
+        rows = session.execute(
+            select(totals).where(totals.c.expected_pending.isnot(None)).where(
+                (func.abs(totals.c.pending - totals.c.expected_pending) > tolerance)
+                | (func.abs(totals.c.available - totals.c.expected_available) > tolerance)
+                | totals.c.foreign_ledgers
+            )
+        )
+        return [
+            TransactionMismatch(
+                asset_id=asset_id, transaction_id=row.id, type=row.type, status=row.status, amount=row.amount,
+                expected_pending_delta=row.expected_pending, pending_delta=row.pending,
+                expected_available_delta=row.expected_available, available_delta=row.available,
+                ledgers=row.ledgers, foreign_ledgers=row.foreign_ledgers,
+            )
+            for row in rows
+        ]
+
+    @staticmethod
+    def count_transactions(asset_id, session: Session) -> int:
+        return session.execute(
+            select(func.count()).select_from(Transaction).where(Transaction.asset_id == asset_id)
+        ).scalar()
+
+    @staticmethod
+    def fetch_asset_ids(session: Session, asset_ids: Sequence = None) -> List:
+        statement = select(Asset.id).order_by(Asset.id)
+        if asset_ids is not None:
+            statement = statement.where(Asset.id.in_(asset_ids))
+        return list(session.execute(statement).scalars())
@@ -0,0 +1,66 @@
+from typing import List, Sequence
+
+from sqlalchemy import Table, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.schema import Asset, AssetBalance
+from ReusableWallet.databases.pg.schema.base import Base
+
+
+def _asset_column(table: Table):
+    return table.c.id if table.name == Asset.__tablename__ else table.c.asset_id
+
+
+# Every table holding per-asset rows, parents before children
+ASSET_TABLES = [table for table in Base.metadata.sorted_tables
+                if table.name == Asset.__tablename__ or 'asset_id' in table.c]
+
+
+class ShardManager:
+    @staticmethod
+    def fetch_existing_ids(model, ids: Sequence, session: Session) -> List:
+        """Return which of the given primary keys exist in model's table, e.g. to locate a row's shard."""
+        if not ids:
+            return []
+        return list(session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+
+    @staticmethod
+    def fetch_user_ids(after: str, limit: int, session: Session) -> List[str]:
+        """Page through the distinct owners of the shard's assets, in user id order."""
+        statement = select(Asset.user).distinct().order_by(Asset.user).limit(limit)
+        if after is not None:
+            statement = statement.where(Asset.user > after)
+        return list(session.execute(statement).scalars())
+
+    @staticmethod
+    def lock_user_assets(user_id: str, session: Session) -> List:
+        """Lock a user's asset and balance rows, so writers wait until the move commits, and return the asset ids."""
+        asset_ids = list(session.execute(
+            select(Asset.id).where(Asset.user == user_id).order_by(Asset.id).with_for_update()
+        ).scalars())
+        if asset_ids:
+            session.execute(
+                select(AssetBalance.asset_id).where(AssetBalance.asset_id.in_(asset_ids))
+                .order_by(AssetBalance.asset_id).with_for_update()
+            ).all()
+        return asset_ids
+
+    @staticmethod
+    def copy_rows(table: Table, asset_ids: Sequence, source: Session, target: Session, batch_size: int) -> int:
+        """Stream a table's rows for the given assets from source into target, batch_size rows per INSERT.
+
+        Rows already on the target are skipped, so an interrupted copy can be repeated.
+        """
+        result = source.execute(
+            select(table).where(_asset_column(table).in_(asset_ids)).execution_options(stream_results=True)
+        )
+        copied = 0
+        for rows in result.partitions(batch_size):
+            target.execute(insert(table).on_conflict_do_nothing(), [dict(row._mapping) for row in rows])
+            copied += len(rows)
+        return copied
+
+    @staticmethod
+    def delete_rows(table: Table, asset_ids: Sequence, session: Session) -> int:
+        return session.execute(delete(table).where(_asset_column(table).in_(asset_ids))).rowcount
@@ -0,0 +1,260 @@
+import json
+import uuid
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Boolean, text
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.enums import ClerkType, TransactionType, TransactionStatus
+from ReusableWallet.databases.pg.exceptions import EntityNotFound, InsufficientBalance
+from ReusableWallet.databases.pg.managers.ledger import LedgerManager
+from ReusableWallet.databases.pg.managers.transaction import TransactionManager
+from ReusableWallet.databases.pg.schema import Ledger
+
+# Locks the balance row of the asset named by :asset_id, unless the asset has balance buckets.
+# Key-sharing the asset row makes a writer that waited for the balance lock re-read balance_buckets,
+# so it drops out if enable_balance_buckets committed meanwhile.
+_BALANCE_BY_ASSET = """
+    balance AS (
+        SELECT a.id AS asset_id, a."user", a.symbol, b.pending_balance, b.available_balance
+        FROM assets a JOIN asset_balances b ON b.asset_id = a.id
+        WHERE a.id = :asset_id AND a.balance_buckets = 1
+        FOR UPDATE OF b FOR KEY SHARE OF a
+    )"""
+
+# Locks the balance row of the asset that transaction :source_id belongs to, unless it has balance buckets
+_BALANCE_BY_TRANSACTION = """
+    source AS (
+        SELECT id AS source_id, asset_id, amount AS source_amount, type AS source_type
+        FROM transactions WHERE id = :source_id
+    ),
+    balance AS (
+        SELECT a.id AS asset_id, a."user", a.symbol, b.pending_balance, b.available_balance,
+               s.source_id, s.source_amount
+        FROM source s JOIN assets a ON a.id = s.asset_id JOIN asset_balances b ON b.asset_id = a.id
+        WHERE s.source_type = :source_type AND a.balance_buckets = 1
+        FOR UPDATE OF b FOR KEY SHARE OF a
+    )"""
+
+_NEW_TRANSACTION = """
+    new_transaction AS (
+        INSERT INTO transactions (id, "user", asset_id, symbol, status, amount, fee, total_amount,
+                                  clerk_type, type, reason, description, metadata, created_at, updated_at)
+        SELECT :transaction_id, "user", asset_id, symbol, :status, :amount, :fee, :total_amount,
+               :clerk_type, :type, :reason, :description, CAST(:metadata AS jsonb), now(), now()
+        FROM balance
+        WHERE {guard}
+        RETURNING id
+    )"""
+
+_NEW_LEDGER = """
+    new_ledger AS (
+        INSERT INTO ledgers (id, asset_id, clerk_type, entry_type, transaction_id,
+                             pending_balance, pending_delta, available_balance, available_delta, created_at)
+        SELECT :ledger_id, b.asset_id, :clerk_type, :entry_type, {transaction_id},
+               b.pending_balance + {pending_delta}, {pending_delta},
+               b.available_balance + {available_delta}, {available_delta}, clock_timestamp()
+        FROM balance b {join}
+        RETURNING *
+    ),
+    updated_balance AS (
+        UPDATE asset_balances ab
+        SET pending_balance = l.pending_balance, available_balance = l.available_balance,
+            version = ab.version + 1, updated_at = now()
+        FROM new_ledger l WHERE ab.asset_id = l.asset_id
+    )"""
+
+_SETTLE_TRANSACTION = """
+    settled_transaction AS (
+        UPDATE transactions SET status = :settled_status, updated_at = now()
+        WHERE id IN (SELECT transaction_id FROM new_ledger)
+    )"""
+
+_RESULT = """
+SELECT {found} AS found, EXISTS (SELECT 1 FROM balance) AS locked,
+       NOT EXISTS (SELECT 1 FROM balance)
+           AND EXISTS (SELECT 1 FROM assets WHERE id = {asset_id} AND balance_buckets > 1) AS bucketed,
+       l.*
+FROM (VALUES (1)) AS probe (one) LEFT JOIN new_ledger l ON true
+"""
+
+
+def _statement(source: str, ctes, found: str, asset_id: str):
+    sql = "WITH" + ",".join([source] + ctes) + _RESULT.format(found=found, asset_id=asset_id)
+    return text(sql).columns(*Ledger.__table__.columns, found=Boolean, locked=Boolean, bucketed=Boolean)
+
+
+def _open_statement(guard: str, pending_delta: str, available_delta: str):
+    return _statement(
+        _BALANCE_BY_ASSET,
+        [
+            _NEW_TRANSACTION.format(guard=guard),
+            _NEW_LEDGER.format(transaction_id="t.id", pending_delta=pending_delta,
+                               available_delta=available_delta, join="JOIN new_transaction t ON true"),
+        ],
+        found="EXISTS (SELECT 1 FROM assets WHERE id = :asset_id)",
+        asset_id=":asset_id",
+    )
+
+
+def _settle_statement(pending_delta: str, available_delta: str):
+    return _statement(
+        _BALANCE_BY_TRANSACTION,
+        [
+            _NEW_LEDGER.format(transaction_id="b.source_id", pending_delta=pending_delta,
+                               available_delta=available_delta, join=""),
+            _SETTLE_TRANSACTION,
+        ],
+        found="EXISTS (SELECT 1 FROM source)",
+        asset_id="(SELECT asset_id FROM source)",
+    )
+
+
+def _reverse_statement():
+    return _statement(
+        _BALANCE_BY_TRANSACTION,
+        [
+            _NEW_TRANSACTION.format(guard="true"),
+            _NEW_LEDGER.format(transaction_id="t.id", pending_delta="0", available_delta=":amount",
+                               join="JOIN new_transaction t ON true"),
+        ],
+        found="EXISTS (SELECT 1 FROM source)",
+        asset_id="(SELECT asset_id FROM source)",
+    )
+
+
+# Built once at import; every call only binds parameters
+_FUND_ASSET = _open_statement(guard="true", pending_delta=":amount", available_delta="0")
+_CHARGE_ASSET = _open_statement(guard="available_balance >= :amount", pending_delta="0",
+                                available_delta="-CAST(:amount AS double precision)")
+_VALIDATE_FUND = _settle_statement(pending_delta="0", available_delta="b.source_amount")
+_VALIDATE_CHARGE = _settle_statement(pending_delta="-b.source_amount", available_delta="0")
+_REVERSE_CHARGE = _reverse_statement()
+
+
+class StatementManager:
+    """Fund and charge operations executed as one CTE statement each.
+
+    Every statement validates its asset or transaction, locks the asset's
+    balance row, writes the transaction and ledger rows with
+    INSERT ... RETURNING and updates asset_balances server-side, so an
+    operation costs one round trip plus the caller's commit.
+
+    Assets with balance buckets are left untouched and the operation
+    returns None, so the wallet can write them through its bucket path.
+    """
+
+    @staticmethod
+    def _new_transaction_params(amount: float, fee: float, clerk_type: ClerkType, type: TransactionType,
+                                reason: Optional[str], description: Optional[str],
+                                metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "transaction_id": str(uuid.uuid4()),
+            "status": TransactionStatus.PENDING.name,
+            "amount": amount,
+            "fee": fee,
+            "total_amount": fee + amount,
+            "clerk_type": clerk_type.name,
+            "type": type.name,
+            "entry_type": type.name,
+            "reason": reason,
+            "description": description,
+            "metadata": json.dumps(metadata) if metadata is not None else None,
+        }
+
+    @staticmethod
+    def _execute(statement, params: Dict[str, Any], session: Session):
+        params["ledger_id"] = str(uuid.uuid4())
+        return session.execute(statement, params).mappings().first()
+
+    @staticmethod
+    def _has_buckets(asset_id, session: Session) -> bool:
+        # A statement of its own, so it sees what committed after the failed statement's snapshot
+        return bool(session.execute(
+            text("SELECT balance_buckets > 1 FROM assets WHERE id = CAST(:asset_id AS uuid)"),
+            {"asset_id": str(asset_id)},
+        ).scalar())
+
+    @staticmethod
+    def _open(statement, asset_id: str, params: Dict[str, Any], session: Session) -> Optional[Ledger]:
+        params["asset_id"] = str(asset_id)
+        row = StatementManager._execute(statement, params, session)
+        if not row["found"]:
+            raise ValueError(f"Asset with id {asset_id} not found")
+        if row["bucketed"]:
+            return None
+        if not row["locked"]:
+            if StatementManager._has_buckets(asset_id, session):
+                # Buckets were enabled while this statement waited for the balance lock
+                return None
+            raise EntityNotFound('AssetBalance')
+        if row["id"] is None:
+            raise InsufficientBalance(asset_id)
+        return LedgerManager.load_ledger(row, session)
+
+    @staticmethod
+    def _settle(statement, transaction_id: str, params: Dict[str, Any], session: Session) -> Optional[Ledger]:
+        params["source_id"] = str(transaction_id)
+        row = StatementManager._execute(statement, params, session)
+        if not row["found"]:
+            raise EntityNotFound('Transaction')
+        if row["bucketed"]:
+            return None
+        if row["id"] is None:
+            # The transaction exists, so either its type did not match, its asset got balance buckets
+            # while this statement waited for the balance lock, or its asset has no balance row
+            transaction = TransactionManager.fetch_transaction_by_id(transaction_id, session)
+            if transaction.type.name != params["source_type"]:
+                raise Exception(f"Transaction is not a {params['source_type'].replace('_', ' ').lower()}")
+            if StatementManager._has_buckets(transaction.asset_id, session):
+                return None
+            raise EntityNotFound('AssetBalance')
+        return LedgerManager.load_ledger(row, session)
+
+    @staticmethod
+    def initiate_fund_asset(asset_id: str, amount: float, fee: float, reason: Optional[str],
+                            description: Optional[str], metadata: Optional[Dict[str, Any]],
+                            session: Session) -> Optional[Ledger]:
+        params = StatementManager._new_transaction_params(
+            amount, fee, ClerkType.CREDIT, TransactionType.WALLET_FUND, reason, description, metadata
+        )
+        return StatementManager._open(_FUND_ASSET, asset_id, params, session)
+
+    @staticmethod
+    def initiate_charge_asset(asset_id: str, amount: float, fee: float, reason: Optional[str],
+                              description: Optional[str], metadata: Optional[Dict[str, Any]],
+                              session: Session) -> Optional[Ledger]:
+        params = StatementManager._new_transaction_params(
+            amount, fee, ClerkType.DEBIT, TransactionType.WITHDRAWAL, reason, description, metadata
+        )
+        return StatementManager._open(_CHARGE_ASSET, asset_id, params, session)
+
+    @staticmethod
+    def validate_fund_asset(transaction_id: str, session: Session) -> Optional[Ledger]:
+        params = {
+            "source_type": TransactionType.WALLET_FUND.name,
+            "clerk_type": ClerkType.CREDIT.name,
+            "entry_type": TransactionType.WALLET_FUND.name,
+            "settled_status": TransactionStatus.SUCCESSFUL.name,
+        }
+        return StatementManager._settle(_VALIDATE_FUND, transaction_id, params, session)
+
+    @staticmethod
+    def validate_charge_asset(transaction_id: str, session: Session) -> Optional[Ledger]:
+        params = {
+            "source_type": TransactionType.WITHDRAWAL.name,
+            "clerk_type": ClerkType.DEBIT.name,
+            "entry_type": TransactionType.WITHDRAWAL.name,
+            "settled_status": TransactionStatus.SUCCESSFUL.name,
+        }
+        return StatementManager._settle(_VALIDATE_CHARGE, transaction_id, params, session)
+
+    @staticmethod
+    def reverse_charge_asset(transaction_id: str, amount: float, fee: float, reason: Optional[str],
+                             description: Optional[str], metadata: Optional[Dict[str, Any]],
+                             session: Session) -> Optional[Ledger]:
+        params = StatementManager._new_transaction_params(
+            amount, fee, ClerkType.CREDIT, TransactionType.WITHDRAWAL_REVERSAL, reason, description, metadata
+        )
+        params["source_type"] = TransactionType.WITHDRAWAL.name
+        return StatementManager._settle(_REVERSE_CHARGE, transaction_id, params, session)
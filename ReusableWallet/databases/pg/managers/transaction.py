@@ -1,30 +1,318 @@
+import re
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterator, List, Mapping, Optional, Sequence
+
+from sqlalchemy import String, bindparam, func, insert, literal_column, select, text, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
 from ReusableWallet.databases.pg.dto.transaction import CreateTransactionDTO
 from ReusableWallet.databases.pg.enums import TransactionStatus
+from ReusableWallet.databases.pg.pagination import aiter_pages, iter_pages, keyset_select, to_page
 from ReusableWallet.databases.pg.schema import Transaction
 
+SETTLED_STATUSES = (TransactionStatus.SUCCESSFUL, TransactionStatus.FAILED)
+
+# Postgres truncates longer identifiers, which would give two keys one index name
+_MAX_IDENTIFIER_LENGTH = 63
+
+
+def _created_after(query, created_after: datetime):
+    # Lets Postgres prune monthly partitions that end before created_after
+    return query.filter(Transaction.created_at >= created_after) if created_after is not None else query
+
+
+def _new_transaction(payload: CreateTransactionDTO) -> Transaction:
+    values = payload.to_dict()
+    # The column is named metadata, but the mapped attribute is metadata_
+    values['metadata_'] = values.pop('metadata')
+    return Transaction(**values)
+
+
+def _is_indexable_key(key: str) -> bool:
+    # Such keys can be written into SQL as a literal, so they may have an expression index
+    return re.fullmatch(r'\w+', key) is not None
+
+
+def _metadata_select(key: str, value: Any, created_after: datetime, limit: int):
+    # Containment is answered by the GIN index for any key. String values of indexable keys also
+    # compare metadata ->> 'key', which an index from create_metadata_index answers directly. The
+    # key is a literal, not a bound parameter, so a prepared statement's generic plan still matches
+    # the index expression.
+    statement = _created_after(select(Transaction), created_after).filter(Transaction.metadata_.contains({key: value}))
+    if isinstance(value, str) and _is_indexable_key(key):
+        text_value = Transaction.metadata_.op('->>', return_type=String)(literal_column(f"'{key}'"))
+        statement = statement.filter(text_value == value)
+    return statement.order_by(Transaction.created_at, Transaction.id).limit(limit)
+
+
+def _history_select(asset_id: str, history_filter: HistoryFilter, after: HistoryCursor, page_size: int):
+    statement = select(Transaction).filter(Transaction.asset_id == asset_id)
+    if history_filter.types:
+        statement = statement.filter(Transaction.type.in_(history_filter.types))
+    if history_filter.statuses:
+        statement = statement.filter(Transaction.status.in_(history_filter.statuses))
+    return keyset_select(statement, Transaction, history_filter, after, page_size)
+
+
+# Built once at import; every call only binds parameters
+_INSERT_TRANSACTION = insert(Transaction.__table__)
+_TRANSACTION_RECORD = select(
+    Transaction.__table__.c.id, Transaction.__table__.c.asset_id, Transaction.__table__.c.amount,
+    Transaction.__table__.c.type,
+).where(Transaction.__table__.c.id == bindparam('transaction_id'))
+_SETTLE_TRANSACTION = (update(Transaction.__table__)
+                       .where(Transaction.__table__.c.id == bindparam('transaction_id'))
+                       .values(status=bindparam('settled_status'), updated_at=func.now()))
+
 
 class TransactionManager:
     @staticmethod
     def create_transaction(payload: CreateTransactionDTO, session: Session):
-        new_transaction = Transaction(**payload.to_dict())
+        new_transaction = _new_transaction(payload)
         session.add(new_transaction)
         session.flush()
         return new_transaction
 
+    @staticmethod
+    def create_transactions(payloads: List[CreateTransactionDTO], session: Session) -> List[uuid.UUID]:
+        """Insert several transactions with one multi-row INSERT.
+
+        Returns:
+        List[uuid.UUID]: The new transaction ids in payload order.
+        """
+        if not payloads:
+            return []
+        rows = []
+        for payload in payloads:
+            row = payload.to_dict()
+            row["id"] = uuid.uuid4()
+            rows.append(row)
+        session.execute(insert(Transaction.__table__), rows)
+        return [row["id"] for row in rows]
+
     @staticmethod
     def fetch_transactions(asset_id: str, session: Session):
-        fetched_transactions = session.query(Transaction).filter(Transaction.asset == asset_id).all()
+        """Fetch every transaction of an asset at once; prefer iter_transactions for long histories."""
+        fetched_transactions = session.query(Transaction).filter(Transaction.asset_id == asset_id).all()
         return fetched_transactions
 
     @staticmethod
-    def update_transaction(transaction_id: str, status: TransactionStatus, session: Session):
-        fetched_transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    def fetch_transactions_page(asset_id: str, history_filter: HistoryFilter, after: HistoryCursor,
+                                page_size: int, session: Session) -> HistoryPage:
+        """Fetch one page of an asset's transactions, ordered on (created_at, id).
+
+        Parameters:
+        asset_id (str): The asset identifier.
+        history_filter (HistoryFilter): Types, statuses, clerk types, date range and direction.
+        after (HistoryCursor): The next_cursor of the previous page, or None for the first page.
+        page_size (int): The maximum number of transactions in the page.
+        session (Session): An SQLAlchemy Session object.
+
+        Returns:
+        HistoryPage: The transactions and the cursor of the following page.
+        """
+        rows = session.execute(_history_select(asset_id, history_filter, after, page_size)).scalars().all()
+        return to_page(rows, page_size)
+
+    @staticmethod
+    def iter_transactions(asset_id: str, history_filter: HistoryFilter, page_size: int,
+                          session: Session) -> Iterator[Transaction]:
+        """Yield an asset's transactions page by page.
+
+        Only one page is held at a time. The session's identity map keeps weak
+        references, so transactions the caller drops are freed as it goes.
+        Every page runs in the session's current transaction; callers
+        scrolling a long history should end it between pages themselves.
+        """
+        return iter_pages(lambda after: TransactionManager.fetch_transactions_page(
+            asset_id, history_filter, after, page_size, session
+        ))
+
+    @staticmethod
+    def find_by_metadata(key: str, value: Any, session: Session, created_after: datetime = None,
+                         limit: int = 100) -> List[Transaction]:
+        """Fetch the transactions whose metadata has key set to value, e.g. a provider reference.
+
+        Parameters:
+        key (str): The top-level metadata key.
+        value (Any): The JSON value to match; strings match exactly, numbers by JSON equality.
+        session (Session): An SQLAlchemy Session object.
+        created_after (datetime): Optional lower bound on created_at, a value or an SQL expression.
+        limit (int): The maximum number of transactions returned.
+
+        Returns:
+        List[Transaction]: The matching transactions, oldest first.
+        """
+        return session.execute(_metadata_select(key, value, created_after, limit)).scalars().all()
+
+    @staticmethod
+    def create_metadata_index(key: str, session: Session, concurrently: bool = True) -> str:
+        """Index metadata ->> key on its own, for hot keys looked up by equality such as an external reference.
+
+        The GIN index already serves every key; an expression index on one key
+        is smaller and faster to probe and update. CONCURRENTLY does not block
+        writers, but needs a session in autocommit mode and a table that is not
+        partitioned.
+
+        Parameters:
+        key (str): The top-level metadata key; letters, digits and underscores only.
+        session (Session): An SQLAlchemy Session object.
+        concurrently (bool): Build the index with CREATE INDEX CONCURRENTLY.
+
+        Returns:
+        str: The name of the index, which keeps the key's case and is left as it is if it exists already.
+        """
+        if not _is_indexable_key(key):
+            raise ValueError(f"Metadata key {key!r} can only be indexed if it is letters, digits and underscores")
+        name = f"ix_transactions_metadata_{key}"
+        if len(name) > _MAX_IDENTIFIER_LENGTH:
+            raise ValueError(f"Metadata key {key!r} is too long to name its index")
+        session.execute(text(
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS \"{name}\" "
+            f"ON {Transaction.__tablename__} ((metadata ->> '{key}'))"
+        ))
+        return name
+
+    @staticmethod
+    def insert_transaction(row: Mapping[str, Any], session: Session) -> None:
+        """Insert one transaction with a cached Core INSERT, for the lean write engine.
+
+        Parameters:
+        row (Mapping[str, Any]): Column values keyed by column name, id included.
+        session (Session): An SQLAlchemy Session object; its connection runs the statement.
+        """
+        session.connection().execute(_INSERT_TRANSACTION, row)
+
+    @staticmethod
+    def fetch_transaction_record(transaction_id: str, session: Session,
+                                 created_after: datetime = None) -> Optional[Row]:
+        """Fetch a transaction's id, asset_id, amount and type as a plain row, for the lean write engine."""
+        statement = _TRANSACTION_RECORD
+        if created_after is not None:
+            statement = statement.where(Transaction.__table__.c.created_at >= created_after)
+        return session.connection().execute(statement, {"transaction_id": transaction_id}).first()
+
+    @staticmethod
+    def settle_transaction(transaction_id, status: TransactionStatus, session: Session) -> None:
+        """Set a transaction's status with a cached Core UPDATE, for the lean write engine."""
+        session.connection().execute(_SETTLE_TRANSACTION, {"transaction_id": transaction_id, "settled_status": status})
+
+    @staticmethod
+    def update_transaction(transaction_id: str, status: TransactionStatus, session: Session,
+                           created_after: datetime = None):
+        fetched_transaction = _created_after(
+            session.query(Transaction).filter(Transaction.id == transaction_id), created_after
+        ).first()
         fetched_transaction.status = status
         return fetched_transaction
 
     @staticmethod
-    def fetch_transaction_by_id(transaction_id: str, session: Session) -> Transaction:
-        fetched_transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    def fetch_unsettled_asset_ids(transaction_ids: Sequence[str], session: Session,
+                                  created_after: datetime = None) -> List:
+        """Return the assets of the given transactions that are not settled yet, without locking anything."""
+        if not transaction_ids:
+            return []
+        return list(session.execute(
+            _created_after(select(Transaction.asset_id).distinct(), created_after)
+            .filter(Transaction.id.in_(transaction_ids))
+            .filter(Transaction.status.notin_(SETTLED_STATUSES))
+        ).scalars())
+
+    @staticmethod
+    def lock_unsettled_transactions(transaction_ids: Sequence[str], session: Session,
+                                    created_after: datetime = None) -> List[Transaction]:
+        """Fetch and lock the given transactions that are not settled yet.
+
+        Rows settled by a concurrent writer drop out once its lock is released,
+        so a transaction is never settled twice. Transactions created before
+        created_after, if given, are left out.
+        """
+        if not transaction_ids:
+            return []
+        fetched_transactions = (_created_after(session.query(Transaction), created_after)
+                                .filter(Transaction.id.in_(transaction_ids))
+                                .filter(Transaction.status.notin_(SETTLED_STATUSES))
+                                .order_by(Transaction.id)
+                                .with_for_update()
+                                .all())
+        return fetched_transactions
+
+    @staticmethod
+    def update_transactions(transaction_ids: Sequence[str], status: TransactionStatus, session: Session) -> int:
+        if not transaction_ids:
+            return 0
+        result = session.execute(
+            update(Transaction.__table__)
+            .where(Transaction.__table__.c.id.in_(transaction_ids))
+            .values(status=status)
+        )
+        return result.rowcount
+
+    @staticmethod
+    def fetch_transaction_by_id(transaction_id: str, session: Session, created_after: datetime = None) -> Transaction:
+        """Fetch a transaction by id.
+
+        Parameters:
+        transaction_id (str): The transaction identifier.
+        session (Session): An SQLAlchemy Session object.
+        created_after (datetime): Optional lower bound on created_at, a value or an SQL expression.
+            On monthly partitioned tables it spares the lookup from probing every partition.
+
+        Returns:
+        Transaction: The transaction, or None.
+        """
+        fetched_transaction = _created_after(
+            session.query(Transaction).filter(Transaction.id == transaction_id), created_after
+        ).first()
         return fetched_transaction
+
+
+class AsyncTransactionManager:
+    """TransactionManager counterpart for an asyncio AsyncSession."""
+
+    @staticmethod
+    async def create_transaction(payload: CreateTransactionDTO, session: AsyncSession) -> Transaction:
+        new_transaction = _new_transaction(payload)
+        session.add(new_transaction)
+        await session.flush()
+        return new_transaction
+
+    @staticmethod
+    async def fetch_transactions(asset_id: str, session: AsyncSession) -> List[Transaction]:
+        result = await session.execute(select(Transaction).filter(Transaction.asset_id == asset_id))
+        return result.scalars().all()
+
+    @staticmethod
+    async def fetch_transactions_page(asset_id: str, history_filter: HistoryFilter, after: HistoryCursor,
+                                      page_size: int, session: AsyncSession) -> HistoryPage:
+        result = await session.execute(_history_select(asset_id, history_filter, after, page_size))
+        return to_page(result.scalars().all(), page_size)
+
+    @staticmethod
+    def iter_transactions(asset_id: str, history_filter: HistoryFilter, page_size: int,
+                          session: AsyncSession) -> AsyncIterator[Transaction]:
+        return aiter_pages(lambda after: AsyncTransactionManager.fetch_transactions_page(
+            asset_id, history_filter, after, page_size, session
+        ))
+
+    @staticmethod
+    async def find_by_metadata(key: str, value: Any, session: AsyncSession, created_after: datetime = None,
+                               limit: int = 100) -> List[Transaction]:
+        result = await session.execute(_metadata_select(key, value, created_after, limit))
+        return result.scalars().all()
+
+    @staticmethod
+    async def update_transaction(transaction_id: str, status: TransactionStatus,
+                                 session: AsyncSession) -> Transaction:
+        fetched_transaction = await AsyncTransactionManager.fetch_transaction_by_id(transaction_id, session)
+        fetched_transaction.status = status
+        return fetched_transaction
+
+    @staticmethod
+    async def fetch_transaction_by_id(transaction_id: str, session: AsyncSession) -> Transaction:
+        result = await session.execute(select(Transaction).filter(Transaction.id == transaction_id))
+        return result.scalars().first()
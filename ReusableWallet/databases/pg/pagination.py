@@ -0,0 +1,69 @@
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+from sqlalchemy import literal, tuple_
+from sqlalchemy.sql import Select
+
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
+
+
+def keyset_select(statement: Select, model, history_filter: HistoryFilter, after: HistoryCursor = None,
+                  page_size: int = 500) -> Select:
+    """Restrict a history query to one page, ordered on (created_at, id).
+
+    The page starts strictly after the cursor, so every page costs one index
+    range scan no matter how deep into the history it is, unlike OFFSET.
+    One row more than page_size is fetched to tell whether another page follows.
+    """
+    if history_filter.clerk_types:
+        statement = statement.filter(model.clerk_type.in_(history_filter.clerk_types))
+    if history_filter.start is not None:
+        statement = statement.filter(model.created_at >= history_filter.start)
+    if history_filter.end is not None:
+        statement = statement.filter(model.created_at < history_filter.end)
+    key = tuple_(model.created_at, model.id)
+    if after is not None:
+        # Typed binds: psycopg2 cannot adapt a bare uuid.UUID
+        position = tuple_(literal(after.created_at, model.created_at.type), literal(after.id, model.id.type))
+        statement = statement.filter(key < position if history_filter.newest_first else key > position)
+    if history_filter.newest_first:
+        statement = statement.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        statement = statement.order_by(model.created_at, model.id)
+    return statement.limit(page_size + 1)
+
+
+def to_page(rows: List, page_size: int) -> HistoryPage:
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return HistoryPage(items=rows, next_cursor=HistoryCursor.of(rows[-1]))
+    return HistoryPage(items=rows)
+
+
+def iter_pages(fetch_page: Callable[[Optional[HistoryCursor]], HistoryPage]) -> Iterator:
+    """Yield the items of fetch_page(None), then of each following page until one has no next cursor.
+
+    Each page is its own short keyset query, so no server-side cursor stays
+    open between pages. The transaction the pages run in is fetch_page's
+    business: pages read through a caller's session all run in the
+    caller's transaction, which stays open for the whole scroll unless the
+    caller commits or rolls back between pages.
+    """
+    after = None
+    while True:
+        page = fetch_page(after)
+        yield from page.items
+        if page.next_cursor is None:
+            return
+        after = page.next_cursor
+
+
+async def aiter_pages(fetch_page: Callable[[Optional[HistoryCursor]], Awaitable[HistoryPage]]) -> AsyncIterator:
+    """iter_pages counterpart for an async fetch_page."""
+    after = None
+    while True:
+        page = await fetch_page(after)
+        for item in page.items:
+            yield item
+        if page.next_cursor is None:
+            return
+        after = page.next_cursor
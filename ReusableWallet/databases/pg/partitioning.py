@@ -0,0 +1,228 @@
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import List, Union
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from ReusableWallet.databases.pg.enums import PartitionMode
+from ReusableWallet.databases.pg.managers.checkpoint import CheckpointManager
+from ReusableWallet.databases.pg.schema.base import Base
+
+logger = logging.getLogger(__name__)
+
+# The tables that grow with every wallet operation
+PARTITIONED_TABLES = ('transactions', 'ledgers')
+
+
+def partitioned_metadata(mode: PartitionMode) -> MetaData:
+    """Copy of the wallet schema with transactions and ledgers declared as partitioned tables.
+
+    Postgres requires the partition key in every unique constraint, so the
+    primary keys become (id, key). Foreign keys into a partitioned table
+    would need the key too, so ledgers.transaction_id is not enforced by the
+    database in partitioned mode. The ORM still treats id alone as the
+    identity, which uuid4 ids keep unique.
+    """
+    key = _partition_key(mode)
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    for name in PARTITIONED_TABLES:
+        table = metadata.tables[name]
+        table.c[key].nullable = False
+        table.c[key].primary_key = True
+        table.append_constraint(PrimaryKeyConstraint('id', key, name=f'{name}_pkey'))
+        table.dialect_options['postgresql']['partition_by'] = (
+            f"RANGE ({key})" if mode is PartitionMode.MONTHLY else f"HASH ({key})"
+        )
+    return metadata
+
+
+def create_schema(bind: Union[Engine, Connection], mode: PartitionMode = PartitionMode.NONE, months_ahead: int = 3,
+                  hash_partitions: int = 16) -> None:
+    """Create every missing wallet table, partitioning transactions and ledgers as mode says.
+
+    Tables that already exist are left as they are; converting an existing
+    heap table to a partitioned one is a data migration this does not do,
+    so asking for a partitioned mode over plain tables raises ValueError.
+    bind is an Engine, or a Connection already in a transaction (e.g. the
+    one AsyncConnection.run_sync passes), which the caller then commits.
+    """
+    if mode is PartitionMode.NONE:
+        Base.metadata.create_all(bind)
+        return
+    metadata = partitioned_metadata(mode)
+    existing = set(inspect(bind).get_table_names())
+    with _begin(bind) as connection:
+        unpartitioned = [name for name in PARTITIONED_TABLES
+                         if name in existing and name not in _partitioned_tables(connection)]
+        if unpartitioned:
+            raise ValueError(f"{', '.join(unpartitioned)} already exist as plain tables and cannot be "
+                             f"partitioned by {mode.value}")
+        for table in metadata.sorted_tables:
+            if table.name in existing:
+                continue
+            if table.name not in PARTITIONED_TABLES:
+                table.create(connection)
+                continue
+            foreign_keys = [constraint for constraint in table.foreign_key_constraints
+                            if constraint.referred_table.name not in PARTITIONED_TABLES]
+            connection.execute(CreateTable(table, include_foreign_key_constraints=foreign_keys))
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+            if mode is PartitionMode.HASH:
+                for remainder in range(hash_partitions):
+                    connection.execute(text(
+                        f'CREATE TABLE {table.name}_p{remainder} PARTITION OF {table.name} '
+                        f'FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {remainder})'
+                    ))
+            else:
+                # Catches rows outside every monthly partition, e.g. backdated imports
+                connection.execute(text(f'CREATE TABLE {table.name}_default PARTITION OF {table.name} DEFAULT'))
+    if mode is PartitionMode.MONTHLY:
+        ensure_future_partitions(bind, months_ahead)
+
+
+def ensure_future_partitions(bind: Union[Engine, Connection], months_ahead: int = 3, start: date = None) -> List[str]:
+    """Create the monthly partitions from start's month (default: this month) to months_ahead later.
+
+    Run it regularly (e.g. daily from cron via the setup CLI) so inserts never
+    fall through to the default partition. Each partition is created in its
+    own transaction, so one that fails is logged and retried on the next run
+    without holding back the others. Rows the default partition already
+    holds for a month are moved into that month's new partition. Returns the
+    partitions created.
+    """
+    month = _month_start(start or date.today())
+    with _begin(bind) as connection:
+        existing = set(_partitions(connection))
+    created = []
+    for _ in range(months_ahead + 1):
+        following = _next_month(month)
+        for table in PARTITIONED_TABLES:
+            name = _monthly_partition_name(table, month)
+            if name in existing:
+                continue
+            try:
+                with _begin(bind) as connection:
+                    _create_monthly_partition(connection, table, name, month, following)
+            except SQLAlchemyError:
+                logger.exception("Could not create partition %s", name)
+                continue
+            created.append(name)
+        month = following
+    return created
+
+
+def _create_monthly_partition(connection, table: str, name: str, month: date, following: date) -> None:
+    bounds = f"FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+    default = f"{table}_default"
+    in_month = f"created_at >= '{month.isoformat()}' AND created_at < '{following.isoformat()}'"
+    stray = default in _partitions(connection) and connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_month})")
+    ).scalar()
+    if not stray:
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}"))
+        return
+    # Postgres refuses a partition whose rows the default partition holds, so the default is
+    # detached while its rows for the month move over, then attached again
+    logger.warning("Moving rows of %s from %s into the new partition %s", month.isoformat(), default, name)
+    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}"))
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_month}"))
+    connection.execute(text(f"DELETE FROM {default} WHERE {in_month}"))
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+
+def archive_partitions(engine: Engine, before: date, archive_schema: str = 'wallet_archive',
+                       drop: bool = False) -> List[str]:
+    """Detach the monthly partitions that end on or before `before` and move them out of the way.
+
+    Detached partitions are moved to archive_schema, where they can be
+    exported and dropped at leisure, or dropped immediately with drop=True.
+    Every asset first gets a balance checkpoint at its last ledger before the
+    cut-off, so fetch_balance_at keeps working for later dates without the
+    archived ledgers. Returns the partitions archived.
+    """
+    cutoff = _month_start(before)
+    archived = []
+    with engine.begin() as connection:
+        CheckpointManager.write_boundary_checkpoints(
+            datetime.combine(cutoff, datetime.min.time()), Session(bind=connection)
+        )
+        partitions = [name for name in _partitions(connection)
+                      if _monthly_partition_end(name) is not None and _monthly_partition_end(name) <= cutoff]
+        if partitions and not drop:
+            connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS {archive_schema}'))
+        for name in partitions:
+            table = name.rsplit('_y', 1)[0]
+            connection.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+            if drop:
+                connection.execute(text(f'DROP TABLE {name}'))
+            else:
+                connection.execute(text(f'ALTER TABLE {name} SET SCHEMA {archive_schema}'))
+            archived.append(name)
+    return archived
+
+
+@contextmanager
+def _begin(bind: Union[Engine, Connection]):
+    # An Engine gets a transaction of its own; a Connection a savepoint inside the caller's transaction
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            yield connection
+    else:
+        with bind.begin_nested():
+            yield bind
+
+
+def _partitioned_tables(connection) -> List[str]:
+    rows = connection.execute(text("""
+        SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+        WHERE pg_table_is_visible(c.oid)
+    """))
+    return [name for name, in rows]
+
+
+def _partition_key(mode: PartitionMode) -> str:
+    if mode is PartitionMode.MONTHLY:
+        return 'created_at'
+    if mode is PartitionMode.HASH:
+        return 'asset_id'
+    raise ValueError(f"{mode} is not a partitioned mode")
+
+
+def _partitions(connection) -> List[str]:
+    rows = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = ANY(:tables) AND pg_table_is_visible(parent.oid)
+    """), {"tables": list(PARTITIONED_TABLES)})
+    return [name for name, in rows]
+
+
+def _month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _monthly_partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def _monthly_partition_end(name: str):
+    try:
+        stamp = name.rsplit('_y', 1)[1]
+        return _next_month(date(int(stamp[:4]), int(stamp[5:7]), 1))
+    except (IndexError, ValueError):
+        return None
@@ -0,0 +1,177 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence
+
+from sqlalchemy.orm import Session
+
+from ReusableWallet.databases.pg.dto.history import HistoryCursor
+from ReusableWallet.databases.pg.dto.ledger import BalanceDiscrepancy
+from ReusableWallet.databases.pg.dto.reconciliation import LedgerChainBreak, ReconciliationReport
+from ReusableWallet.databases.pg.engine import PoolConfig, get_engine
+from ReusableWallet.databases.pg.enums import ReconciliationMethod
+from ReusableWallet.databases.pg.managers.balance import BalanceManager
+from ReusableWallet.databases.pg.managers.bucket import BucketManager
+from ReusableWallet.databases.pg.managers.reconciliation import ReconciliationManager
+
+try:
+    import numpy
+except ImportError:  # Only ReconciliationMethod.NUMPY needs it
+    numpy = None
+
+
+class LedgerReconciler:
+    """Verifies every asset's ledger chain, transactions and balance row.
+
+    For each asset it checks three things:
+    - Each ledger's running balances equal the previous ledger's balances
+      plus its own deltas. Ledgers are walked in chunk_size chunks, so no
+      query scans an unbounded range.
+    - Each transaction's ledger deltas add up to what its type and status
+      imply.
+    - The asset_balances row matches the end of the chain. Assets with
+      balance buckets have a chain per bucket, each checked against its
+      bucket row instead.
+
+    Assets are spread over a pool of worker processes. With workers=1 the
+    check runs in the calling process.
+    """
+
+    def __init__(self, uri: str, method: ReconciliationMethod = ReconciliationMethod.SQL,
+                 chunk_size: int = 50000, workers: int = None, tolerance: float = 1e-6):
+        if method is ReconciliationMethod.NUMPY and numpy is None:
+            raise ImportError("ReconciliationMethod.NUMPY requires numpy")
+        self.uri = uri
+        self.method = method
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.tolerance = tolerance
+
+    def run(self, asset_ids: Sequence = None) -> ReconciliationReport:
+        started = time.perf_counter()
+        with Session(get_engine(self.uri)) as session:
+            asset_ids = ReconciliationManager.fetch_asset_ids(session, asset_ids)
+        report = ReconciliationReport()
+        if self.workers == 1 or len(asset_ids) < 2:
+            report.merge(reconcile_assets(self.uri, asset_ids, self.method, self.chunk_size, self.tolerance))
+        else:
+            # Several batches per worker keep the pool busy when asset histories differ in length
+            batch_size = max(1, len(asset_ids) // (self.workers * 4))
+            batches = [asset_ids[start:start + batch_size] for start in range(0, len(asset_ids), batch_size)]
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [
+                    executor.submit(reconcile_assets, self.uri, batch, self.method, self.chunk_size, self.tolerance)
+                    for batch in batches
+                ]
+                for future in futures:
+                    report.merge(future.result())
+        report.seconds = time.perf_counter() - started
+        return report
+
+
+def reconcile_assets(uri: str, asset_ids: Sequence, method: ReconciliationMethod, chunk_size: int,
+                     tolerance: float) -> ReconciliationReport:
+    """Reconcile a batch of assets on one connection; runs inside a pool worker."""
+    report = ReconciliationReport()
+    engine = get_engine(uri, PoolConfig(pool_size=1, max_overflow=0))
+    with Session(engine) as session:
+        for asset_id in asset_ids:
+            try:
+                # One snapshot for all of an asset's checks, so writes landing between them
+                # on a live database cannot show up as mismatches
+                session.connection(execution_options={
+                    'isolation_level': 'REPEATABLE READ', 'postgresql_readonly': True
+                })
+                _reconcile_asset(session, asset_id, method, chunk_size, tolerance, report)
+            except Exception as error:
+                session.rollback()
+                report.failed_assets.append(f"{asset_id}: {error!r}")
+            else:
+                # Each asset reads in its own short transaction rather than one snapshot held for the batch
+                session.commit()
+            report.assets += 1
+    return report
+
+
+def _reconcile_asset(session: Session, asset_id, method: ReconciliationMethod, chunk_size: int,
+                     tolerance: float, report: ReconciliationReport) -> None:
+    report.transaction_mismatches.extend(
+        ReconciliationManager.find_transaction_mismatches(asset_id, tolerance, session)
+    )
+    report.transactions += ReconciliationManager.count_transactions(asset_id, session)
+
+    buckets = BucketManager.fetch_buckets(asset_id, session)
+    if len(buckets) > 1:
+        # Bucket chains start empty except bucket 0, which continues the asset's chain from before it had buckets
+        for bucket in buckets:
+            start = ReconciliationManager.fetch_chain_start(asset_id, session) if bucket.bucket == 0 else (0.0, 0.0)
+            carry = _check_chain(session, asset_id, start, method, chunk_size, tolerance, report, bucket.bucket)
+            _compare_balance(asset_id, bucket, carry, tolerance, report, bucket.bucket)
+        return
+
+    # Archived ledgers leave a boundary checkpoint the remaining chain continues from
+    start = ReconciliationManager.fetch_chain_start(asset_id, session)
+    carry = _check_chain(session, asset_id, start, method, chunk_size, tolerance, report)
+    _compare_balance(asset_id, BalanceManager.fetch_balance(asset_id, session), carry, tolerance, report)
+
+
+def _check_chain(session, asset_id, start, method, chunk_size, tolerance, report: ReconciliationReport,
+                 bucket: int = 0):
+    if method is ReconciliationMethod.NUMPY:
+        ledgers, carry = _check_chain_numpy(session, asset_id, start, chunk_size, tolerance, report.chain_breaks,
+                                            bucket)
+    else:
+        ledgers, carry = _check_chain_sql(session, asset_id, start, chunk_size, tolerance, report.chain_breaks,
+                                          bucket)
+    report.ledgers += ledgers
+    return carry
+
+
+def _compare_balance(asset_id, balance, carry, tolerance, report: ReconciliationReport, bucket: int = None):
+    if (balance is None or abs(balance.pending_balance - carry[0]) > tolerance
+            or abs(balance.available_balance - carry[1]) > tolerance):
+        report.balance_discrepancies.append(BalanceDiscrepancy(
+            asset_id=str(asset_id),
+            pending_balance=balance.pending_balance if balance else None,
+            available_balance=balance.available_balance if balance else None,
+            ledger_pending_balance=carry[0],
+            ledger_available_balance=carry[1],
+            bucket=bucket,
+        ))
+
+
+def _check_chain_sql(session, asset_id, carry, chunk_size, tolerance, breaks: List[LedgerChainBreak],
+                     bucket: int = 0):
+    checked, after = 0, None
+    while True:
+        found, rows, after, carry = ReconciliationManager.find_chain_breaks(
+            asset_id, after, carry, chunk_size, tolerance, session, bucket
+        )
+        breaks.extend(found)
+        checked += rows
+        if rows < chunk_size:
+            return checked, carry
+
+
+def _check_chain_numpy(session, asset_id, carry, chunk_size, tolerance, breaks: List[LedgerChainBreak],
+                       bucket: int = 0):
+    checked, after = 0, None
+    while True:
+        rows = ReconciliationManager.fetch_ledger_chunk(asset_id, after, chunk_size, session, bucket)
+        if not rows:
+            return checked, carry
+        columns = numpy.array([row[2:] for row in rows], dtype=float)
+        for name, balance_column, delta_column, carried in (
+                ('pending', 0, 1, carry[0]), ('available', 2, 3, carry[1])):
+            balances = columns[:, balance_column]
+            deltas = columns[:, delta_column]
+            previous = numpy.concatenate(([carried], balances[:-1]))
+            for index in numpy.flatnonzero(numpy.abs(balances - previous - deltas) > tolerance):
+                row = rows[index]
+                breaks.append(LedgerChainBreak(asset_id, row.id, row.created_at, name,
+                                               float(previous[index]), float(deltas[index]), float(balances[index])))
+        checked += len(rows)
+        after = HistoryCursor.of(rows[-1])
+        carry = (float(columns[-1, 0]), float(columns[-1, 2]))
+        if len(rows) < chunk_size:
+            return checked, carry
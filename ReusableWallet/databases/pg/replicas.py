@@ -0,0 +1,86 @@
+import itertools
+import threading
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+from ReusableWallet.databases.pg.engine import PoolConfig, get_engine
+
+# Seconds the replica is behind its primary; 0 when it has replayed everything it received
+_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def query_replication_lag(engine: Engine) -> float:
+    with engine.connect() as connection:
+        return float(connection.execute(_LAG_QUERY).scalar())
+
+
+class Replica:
+    def __init__(self, uri: str, pool_config: PoolConfig = None):
+        self.uri = uri
+        self.engine = get_engine(uri, pool_config)
+        # Reads hand their objects back after the replica session is closed, so keep them loaded
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+
+
+class ReplicaRouter:
+    """Picks a healthy, caught-up read replica, round-robin.
+
+    A replica's lag is measured at most once per check_interval, on the read
+    that finds the measurement stale. Replicas lagging more than max_lag
+    seconds are skipped until a later check finds them caught up. Replicas
+    that fail a query or lag check are skipped for down_interval seconds.
+    When no replica is usable choose() returns None and reads go to the
+    primary. lag_probe replaces the lag query, e.g. to simulate lag.
+    """
+
+    def __init__(self, uris: List[str], max_lag: float = 5.0, check_interval: float = 1.0,
+                 down_interval: float = 30.0, pool_config: PoolConfig = None,
+                 lag_probe: Callable[[Replica], float] = None):
+        self.replicas = [Replica(uri, pool_config) for uri in uris]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.down_interval = down_interval
+        self.lag_probe = lag_probe or (lambda replica: query_replication_lag(replica.engine))
+        self._lock = threading.Lock()
+        self._order = itertools.cycle(range(len(self.replicas)))
+
+    def choose(self) -> Optional[Replica]:
+        if not self.replicas:
+            return None
+        with self._lock:
+            start = next(self._order)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._usable(replica):
+                return replica
+        return None
+
+    def mark_down(self, replica: Replica) -> None:
+        replica.down_until = time.monotonic() + self.down_interval
+
+    def _usable(self, replica: Replica) -> bool:
+        now = time.monotonic()
+        if replica.down_until > now:
+            return False
+        # A replica never measured is checked at once, however young the monotonic clock is
+        if replica.lag is None or now - replica.checked_at >= self.check_interval:
+            replica.checked_at = now
+            try:
+                replica.lag = self.lag_probe(replica)
+            except DBAPIError:
+                self.mark_down(replica)
+                return False
+        return replica.lag is not None and replica.lag <= self.max_lag
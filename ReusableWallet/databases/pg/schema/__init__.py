@@ -1,3 +1,6 @@
 from .asset import Asset
+from .balance import AssetBalance
+from .bucket import AssetBalanceBucket
+from .checkpoint import BalanceCheckpoint
 from .ledger import Ledger
 from .transaction import Transaction
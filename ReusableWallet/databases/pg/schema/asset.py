@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, UniqueConstraint, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -16,9 +16,12 @@ class Asset(Base):
     symbol = Column(String, nullable=False)
     user = Column(String, nullable=False)  # Assuming there is a 'users' table
     withdrawal_activity = Column(SQLEnum(ActivityStatus), default=ActivityStatus.ACTIVE)
+    # More than 1 spreads the balance over asset_balance_buckets rows (hot asset mode)
+    balance_buckets = Column(Integer, nullable=False, default=1, server_default='1')
     # Relationship - Assuming Ledger has an asset_id foreign key linking to Asset
     ledgers = relationship("Ledger", back_populates="asset")
     transactions = relationship("Transaction", back_populates="asset")
+    balance = relationship("AssetBalance", back_populates="asset", uselist=False)
 
     # Setting up a unique constraint on user and symbol
     __table_args__ = (UniqueConstraint('user', 'symbol', name='_user_symbol_uc'),)
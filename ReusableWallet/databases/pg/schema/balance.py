@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Float, ForeignKey, DateTime, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+
+from .base import Base
+
+
+class AssetBalance(Base):
+    __tablename__ = 'asset_balances'
+
+    # One row per asset, kept in step with the latest ledger entry so balance reads are a primary-key lookup
+    asset_id = Column(UUID(as_uuid=True), ForeignKey('assets.id'), primary_key=True)
+    pending_balance = Column(Float, nullable=False, default=0)
+    available_balance = Column(Float, nullable=False, default=0)
+    # Bumped on every update; a stale version makes the flush raise StaleDataError (optimistic locking)
+    version = Column(Integer, nullable=False, default=1)
+
+    # Additional fields for timestamps
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    asset = relationship("Asset", back_populates="balance")
+
+    __mapper_args__ = {"version_id_col": version}
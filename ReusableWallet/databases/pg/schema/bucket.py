@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Float, ForeignKey, DateTime, SmallInteger
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from .base import Base
+
+
+class AssetBalanceBucket(Base):
+    __tablename__ = 'asset_balance_buckets'
+
+    # One share of a hot asset's balance; the asset's balance is the sum of its buckets,
+    # and each bucket is kept in step with the latest ledger entry of that bucket
+    asset_id = Column(UUID(as_uuid=True), ForeignKey('assets.id'), primary_key=True)
+    bucket = Column(SmallInteger, primary_key=True)
+    pending_balance = Column(Float, nullable=False, default=0)
+    available_balance = Column(Float, nullable=False, default=0)
+
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
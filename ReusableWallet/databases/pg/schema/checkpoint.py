@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Float, ForeignKey, DateTime, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from .base import Base
+
+
+class BalanceCheckpoint(Base):
+    __tablename__ = 'balance_checkpoints'
+
+    # An asset's balances summed over every ledger up to and including (created_at, ledger_id)
+    asset_id = Column(UUID(as_uuid=True), ForeignKey('assets.id'), primary_key=True)
+    created_at = Column(DateTime, primary_key=True)
+    # Not a foreign key: checkpoints must outlive the ledgers they summarize once those are archived
+    ledger_id = Column(UUID(as_uuid=True), primary_key=True)
+    pending_balance = Column(Float, nullable=False)
+    available_balance = Column(Float, nullable=False)
+    # Ledgers replayed since the previous checkpoint of the asset
+    ledgers = Column(Integer, nullable=False)
+
+    taken_at = Column(DateTime, default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, Float, ForeignKey, DateTime, Enum as SQLEnum, func
+from sqlalchemy import create_engine, Column, String, Float, ForeignKey, DateTime, Index, SmallInteger, Enum as SQLEnum, func
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -19,14 +19,20 @@ class Ledger(Base):
     pending_delta = Column(Float, nullable=False, default=0)
     available_balance = Column(Float, nullable=False, default=0)
     available_delta = Column(Float, nullable=False, default=0)
+    # Running balances above are per bucket; assets without balance buckets only use bucket 0
+    bucket = Column(SmallInteger, nullable=False, default=0, server_default='0')
 
     # Additional fields for timestamps
-    created_at = Column(DateTime, default=func.now())
+    # clock_timestamp() rather than now(): a writer that waited on a balance lock must still sort after the holder
+    created_at = Column(DateTime, default=func.clock_timestamp())
 
     # Define relationships (if other tables 'assets' and 'transactions' exist)
     asset = relationship("Asset", back_populates="ledgers")
     transactions = relationship("Transaction", back_populates="ledgers")
 
+    # Serves "latest ledger for an asset" lookups and keyset-paginated history without sorting
+    __table_args__ = (Index('ix_ledgers_asset_id_created_at_id', 'asset_id', 'created_at', 'id'),)
+
     # Use custom JSON serialization
     def to_dict(self):
         return {
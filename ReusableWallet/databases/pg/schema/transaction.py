@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Enum as SQLEnum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Index, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -24,7 +24,7 @@ class Transaction(Base):
     type = Column(SQLEnum(TransactionType), nullable=False)
     reason = Column(String, nullable=True)
     description = Column(String)
-    metadata_ = Column("metadata", String)  # Store as JSON string or use JSONB for PostgreSQL
+    metadata_ = Column("metadata", JSONB)
 
     # Additional fields for timestamps
     created_at = Column(DateTime, default=func.now())
@@ -32,3 +32,11 @@ class Transaction(Base):
 
     asset = relationship("Asset", back_populates="transactions")
     ledgers = relationship("Ledger", back_populates="transactions")
+
+    __table_args__ = (
+        # Keyset-paginated history of an asset; id breaks ties between rows of one DB transaction
+        Index('ix_transactions_asset_id_created_at_id', 'asset_id', 'created_at', 'id'),
+        # Containment lookups (metadata @> '{"key": value}') on any key; jsonb_path_ops keeps it small
+        Index('ix_transactions_metadata', 'metadata', postgresql_using='gin',
+              postgresql_ops={'metadata': 'jsonb_path_ops'}),
+    )
@@ -1,8 +1,196 @@
+import argparse
+import sys
+from datetime import date, datetime
+
 from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
 
+from ReusableWallet.databases.pg.buckets import BucketRebalancer
+from ReusableWallet.databases.pg.bulk_io import BulkIO
+from ReusableWallet.databases.pg.checkpoints import CheckpointWorker
+from ReusableWallet.databases.pg.dto.bulk_io import CopyFilter, CopyReport
+from ReusableWallet.databases.pg.dto.reconciliation import ReconciliationReport
+from ReusableWallet.databases.pg.enums import CopyFormat, PartitionMode, ReconciliationMethod
+from ReusableWallet.databases.pg.managers.balance import BalanceManager
+from ReusableWallet.databases.pg.managers.transaction import TransactionManager
+from ReusableWallet.databases.pg.partitioning import archive_partitions, create_schema, ensure_future_partitions
+from ReusableWallet.databases.pg.reconciliation import LedgerReconciler
+from ReusableWallet.databases.pg.sharding import ShardRebalancer
 from ReusableWallet.databases.pg.schema.base import Base
 
 
-def setup_database(uri: str) -> None:
+def setup_database(uri: str, partitioning: PartitionMode = PartitionMode.NONE) -> None:
+    engine = create_engine(uri)
+    create_schema(engine, partitioning)
+
+
+def rebuild_asset_balances(uri: str) -> int:
+    """Backfill the asset_balances table from the ledgers table.
+
+    Run once after upgrading an existing database, or whenever
+    check_asset_balances reports discrepancies.
+    """
     engine = create_engine(uri)
     Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        written = BalanceManager.rebuild_balances(session)
+        session.commit()
+    return written
+
+
+def check_asset_balances(uri: str):
+    """Return the assets whose balance row disagrees with their last ledger entry."""
+    engine = create_engine(uri)
+    with Session(engine) as session:
+        return BalanceManager.find_discrepancies(session)
+
+
+def index_metadata_key(uri: str, key: str, concurrently: bool = True) -> str:
+    """Add an expression index on one transaction metadata key; see TransactionManager.create_metadata_index."""
+    engine = create_engine(uri)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        return TransactionManager.create_metadata_index(key, Session(bind=connection), concurrently)
+
+
+def write_balance_checkpoints(uri: str, spacing: int = 10000) -> int:
+    """Run one pass of the balance checkpoint job over every asset."""
+    return CheckpointWorker(uri, spacing=spacing).run_once()
+
+
+def rebalance_balance_buckets(uri: str) -> int:
+    """Run one pass of the bucket rebalance job over every asset with balance buckets."""
+    return BucketRebalancer(uri).run_once()
+
+
+def create_future_partitions(uri: str, months_ahead: int = 3):
+    """Create the coming monthly partitions; schedule it daily for PartitionMode.MONTHLY."""
+    return ensure_future_partitions(create_engine(uri), months_ahead)
+
+
+def archive_old_partitions(uri: str, before: date, archive_schema: str = 'wallet_archive', drop: bool = False):
+    """Detach the monthly partitions older than before's month; see archive_partitions."""
+    return archive_partitions(create_engine(uri), before, archive_schema, drop)
+
+
+def rebalance_shards(uris, dry_run: bool = False):
+    """Move users onto the shard the ring assigns them; see ShardRebalancer."""
+    return ShardRebalancer(uris).run(dry_run)
+
+
+def export_rows(uri: str, table: str, path: str, format: CopyFormat = CopyFormat.CSV,
+                copy_filter: CopyFilter = None) -> CopyReport:
+    """Write a table's rows to path with COPY; see BulkIO."""
+    with open(path, 'wb') as output:
+        return BulkIO(uri).export_rows(table, output, format, copy_filter)
+
+
+def import_rows(uri: str, table: str, path: str, format: CopyFormat = CopyFormat.CSV,
+                recompute: bool = True) -> CopyReport:
+    """Load a file written by export_rows into a table with COPY; see BulkIO."""
+    with open(path, 'rb') as source:
+        return BulkIO(uri).import_rows(table, source, format, recompute)
+
+
+def reconcile_ledgers(uri: str, method: ReconciliationMethod = ReconciliationMethod.SQL,
+                      chunk_size: int = 50000, workers: int = None) -> ReconciliationReport:
+    """Verify every ledger chain, transaction and balance row; see LedgerReconciler."""
+    return LedgerReconciler(uri, method=method, chunk_size=chunk_size, workers=workers).run()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m ReusableWallet.databases.pg.setup')
+    parser.add_argument('command', choices=['setup', 'rebuild-balances', 'check-balances', 'reconcile',
+                                            'checkpoint', 'partitions', 'archive', 'rebalance-shards',
+                                            'rebalance-buckets', 'export', 'import', 'index-metadata'])
+    parser.add_argument('uri', help='for rebalance-shards, every shard URI in ring order, comma separated')
+    parser.add_argument('--method', default=ReconciliationMethod.SQL.value,
+                        choices=[method.value for method in ReconciliationMethod], help='reconcile only')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='reconcile only')
+    parser.add_argument('--workers', type=int, help='reconcile only; defaults to the CPU count')
+    parser.add_argument('--spacing', type=int, default=10000, help='checkpoint only; ledgers between checkpoints')
+    parser.add_argument('--partitioning', default=PartitionMode.NONE.value,
+                        choices=[mode.value for mode in PartitionMode], help='setup only')
+    parser.add_argument('--months-ahead', type=int, default=3, help='partitions only')
+    parser.add_argument('--before', type=date.fromisoformat,
+                        help='archive only; partitions of months before this date (YYYY-MM-DD)')
+    parser.add_argument('--archive-schema', default='wallet_archive', help='archive only')
+    parser.add_argument('--drop', action='store_true', help='archive only; drop instead of moving partitions')
+    parser.add_argument('--dry-run', action='store_true', help='rebalance-shards only; list the moves')
+    parser.add_argument('--table', default='ledgers', choices=['transactions', 'ledgers'],
+                        help='export and import only')
+    parser.add_argument('--file', help='export and import only; the file to write or read')
+    parser.add_argument('--format', default=CopyFormat.CSV.value,
+                        choices=[format.value for format in CopyFormat], help='export and import only')
+    parser.add_argument('--asset-id', action='append', help='export only; repeat for several assets')
+    parser.add_argument('--user', help='export only')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='export only; created_at from, inclusive')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='export only; created_at until, exclusive')
+    parser.add_argument('--key', help='index-metadata only; the metadata key to index, e.g. external_reference')
+    parser.add_argument('--blocking', action='store_true',
+                        help='index-metadata only; build without CONCURRENTLY, needed on partitioned tables')
+    parser.add_argument('--no-recompute', action='store_true',
+                        help='import only; reject ledgers with wrong running balances instead of rewriting them')
+    args = parser.parse_args(argv)
+
+    if args.command == 'setup':
+        setup_database(args.uri, PartitionMode(args.partitioning))
+    elif args.command == 'partitions':
+        created = create_future_partitions(args.uri, args.months_ahead)
+        print(f"{len(created)} partitions created: {', '.join(created)}")
+    elif args.command == 'archive':
+        if args.before is None:
+            parser.error('archive requires --before')
+        archived = archive_old_partitions(args.uri, args.before, args.archive_schema, args.drop)
+        print(f"{len(archived)} partitions archived: {', '.join(archived)}")
+    elif args.command == 'rebuild-balances':
+        print(f"{rebuild_asset_balances(args.uri)} balance rows written")
+    elif args.command == 'checkpoint':
+        print(f"{write_balance_checkpoints(args.uri, args.spacing)} checkpoints written")
+    elif args.command in ('export', 'import'):
+        if args.file is None:
+            parser.error(f'{args.command} requires --file')
+        if args.command == 'export':
+            report = export_rows(args.uri, args.table, args.file, CopyFormat(args.format),
+                                 CopyFilter(args.asset_id, args.user, args.start, args.end))
+        else:
+            report = import_rows(args.uri, args.table, args.file, CopyFormat(args.format), not args.no_recompute)
+        print(f"{report.rows} {report.table} rows {args.command}ed in {report.seconds:.1f}s "
+              f"({report.rows_per_second or 0:.0f} rows/s), {report.skipped_rows} already present, "
+              f"{report.corrected_rows} running balances corrected")
+    elif args.command == 'index-metadata':
+        if args.key is None:
+            parser.error('index-metadata requires --key')
+        print(f"Index {index_metadata_key(args.uri, args.key, not args.blocking)} ready")
+    elif args.command == 'rebalance-buckets':
+        print(f"{rebalance_balance_buckets(args.uri)} bucket transfer ledgers written")
+    elif args.command == 'rebalance-shards':
+        report = rebalance_shards(args.uri.split(','), args.dry_run)
+        for move in report.moves:
+            print(move)
+        for failure in report.failed_users:
+            print(failure)
+        print(f"{len(report.moves)} users to move, {report.users_moved} moved with {report.assets_moved} assets "
+              f"and {report.rows_copied} rows in {report.seconds:.1f}s, {len(report.failed_users)} failed")
+        return 1 if report.failed_users else 0
+    elif args.command == 'reconcile':
+        report = reconcile_ledgers(args.uri, ReconciliationMethod(args.method), args.chunk_size, args.workers)
+        for problem in (report.chain_breaks + report.transaction_mismatches
+                        + report.balance_discrepancies + report.failed_assets):
+            print(problem)
+        print(f"{report.assets} assets, {report.ledgers} ledgers, {report.transactions} transactions "
+              f"in {report.seconds:.1f}s ({report.rows_per_second or 0:.0f} ledgers/s): "
+              f"{len(report.chain_breaks)} chain breaks, {len(report.transaction_mismatches)} transaction "
+              f"mismatches, {len(report.balance_discrepancies)} balance discrepancies, "
+              f"{len(report.failed_assets)} assets failed")
+        return 0 if report.consistent else 1
+    else:
+        discrepancies = check_asset_balances(args.uri)
+        for discrepancy in discrepancies:
+            print(discrepancy)
+        print(f"{len(discrepancies)} discrepancies found")
+        return 1 if discrepancies else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,441 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, TypeVar, Union
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from ReusableWallet.databases.pg.dto.bulk import BulkItemDTO, BulkItemResult
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
+from ReusableWallet.databases.pg.dto.ledger import BalanceDiscrepancy, LedgerBalance
+from ReusableWallet.databases.pg.dto.settlement import SettlementResult
+from ReusableWallet.databases.pg.dto.sharding import RebalanceReport, ShardMove
+from ReusableWallet.databases.pg.engine import PoolConfig, get_engine
+from ReusableWallet.databases.pg.enums import ActivityStatus, TransactionStatus
+from ReusableWallet.databases.pg.exceptions import EntityNotFound
+from ReusableWallet.databases.pg.managers.shard import ASSET_TABLES, ShardManager
+from ReusableWallet.databases.pg.pagination import iter_pages
+from ReusableWallet.databases.pg.schema import Asset, Ledger, Transaction
+from ReusableWallet.databases.pg.wallet import BulkItem, PgWallet
+
+T = TypeVar('T')
+
+# Shard URIs in ring order, or shard name -> URI
+Shards = Union[Sequence[str], Mapping[str, str]]
+
+
+def shard_uris(shards: Shards) -> Dict[str, str]:
+    """Name the shards. A plain list names them shard0, shard1, ..., so append new shards at its end."""
+    if isinstance(shards, Mapping):
+        return dict(shards)
+    return {f"shard{index}": uri for index, uri in enumerate(shards)}
+
+
+class ShardRing:
+    """Rendezvous (highest random weight) hashing of user ids onto shard names.
+
+    A user's shard depends only on the user id and the shard names, so every
+    process agrees without coordination, and adding a shard only moves the
+    users the new shard wins, about 1/n of them.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        if not names:
+            raise ValueError("A shard ring needs at least one shard")
+        self.names = list(names)
+
+    def owner(self, user_id: str) -> str:
+        return max(self.names, key=lambda name: self._weight(name, user_id))
+
+    @staticmethod
+    def _weight(name: str, user_id: str) -> int:
+        digest = hashlib.blake2b(f"{name}\x00{user_id}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+
+class Shard:
+    def __init__(self, name: str, wallet: PgWallet):
+        self.name = name
+        self.wallet = wallet
+        # Results are handed back after the shard session is closed, so keep them loaded
+        self.Session = sessionmaker(bind=wallet.engine, expire_on_commit=False)
+
+
+class ShardDirectory:
+    """Bounded LRU map of asset and transaction ids to the name of the shard holding them."""
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[str]:
+        with self._lock:
+            name = self._entries.get(str(key))
+            if name is not None:
+                self._entries.move_to_end(str(key))
+            return name
+
+    def put(self, key, name: str) -> None:
+        with self._lock:
+            self._entries[str(key)] = name
+            self._entries.move_to_end(str(key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._entries.pop(str(key), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class ShardedWallet:
+    """PgWallet spread over several Postgres databases, one PgWallet per shard.
+
+    Assets are placed on the shard ShardRing assigns their user, so all of a
+    user's assets share a shard. Operations by asset or transaction id find
+    the shard through a ShardDirectory, filled as assets and transactions pass
+    through this wallet; ids it has not seen are looked up on every shard in
+    parallel, one primary key probe each. Methods take no session: each call
+    runs in its own session on the shard it routes to, and returns detached
+    objects.
+
+    wallet_options are passed to every shard's PgWallet. Read replicas are
+    per-database, so replica_uris is not accepted here.
+    """
+
+    def __init__(self, shards: Shards, directory_size: int = 100000, **wallet_options):
+        if 'replica_uris' in wallet_options:
+            raise ValueError("replica_uris cannot be shared by shards")
+        self.shards = {name: Shard(name, PgWallet(uri, **wallet_options))
+                       for name, uri in shard_uris(shards).items()}
+        self.ring = ShardRing(list(self.shards))
+        self.directory = ShardDirectory(directory_size)
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='wallet-shard')
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def shard_for_user(self, user_id: str) -> Shard:
+        return self.shards[self.ring.owner(user_id)]
+
+    def create_asset(self, user_id: str, symbol: str) -> Asset:
+        shard = self.shard_for_user(user_id)
+        asset = self._run(shard, lambda wallet, session: wallet.create_asset(session, user_id, symbol))
+        self.directory.put(asset.id, shard.name)
+        return asset
+
+    def fetch_user_asset(self, user_id: str, symbol: str, read_your_writes: bool = False) -> Optional[Asset]:
+        owner = self.shard_for_user(user_id)
+        # Falls back to the other shards for users a rebalance has not moved onto their owner yet
+        shards = [owner] + [shard for shard in self.shards.values() if shard is not owner]
+        for shard in shards:
+            asset = self._run(
+                shard, lambda wallet, session: wallet.fetch_user_asset(session, user_id, symbol, read_your_writes)
+            )
+            if asset is not None:
+                self.directory.put(asset.id, shard.name)
+                return asset
+        return None
+
+    def fetch_user_balances(self, user_id: str, read_your_writes: bool = False) -> Dict[Any, LedgerBalance]:
+        """Balances of every asset of a user, keyed by asset id, read from all shards in parallel."""
+        def read(shard: Shard) -> Dict[Any, LedgerBalance]:
+            return self._run(
+                shard, lambda wallet, session: wallet.fetch_user_balances(session, user_id, read_your_writes)
+            )
+
+        balances = {}
+        for shard, shard_balances in zip(self.shards.values(), self._fan_out(read)):
+            for asset_id in shard_balances:
+                self.directory.put(asset_id, shard.name)
+            balances.update(shard_balances)
+        return balances
+
+    def fetch_balances(self, asset_ids: List[str], read_your_writes: bool = False) -> Dict[Any, LedgerBalance]:
+        """Balances of many assets keyed by asset id, one query per shard, all shards in parallel."""
+        def read(shard: Shard) -> Dict[Any, LedgerBalance]:
+            return self._run(
+                shard, lambda wallet, session: wallet.fetch_balances(session, asset_ids, read_your_writes)
+            )
+
+        balances = {}
+        for shard, shard_balances in zip(self.shards.values(), self._fan_out(read)):
+            for asset_id in shard_balances:
+                self.directory.put(asset_id, shard.name)
+            balances.update(shard_balances)
+        return balances
+
+    def update_withdrawal_activity(self, asset_id: str, status: ActivityStatus) -> Asset:
+        return self._on_asset(
+            asset_id, lambda wallet, session: wallet.update_withdrawal_activity(session, asset_id, status)
+        )
+
+    def fetch_balance(self, asset_id: str, read_your_writes: bool = False) -> LedgerBalance:
+        return self._on_asset(
+            asset_id, lambda wallet, session: wallet.fetch_balance(session, asset_id, read_your_writes)
+        )
+
+    def fetch_balance_at(self, asset_id: str, at: datetime, read_your_writes: bool = False) -> LedgerBalance:
+        return self._on_asset(
+            asset_id, lambda wallet, session: wallet.fetch_balance_at(session, asset_id, at, read_your_writes)
+        )
+
+    def fetch_transactions(self, asset_id: str, read_your_writes: bool = False) -> List[Transaction]:
+        return self._on_asset(
+            asset_id, lambda wallet, session: wallet.fetch_transactions(session, asset_id, read_your_writes)
+        )
+
+    def find_transactions_by_metadata(self, key: str, value: Any, limit: int = 100,
+                                      read_your_writes: bool = False) -> List[Transaction]:
+        """Transactions whose metadata has key set to value, from all shards in parallel, oldest first."""
+        found = []
+        for transactions in self._fan_out(lambda shard: self._run(
+                shard, lambda wallet, session: wallet.find_transactions_by_metadata(
+                    session, key, value, limit, read_your_writes
+                ))):
+            found.extend(transactions)
+        return sorted(found, key=lambda transaction: (transaction.created_at, transaction.id))[:limit]
+
+    def fetch_transactions_page(self, asset_id: str, history_filter: HistoryFilter = None,
+                                after: HistoryCursor = None, page_size: int = 500,
+                                read_your_writes: bool = False) -> HistoryPage:
+        return self._on_asset(asset_id, lambda wallet, session: wallet.fetch_transactions_page(
+            session, asset_id, history_filter, after, page_size, read_your_writes
+        ))
+
+    def iter_transactions(self, asset_id: str, history_filter: HistoryFilter = None, page_size: int = 500,
+                          read_your_writes: bool = False) -> Iterator[Transaction]:
+        return iter_pages(lambda after: self.fetch_transactions_page(
+            asset_id, history_filter, after, page_size, read_your_writes
+        ))
+
+    def fetch_ledgers_page(self, asset_id: str, history_filter: HistoryFilter = None,
+                           after: HistoryCursor = None, page_size: int = 500,
+                           read_your_writes: bool = False) -> HistoryPage:
+        return self._on_asset(asset_id, lambda wallet, session: wallet.fetch_ledgers_page(
+            session, asset_id, history_filter, after, page_size, read_your_writes
+        ))
+
+    def iter_ledgers(self, asset_id: str, history_filter: HistoryFilter = None, page_size: int = 500,
+                     read_your_writes: bool = False) -> Iterator[Ledger]:
+        return iter_pages(lambda after: self.fetch_ledgers_page(
+            asset_id, history_filter, after, page_size, read_your_writes
+        ))
+
+    def initiate_fund_asset(self, asset_id: str, amount: float, fee: float = 0, reason: str = None,
+                            description: str = None, metadata: Dict[str, Any] = None) -> Ledger:
+        return self._on_asset(asset_id, lambda wallet, session: wallet.initiate_fund_asset(
+            session, asset_id, amount, fee, reason, description, metadata
+        ))
+
+    def validate_fund_asset(self, transaction_id: str) -> Ledger:
+        return self._on_transaction(
+            transaction_id, lambda wallet, session: wallet.validate_fund_asset(session, transaction_id)
+        )
+
+    def initiate_charge_asset(self, asset_id: str, amount: float, fee: float = 0, reason: str = None,
+                              description: str = None, metadata: Dict[str, Any] = None) -> Ledger:
+        return self._on_asset(asset_id, lambda wallet, session: wallet.initiate_charge_asset(
+            session, asset_id, amount, fee, reason, description, metadata
+        ))
+
+    def validate_charge_asset(self, transaction_id: str) -> Ledger:
+        return self._on_transaction(
+            transaction_id, lambda wallet, session: wallet.validate_charge_asset(session, transaction_id)
+        )
+
+    def reverse_charge_asset(self, transaction_id: str, amount: float, fee: float, reason: str = None,
+                             description: str = None, metadata: Dict[str, Any] = None) -> Ledger:
+        return self._on_transaction(transaction_id, lambda wallet, session: wallet.reverse_charge_asset(
+            session, transaction_id, amount, fee, reason, description, metadata
+        ))
+
+    def bulk_fund_assets(self, items: List[BulkItem], chunk_size: int = 500) -> List[BulkItemResult]:
+        return self._bulk_write(items, chunk_size, PgWallet.bulk_fund_assets)
+
+    def bulk_charge_assets(self, items: List[BulkItem], chunk_size: int = 500) -> List[BulkItemResult]:
+        return self._bulk_write(items, chunk_size, PgWallet.bulk_charge_assets)
+
+    def settle_transactions(self, transaction_ids: List[str], status: TransactionStatus) -> SettlementResult:
+        """Settle transactions on every shard holding some of them, the shards in parallel.
+
+        Each shard settles its share in its own DB transaction, so a failure
+        on one shard does not undo the others.
+        """
+        located = self._locate(Transaction, transaction_ids)
+        by_shard = defaultdict(list)
+        for transaction_id in transaction_ids:
+            if located.get(str(transaction_id)) is not None:
+                by_shard[located[str(transaction_id)]].append(transaction_id)
+        shards = [self.shards[name] for name in by_shard]
+        result = SettlementResult(skipped=[transaction_id for transaction_id in transaction_ids
+                                           if located.get(str(transaction_id)) is None])
+        for shard_result in self._fan_out(lambda shard: self._run(
+                shard, lambda wallet, session: wallet.settle_transactions(session, by_shard[shard.name], status)
+        ), shards):
+            result.ledgers.extend(shard_result.ledgers)
+            result.skipped.extend(shard_result.skipped)
+        return result
+
+    def rebuild_balances(self) -> int:
+        return sum(self._fan_out(lambda shard: self._run(
+            shard, lambda wallet, session: wallet.rebuild_balances(session)
+        )))
+
+    def check_balances(self) -> List[BalanceDiscrepancy]:
+        return [discrepancy for discrepancies in self._fan_out(lambda shard: self._run(
+            shard, lambda wallet, session: wallet.check_balances(session)
+        )) for discrepancy in discrepancies]
+
+    @staticmethod
+    def _run(shard: Shard, call: Callable[[PgWallet, Session], T]) -> T:
+        with shard.Session() as session:
+            return call(shard.wallet, session)
+
+    def _fan_out(self, call: Callable[[Shard], T], shards: Sequence[Shard] = None) -> List[T]:
+        shards = list(self.shards.values()) if shards is None else list(shards)
+        if len(shards) == 1:
+            return [call(shards[0])]
+        return list(self._executor.map(call, shards))
+
+    def _locate(self, model, ids: Sequence) -> Dict[str, Optional[str]]:
+        """Map ids to the name of the shard holding them, probing all shards for ids not in the directory."""
+        located = {str(id): self.directory.get(id) for id in ids}
+        unknown = []
+        for id in {id for id, name in located.items() if name is None}:
+            try:
+                unknown.append(uuid.UUID(id))
+            except ValueError:
+                pass
+        if unknown:
+            for shard, found in zip(self.shards.values(), self._fan_out(lambda shard: self._run(
+                    shard, lambda wallet, session: ShardManager.fetch_existing_ids(model, unknown, session)
+            ))):
+                for id in found:
+                    located[str(id)] = shard.name
+                    self.directory.put(id, shard.name)
+        return located
+
+    def _on_asset(self, asset_id: str, call: Callable[[PgWallet, Session], T]) -> T:
+        return self._on_located(Asset, asset_id, call, lambda: ValueError(f"Asset with id {asset_id} not found"))
+
+    def _on_transaction(self, transaction_id: str, call: Callable[[PgWallet, Session], T]) -> T:
+        return self._on_located(Transaction, transaction_id, call, lambda: EntityNotFound('Transaction'))
+
+    def _on_located(self, model, id, call: Callable[[PgWallet, Session], T], not_found) -> T:
+        cached = self.directory.get(id)
+        name = cached or self._locate(model, [id])[str(id)]
+        if name is None:
+            raise not_found()
+        try:
+            result = self._run(self.shards[name], call)
+        except (EntityNotFound, ValueError):
+            if cached is None:
+                raise
+            # The directory may predate a rebalance that moved the row; look it up again
+            self.directory.forget(id)
+            moved_to = self._locate(model, [id])[str(id)]
+            if moved_to is None or moved_to == name:
+                raise
+            name = moved_to
+            result = self._run(self.shards[name], call)
+        if isinstance(result, Ledger):
+            self.directory.put(result.transaction_id, name)
+        return result
+
+    def _bulk_write(self, items: List[BulkItem], chunk_size: int,
+                    write: Callable[[PgWallet, Session, List[BulkItemDTO], int], List[BulkItemResult]]):
+        items = [item if isinstance(item, BulkItemDTO) else BulkItemDTO(*item) for item in items]
+        located = self._locate(Asset, [item.asset_id for item in items])
+        results: List[Optional[BulkItemResult]] = [None] * len(items)
+        positions = defaultdict(list)
+        for position, item in enumerate(items):
+            name = located[str(item.asset_id)]
+            if name is None:
+                results[position] = BulkItemResult(item=item, error=f"Asset with id {item.asset_id} not found")
+            else:
+                positions[name].append(position)
+
+        def write_shard(shard: Shard) -> List[BulkItemResult]:
+            return self._run(shard, lambda wallet, session: write(
+                wallet, session, [items[position] for position in positions[shard.name]], chunk_size
+            ))
+
+        shards = [self.shards[name] for name in positions]
+        for shard, shard_results in zip(shards, self._fan_out(write_shard, shards)):
+            for position, result in zip(positions[shard.name], shard_results):
+                results[position] = result
+                if result.ledger is not None:
+                    self.directory.put(result.ledger.transaction_id, shard.name)
+        return results
+
+
+class ShardRebalancer:
+    """Moves users onto the shard the ring now assigns them, e.g. after a shard was added.
+
+    Create the new shard's schema with `setup` first. Each user moves on its
+    own: the user's asset and balance rows are locked on the source, every
+    row of the user's assets is copied to the target and committed there, and
+    then deleted from the source. Writers to those assets wait on the locks
+    and fail once the rows are gone; ShardedWallet finds them on the target
+    on the next call. Inserts skip rows that already exist, so a run
+    interrupted between the two commits is finished by running it again.
+    """
+
+    def __init__(self, shards: Shards, batch_size: int = 5000, pool_config: PoolConfig = None):
+        uris = shard_uris(shards)
+        self.ring = ShardRing(list(uris))
+        self.sessions = {name: sessionmaker(bind=get_engine(uri, pool_config)) for name, uri in uris.items()}
+        self.batch_size = batch_size
+
+    def plan(self) -> List[ShardMove]:
+        moves = []
+        for name, Session in self.sessions.items():
+            with Session() as session:
+                after = None
+                while True:
+                    user_ids = ShardManager.fetch_user_ids(after, self.batch_size, session)
+                    moves.extend(ShardMove(user_id, name, self.ring.owner(user_id))
+                                 for user_id in user_ids if self.ring.owner(user_id) != name)
+                    if len(user_ids) < self.batch_size:
+                        break
+                    after = user_ids[-1]
+        return moves
+
+    def run(self, dry_run: bool = False) -> RebalanceReport:
+        started = time.perf_counter()
+        report = RebalanceReport(moves=self.plan())
+        if not dry_run:
+            for move in report.moves:
+                try:
+                    assets, rows = self.move_user(move)
+                except Exception as error:
+                    report.failed_users.append(f"{move.user_id}: {error!r}")
+                else:
+                    report.users_moved += 1
+                    report.assets_moved += assets
+                    report.rows_copied += rows
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def move_user(self, move: ShardMove):
+        with self.sessions[move.source]() as source, self.sessions[move.target]() as target:
+            asset_ids = ShardManager.lock_user_assets(move.user_id, source)
+            if not asset_ids:
+                return 0, 0
+            rows = 0
+            for table in ASSET_TABLES:
+                rows += ShardManager.copy_rows(table, asset_ids, source, target, self.batch_size)
+            target.commit()
+            for table in reversed(ASSET_TABLES):
+                ShardManager.delete_rows(table, asset_ids, source)
+            source.commit()
+        return len(asset_ids), rows
@@ -1,54 +1,429 @@
-from typing import Dict, Any
+import dataclasses
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
 
+from sqlalchemy import func, inspect
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.state import InstanceState
 
-from ReusableWallet.databases.pg.dto.ledger import LedgerBalance, CreateLedgerDTO
+from ReusableWallet.databases.pg.cache import AssetCache, CacheStats
+from ReusableWallet.databases.pg.dto.bulk import BulkItemDTO, BulkItemResult
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
+from ReusableWallet.databases.pg.dto.ledger import LedgerBalance, CreateLedgerDTO, BalanceDiscrepancy, LedgerRecord
+from ReusableWallet.databases.pg.dto.settlement import SettlementResult
 from ReusableWallet.databases.pg.dto.transaction import CreateTransactionDTO
-from ReusableWallet.databases.pg.enums import ClerkType, TransactionType, TransactionStatus
-from ReusableWallet.databases.pg.managers.asset import AssetManager
-from ReusableWallet.databases.pg.managers.transaction import TransactionManager
+from ReusableWallet.databases.pg.engine import PoolConfig, PoolStats, engine_registry, get_engine
+from ReusableWallet.databases.pg.enums import ActivityStatus, ClerkType, TransactionType, TransactionStatus, LockingMode, WriteEngine, PartitionMode
+from ReusableWallet.databases.pg.exceptions import EntityNotFound, InsufficientBalance
+from ReusableWallet.databases.pg.instrumentation import (
+    NULL_SINK, InstrumentationSink, InstrumentedManager, instrument_engine, instrumented
+)
+from ReusableWallet.databases.pg.locking import ContentionStats, retry_on_conflict
+from ReusableWallet.databases.pg.managers.asset import AssetManager, CachedAssetManager
+from ReusableWallet.databases.pg.managers.balance import BalanceManager
+from ReusableWallet.databases.pg.managers.bucket import BucketManager
+from ReusableWallet.databases.pg.managers.checkpoint import CheckpointManager
+from ReusableWallet.databases.pg.managers.transaction import TransactionManager, SETTLED_STATUSES
 from ReusableWallet.databases.pg.managers.ledger import LedgerManager
+from ReusableWallet.databases.pg.managers.statement import StatementManager
+from ReusableWallet.databases.pg.pagination import iter_pages
+from ReusableWallet.databases.pg.partitioning import create_schema
+from ReusableWallet.databases.pg.replicas import Replica, ReplicaRouter
+from ReusableWallet.databases.pg.schema import Asset, AssetBalanceBucket, Ledger, Transaction
 
+# A BulkItemDTO or a plain (asset_id, amount, fee, reason, metadata) tuple
+BulkItem = Union[BulkItemDTO, Tuple]
+
+T = TypeVar('T')
+
+# (transaction type, settled status) -> (ledger clerk type, pending balance sign, available balance sign)
+_SETTLEMENT_ENTRIES = {
+    (TransactionType.WALLET_FUND, TransactionStatus.SUCCESSFUL): (ClerkType.CREDIT, 0, 1),
+    (TransactionType.WALLET_FUND, TransactionStatus.FAILED): (ClerkType.DEBIT, -1, 0),
+    (TransactionType.WITHDRAWAL, TransactionStatus.SUCCESSFUL): (ClerkType.DEBIT, -1, 0),
+    (TransactionType.WITHDRAWAL, TransactionStatus.FAILED): (ClerkType.CREDIT, 0, 1),
+}
 
-class PgWallet:
-    _db_initialized = False  # Class variable to ensure DB setup happens only once
 
-    def __init__(self, uri: str):
-        self.asset_manager = AssetManager
+class PgWallet:
+    def __init__(self, uri: str, locking: LockingMode = LockingMode.NONE, max_retries: int = 3,
+                 write_engine: WriteEngine = WriteEngine.ORM, pool_config: PoolConfig = None,
+                 replica_uris: List[str] = None, max_replica_lag: float = 5.0,
+                 replica_check_interval: float = 1.0, asset_cache: AssetCache = None,
+                 instrumentation: InstrumentationSink = None, partitioning: PartitionMode = PartitionMode.NONE,
+                 transaction_lookback: timedelta = None, replica_lag_probe: Callable[[Replica], float] = None):
+        self.locking = locking
+        self.write_engine = write_engine
+        self.max_retries = max_retries
+        self.contention = ContentionStats()
+        # Opt-in; one AssetCache can be shared by several wallets
+        self.asset_cache = asset_cache
+        self.asset_manager = CachedAssetManager(asset_cache) if asset_cache is not None else AssetManager
         self.transaction_manager = TransactionManager
         self.ledger_manager = LedgerManager
-        if not PgWallet._db_initialized:
-            self.engine = self.setup_database(uri)
-            self.Session = sessionmaker(bind=self.engine)
-            PgWallet._db_initialized = True
+        self.balance_manager = BalanceManager
+        self.statement_manager = StatementManager
+        self.checkpoint_manager = CheckpointManager
+        self.bucket_manager = BucketManager
+        # Transactions older than this are never settled or reversed; bounds lookups on partitioned tables
+        self.transaction_lookback = transaction_lookback
+        # Wallets with the same URI and pool config share one engine and pool
+        self.engine = self.setup_database(uri, pool_config, partitioning)
+        self.Session = sessionmaker(bind=self.engine)
+        # Read-only operations go to a replica lagging at most max_replica_lag seconds, else the primary.
+        # replica_lag_probe replaces the lag query, e.g. to simulate lag in tests.
+        self.replica_router = ReplicaRouter(
+            replica_uris, max_lag=max_replica_lag, check_interval=replica_check_interval, pool_config=pool_config,
+            lag_probe=replica_lag_probe
+        ) if replica_uris else None
+        self.instrumentation = instrumentation or NULL_SINK
+        if self.instrumentation.enabled:
+            self._instrument()
 
-    @classmethod
-    def setup_database(cls, uri: str):
-        from sqlalchemy import create_engine
-        from ReusableWallet.databases.pg.schema.base import Base
+    def _instrument(self):
+        for engine in [self.engine] + [replica.engine for replica in getattr(self.replica_router, 'replicas', [])]:
+            instrument_engine(engine)
+        for attribute in ('asset_manager', 'transaction_manager', 'ledger_manager', 'balance_manager',
+                          'statement_manager', 'checkpoint_manager', 'bucket_manager'):
+            setattr(self, attribute, InstrumentedManager(getattr(self, attribute), attribute))
 
-        engine = create_engine(uri)
-        Base.metadata.create_all(engine)
+    @classmethod
+    def setup_database(cls, uri: str, pool_config: PoolConfig = None,
+                       partitioning: PartitionMode = PartitionMode.NONE):
+        engine = get_engine(uri, pool_config)
+        # Once per URI and partitioning; a failed attempt is retried by the next wallet
+        if not engine_registry.schema_created(uri, partitioning):
+            create_schema(engine, partitioning)
+            engine_registry.mark_schema_created(uri, partitioning)
         return engine
 
+    def _created_after(self):
+        if self.transaction_lookback is None:
+            return None
+        # Against the database clock that stamped created_at; now() is stable, so Postgres still prunes
+        return func.now() - self.transaction_lookback
+
     def get_engine_instance(self):
         return self.engine
 
+    def pool_stats(self) -> PoolStats:
+        return self.engine.pool.stats()
+
+    @instrumented
     def create_asset(self, session: Session, user_id: str, symbol: str):
         asset = self.asset_manager.create_asset(user_id, symbol, session)
         session.commit()
         return asset
 
-    def fetch_user_asset(self, session: Session, user_id: str, symbol: str):
-        return self.asset_manager.fetch_user_asset(user_id, symbol, session)
+    @instrumented
+    def update_withdrawal_activity(self, session: Session, asset_id: str, status: ActivityStatus):
+        asset = self.asset_manager.update_withdrawal_activity(asset_id, status, session)
+        if not asset:
+            raise ValueError(f"Asset with id {asset_id} not found")
+        session.commit()
+        if self.asset_cache is not None:
+            self.asset_cache.invalidate(asset_id)
+        return asset
 
-    def fetch_balance(self, session: Session, asset_id: str) -> LedgerBalance:
-        last_ledger = self.ledger_manager.fetch_last_ledger(asset_id, session)
+    def asset_cache_stats(self) -> CacheStats:
+        return self.asset_cache.stats if self.asset_cache is not None else CacheStats()
+
+    @instrumented
+    def fetch_user_asset(self, session: Session, user_id: str, symbol: str, read_your_writes: bool = False):
+        return self._read(
+            session, read_your_writes,
+            lambda read_session: self.asset_manager.fetch_user_asset(user_id, symbol, read_session)
+        )
+
+    @instrumented
+    def fetch_user_assets(self, session: Session, user_id: str, read_your_writes: bool = False) -> List[Asset]:
+        return self._read(
+            session, read_your_writes,
+            lambda read_session: self.asset_manager.fetch_user_assets(user_id, read_session)
+        )
+
+    @instrumented
+    def fetch_balance(self, session: Session, asset_id: str, read_your_writes: bool = False) -> LedgerBalance:
+        return self._read(session, read_your_writes, lambda read_session: self._read_balance(read_session, asset_id))
+
+    @instrumented
+    def fetch_balances(self, session: Session, asset_ids: List[str],
+                       read_your_writes: bool = False) -> Dict[Any, LedgerBalance]:
+        """Balances of many assets with one query, keyed by asset id; unknown ids are left out."""
+        return self._read(
+            session, read_your_writes, lambda read_session: self.balance_manager.fetch_balances(asset_ids, read_session)
+        )
+
+    @instrumented
+    def fetch_user_balances(self, session: Session, user_id: str,
+                            read_your_writes: bool = False) -> Dict[Any, LedgerBalance]:
+        """Balances of every asset of a user with one query, keyed by asset id."""
+        return self._read(
+            session, read_your_writes,
+            lambda read_session: self.balance_manager.fetch_user_balances(user_id, read_session)
+        )
+
+    @instrumented
+    def fetch_balance_at(self, session: Session, asset_id: str, at: datetime,
+                         read_your_writes: bool = False) -> LedgerBalance:
+        return self._read(
+            session, read_your_writes, lambda read_session: self.checkpoint_manager.fetch_balance_at(
+                asset_id, at, read_session
+            )
+        )
+
+    @instrumented
+    def fetch_transactions(self, session: Session, asset_id: str, read_your_writes: bool = False):
+        return self._read(
+            session, read_your_writes,
+            lambda read_session: self.transaction_manager.fetch_transactions(asset_id, read_session)
+        )
+
+    @instrumented
+    def find_transactions_by_metadata(self, session: Session, key: str, value: Any, limit: int = 100,
+                                      read_your_writes: bool = False) -> List[Transaction]:
+        """Transactions whose metadata has key set to value, e.g. for a webhook carrying a provider reference."""
+        return self._read(
+            session, read_your_writes,
+            lambda read_session: self.transaction_manager.find_by_metadata(
+                key, value, read_session, self._created_after(), limit
+            )
+        )
+
+    @instrumented
+    def fetch_transactions_page(self, session: Session, asset_id: str, history_filter: HistoryFilter = None,
+                                after: HistoryCursor = None, page_size: int = 500,
+                                read_your_writes: bool = False) -> HistoryPage:
+        return self._read(session, read_your_writes, lambda read_session: self.transaction_manager.fetch_transactions_page(
+            asset_id, history_filter or HistoryFilter(), after, page_size, read_session
+        ))
+
+    def iter_transactions(self, session: Session, asset_id: str, history_filter: HistoryFilter = None,
+                          page_size: int = 500, read_your_writes: bool = False) -> Iterator[Transaction]:
+        """Yield an asset's transactions page by page.
+
+        Pages read on a replica each run in a short session of their own.
+        Pages read on the primary run in session's transaction, which stays
+        open across pages until the caller commits or rolls back; callers
+        scrolling long histories should do so between pages.
+        """
+        return iter_pages(lambda after: self.fetch_transactions_page(
+            session, asset_id, history_filter, after, page_size, read_your_writes
+        ))
+
+    @instrumented
+    def fetch_ledgers_page(self, session: Session, asset_id: str, history_filter: HistoryFilter = None,
+                           after: HistoryCursor = None, page_size: int = 500,
+                           read_your_writes: bool = False) -> HistoryPage:
+        return self._read(session, read_your_writes, lambda read_session: self.ledger_manager.fetch_ledgers_page(
+            asset_id, history_filter or HistoryFilter(), after, page_size, read_session
+        ))
+
+    def iter_ledgers(self, session: Session, asset_id: str, history_filter: HistoryFilter = None,
+                     page_size: int = 500, read_your_writes: bool = False) -> Iterator[Ledger]:
+        """Yield an asset's ledger entries page by page; see iter_transactions for the transactions used."""
+        return iter_pages(lambda after: self.fetch_ledgers_page(
+            session, asset_id, history_filter, after, page_size, read_your_writes
+        ))
+
+    @instrumented
+    def rebuild_balances(self, session: Session) -> int:
+        written = self.balance_manager.rebuild_balances(session)
+        session.commit()
+        return written
+
+    @instrumented
+    def check_balances(self, session: Session) -> List[BalanceDiscrepancy]:
+        return self.balance_manager.find_discrepancies(session)
+
+    def _read(self, session: Session, read_your_writes: bool, read: Callable[[Session], T]) -> T:
+        # read_your_writes pins the read to the primary, e.g. right after a write through session
+        replica = None if read_your_writes or self.replica_router is None else self.replica_router.choose()
+        if replica is not None:
+            try:
+                with replica.Session() as replica_session:
+                    return self._attach(session, read(replica_session))
+            except DBAPIError:
+                self.replica_router.mark_down(replica)
+        return read(session)
+
+    def _attach(self, session: Session, value):
+        # Objects read on a replica are detached once its session closes, so hand the caller copies
+        # in its own session, where lazy loads work; objects the caller already holds are returned as is
+        if isinstance(value, list):
+            return [self._attach(session, item) for item in value]
+        if isinstance(value, HistoryPage):
+            return dataclasses.replace(value, items=self._attach(session, value.items))
+        state = inspect(value, raiseerr=False)
+        if not isinstance(state, InstanceState):
+            return value
+        held = session.identity_map.get(state.key)
+        return held if held is not None else session.merge(value, load=False)
+
+    def _read_balance(self, session: Session, asset_id: str, for_update: bool = False) -> LedgerBalance:
+        if not for_update:
+            balance = self.balance_manager.fetch_total_balance(asset_id, session)
+        elif self.locking is LockingMode.PESSIMISTIC:
+            balance = self.balance_manager.lock_balance(asset_id, session)
+        else:
+            balance = self.balance_manager.fetch_balance(asset_id, session)
+        if not balance:
+            return LedgerBalance(pending_balance=0, available_balance=0)
         return LedgerBalance(
-            pending_balance=last_ledger.pending_balance,
-            available_balance=last_ledger.available_balance
+            pending_balance=balance.pending_balance,
+            available_balance=balance.available_balance
+        )
+
+    def _lock_balance(self, session: Session, asset: Asset,
+                      debit: bool = False) -> Tuple[LedgerBalance, Optional[List[AssetBalanceBucket]]]:
+        """Lock what a write to asset extends and return the balance it starts from.
+
+        Assets with balance buckets lock one bucket no one else holds for a
+        credit, or every bucket for a debit, whatever the locking mode, and
+        the balance is the locked buckets' total. Other assets go through
+        _read_balance and get no buckets.
+
+        asset may predate enable_balance_buckets (another process's
+        AssetCache, or an Asset loaded before), so an unbucketed asset is
+        checked again in the database once its balance row is read. Buckets
+        enabled after that bump the balance row's version, which fails this
+        write's flush rather than losing it.
+        """
+        if asset.balance_buckets <= 1:
+            balance = self._read_balance(session, asset.id, for_update=True)
+            if not self.bucket_manager.fetch_bucketed_asset_ids(session, [asset.id]):
+                return balance, None
+        if debit:
+            buckets = self.bucket_manager.lock_buckets(asset.id, session)
+        else:
+            buckets = [self.bucket_manager.lock_free_bucket(asset.id, asset.balance_buckets, session)]
+        return LedgerBalance(
+            pending_balance=sum(bucket.pending_balance for bucket in buckets),
+            available_balance=sum(bucket.available_balance for bucket in buckets),
+        ), buckets
+
+    def _create_ledger(self, session: Session, payload: CreateLedgerDTO,
+                       buckets: List[AssetBalanceBucket] = None):
+        if buckets is not None:
+            return self._create_bucket_ledgers(session, payload, buckets)[0]
+        # The balance row is written in the same DB transaction as the ledger it mirrors
+        ledger = self.ledger_manager.create_ledger(payload, session)
+        self.balance_manager.update_balance(
+            payload.asset_id, payload.pending_balance, payload.available_balance, session
+        )
+        return ledger
+
+    def _create_bucket_ledgers(self, session: Session, payload: CreateLedgerDTO,
+                               buckets: List[AssetBalanceBucket]) -> List[Ledger]:
+        # One ledger per bucket the deltas land on, each extending its bucket's own chain.
+        # The asset_balances row is not written; the bucket rebalance job refreshes it.
+        shares = self.bucket_manager.allocate(buckets, payload.pending_delta, payload.available_delta)
+        ledgers = []
+        for bucket, pending_delta, available_delta in shares or [(buckets[0], 0.0, 0.0)]:
+            bucket.pending_balance += pending_delta
+            bucket.available_balance += available_delta
+            ledgers.append(self.ledger_manager.create_ledger(dataclasses.replace(
+                payload,
+                bucket=bucket.bucket,
+                pending_balance=bucket.pending_balance,
+                pending_delta=pending_delta,
+                available_balance=bucket.available_balance,
+                available_delta=available_delta,
+            ), session))
+        return ledgers
+
+    def _lean_open(self, session: Session, asset_id: str, amount: float, fee: float, reason: Optional[str],
+                   description: Optional[str], metadata: Optional[Dict[str, Any]], clerk_type: ClerkType,
+                   type: TransactionType) -> Optional[LedgerRecord]:
+        # Returns None for assets with balance buckets, which the ORM path writes
+        record = self.balance_manager.fetch_balance_record(
+            asset_id, session, for_update=self.locking is LockingMode.PESSIMISTIC
+        )
+        if record is None or record.balance_buckets > 1:
+            return None
+        debit = clerk_type is ClerkType.DEBIT
+        if debit and amount > record.available_balance:
+            raise InsufficientBalance(asset_id)
+        transaction_id = uuid.uuid4()
+        self.transaction_manager.insert_transaction({
+            "id": transaction_id,
+            "user": record.user,
+            "asset_id": record.id,
+            "symbol": record.symbol,
+            "status": TransactionStatus.PENDING,
+            "amount": amount,
+            "fee": fee,
+            "total_amount": fee + amount,
+            "clerk_type": clerk_type,
+            "type": type,
+            "reason": reason,
+            "description": description,
+            "metadata": metadata,
+        }, session)
+        # A debit holds the amount off the available balance; a credit waits in the pending balance
+        if debit:
+            return self._lean_ledger(session, record, clerk_type, type, transaction_id, 0, -amount)
+        if type is TransactionType.WITHDRAWAL_REVERSAL:
+            return self._lean_ledger(session, record, clerk_type, type, transaction_id, 0, amount)
+        return self._lean_ledger(session, record, clerk_type, type, transaction_id, amount, 0)
+
+    def _lean_settle(self, session: Session, transaction_id: str,
+                     source_type: TransactionType) -> Optional[LedgerRecord]:
+        transaction = self.transaction_manager.fetch_transaction_record(
+            transaction_id, session, self._created_after()
+        )
+        if transaction is None:
+            raise EntityNotFound('Transaction')
+        if transaction.type is not source_type:
+            raise Exception(f"Transaction is not a {source_type.value.replace('_', ' ').lower()}")
+        record = self.balance_manager.fetch_balance_record(
+            transaction.asset_id, session, for_update=self.locking is LockingMode.PESSIMISTIC
         )
+        if record is None or record.balance_buckets > 1:
+            return None
+        clerk_type, pending_sign, available_sign = _SETTLEMENT_ENTRIES[(source_type, TransactionStatus.SUCCESSFUL)]
+        ledger = self._lean_ledger(session, record, clerk_type, source_type, transaction.id,
+                                   pending_sign * transaction.amount, available_sign * transaction.amount)
+        self.transaction_manager.settle_transaction(transaction.id, TransactionStatus.SUCCESSFUL, session)
+        return ledger
+
+    def _lean_reverse(self, session: Session, transaction_id: str, amount: float, fee: float,
+                      reason: Optional[str], description: Optional[str],
+                      metadata: Optional[Dict[str, Any]]) -> Optional[LedgerRecord]:
+        transaction = self.transaction_manager.fetch_transaction_record(
+            transaction_id, session, self._created_after()
+        )
+        if transaction is None:
+            raise EntityNotFound('Transaction')
+        if transaction.type is not TransactionType.WITHDRAWAL:
+            raise Exception('Transaction is not a withdrawal')
+        return self._lean_open(session, transaction.asset_id, amount, fee, reason, description, metadata,
+                               ClerkType.CREDIT, TransactionType.WITHDRAWAL_REVERSAL)
 
+    def _lean_ledger(self, session: Session, record, clerk_type: ClerkType, entry_type: TransactionType,
+                     transaction_id, pending_delta: float, available_delta: float) -> LedgerRecord:
+        pending_balance = record.pending_balance + pending_delta
+        available_balance = record.available_balance + available_delta
+        ledger = self.ledger_manager.insert_ledger({
+            "id": uuid.uuid4(),
+            "asset_id": record.id,
+            "clerk_type": clerk_type,
+            "entry_type": entry_type,
+            "transaction_id": transaction_id,
+            "pending_balance": pending_balance,
+            "pending_delta": pending_delta,
+            "available_balance": available_balance,
+            "available_delta": available_delta,
+            "bucket": 0,
+        }, session)
+        # Checked against the version read, so the unlocked modes fail a lost update as the ORM flush would
+        self.balance_manager.write_balance(record.id, pending_balance, available_balance, record.version, session)
+        return ledger
+
+    @instrumented
+    @retry_on_conflict
     def initiate_fund_asset(
             self,
             session: Session,
@@ -59,6 +434,20 @@ class PgWallet:
             description: str = None,
             metadata: Dict[str, Any] = None,
     ):
+        if self.write_engine is WriteEngine.STATEMENT:
+            ledger = self.statement_manager.initiate_fund_asset(
+                asset_id, amount, fee, reason, description, metadata, session
+            )
+            if ledger is not None:
+                session.commit()
+                return ledger
+            # None for assets with balance buckets, which are written below
+        if self.write_engine is WriteEngine.LEAN:
+            ledger = self._lean_open(session, asset_id, amount, fee, reason, description, metadata,
+                                     ClerkType.CREDIT, TransactionType.WALLET_FUND)
+            if ledger is not None:
+                session.commit()
+                return ledger
         # Fetch the asset and ensure it is attached to the session
         asset = self.asset_manager.fetch_asset_by_id(asset_id, session)
         if not asset:
@@ -77,9 +466,9 @@ class PgWallet:
             metadata=metadata,
         )
         transaction = self.transaction_manager.create_transaction(create_transaction_payload, session)
-        last_ledger = self.ledger_manager.fetch_last_ledger(asset.id, session)
-        pending_balance = last_ledger.pending_balance if last_ledger else 0
-        available_balance = last_ledger.available_balance if last_ledger else 0
+        balance, buckets = self._lock_balance(session, asset, debit=False)
+        pending_balance = balance.pending_balance
+        available_balance = balance.available_balance
         create_ledger_payload = CreateLedgerDTO(
             asset_id=asset.id,
             clerk_type=ClerkType.CREDIT,
@@ -90,19 +479,33 @@ class PgWallet:
             available_delta=0,
             available_balance=available_balance
         )
-        ledger = self.ledger_manager.create_ledger(create_ledger_payload, session)
+        ledger = self._create_ledger(session, create_ledger_payload, buckets)
         session.commit()
         return ledger
 
+    @instrumented
+    @retry_on_conflict
     def validate_fund_asset(self, session: Session, transaction_id: str):
+        if self.write_engine is WriteEngine.STATEMENT:
+            ledger = self.statement_manager.validate_fund_asset(transaction_id, session)
+            if ledger is not None:
+                session.commit()
+                return ledger
+        if self.write_engine is WriteEngine.LEAN:
+            ledger = self._lean_settle(session, transaction_id, TransactionType.WALLET_FUND)
+            if ledger is not None:
+                session.commit()
+                return ledger
         # ToDo: verify logic
-        transaction = self.transaction_manager.fetch_transaction_by_id(transaction_id, session)
+        transaction = self.transaction_manager.fetch_transaction_by_id(transaction_id, session, self._created_after())
+        if not transaction:
+            raise EntityNotFound('Transaction')
         if transaction.type is not TransactionType.WALLET_FUND:
-            raise Exception('Transaction is not a withdrawal')
-        asset = self.asset_manager.fetch_asset_by_id(transaction.asset.id, session)
-        last_ledger = self.ledger_manager.fetch_last_ledger(asset.id, session)
-        pending_balance = last_ledger.pending_balance if last_ledger else 0
-        available_balance = last_ledger.available_balance if last_ledger else 0
+            raise Exception('Transaction is not a wallet fund')
+        asset = self.asset_manager.fetch_asset_by_id(transaction.asset_id, session)
+        balance, buckets = self._lock_balance(session, asset, debit=False)
+        pending_balance = balance.pending_balance
+        available_balance = balance.available_balance
         create_ledger_payload = CreateLedgerDTO(
             asset_id=asset.id,
             clerk_type=ClerkType.CREDIT,
@@ -113,11 +516,15 @@ class PgWallet:
             pending_delta=0,
             pending_balance=pending_balance
         )
-        ledger = self.ledger_manager.create_ledger(create_ledger_payload, session)
-        self.transaction_manager.update_transaction(transaction_id, TransactionStatus.SUCCESSFUL, session)
+        ledger = self._create_ledger(session, create_ledger_payload, buckets)
+        self.transaction_manager.update_transaction(
+            transaction_id, TransactionStatus.SUCCESSFUL, session, self._created_after()
+        )
         session.commit()
         return ledger
 
+    @instrumented
+    @retry_on_conflict
     def initiate_charge_asset(
             self,
             session: Session,
@@ -128,15 +535,27 @@ class PgWallet:
             description: str = None,
             metadata: Dict[str, Any] = None,
     ):
-        # TodO: Use transaction, prevent anyone from reading the ledger to prevent race condition
+        if self.write_engine is WriteEngine.STATEMENT:
+            ledger = self.statement_manager.initiate_charge_asset(
+                asset_id, amount, fee, reason, description, metadata, session
+            )
+            if ledger is not None:
+                session.commit()
+                return ledger
+        if self.write_engine is WriteEngine.LEAN:
+            ledger = self._lean_open(session, asset_id, amount, fee, reason, description, metadata,
+                                     ClerkType.DEBIT, TransactionType.WITHDRAWAL)
+            if ledger is not None:
+                session.commit()
+                return ledger
         asset = self.asset_manager.fetch_asset_by_id(asset_id, session)
         if not asset:
             raise ValueError(f"Asset with id {asset_id} not found")
-        last_ledger = self.ledger_manager.fetch_last_ledger(asset.id, session)
-        pending_balance = last_ledger.pending_balance if last_ledger else 0
-        available_balance = last_ledger.available_balance if last_ledger else 0
+        balance, buckets = self._lock_balance(session, asset, debit=True)
+        pending_balance = balance.pending_balance
+        available_balance = balance.available_balance
         if amount > available_balance:
-            raise Exception("Insufficient balance")
+            raise InsufficientBalance(asset_id)
         create_transaction_payload = CreateTransactionDTO(
             user=asset.user,
             asset_id=asset.id,
@@ -161,19 +580,33 @@ class PgWallet:
             pending_balance=pending_balance,
             pending_delta=0,
         )
-        ledger = self.ledger_manager.create_ledger(create_ledger_payload, session)
+        ledger = self._create_ledger(session, create_ledger_payload, buckets)
         session.commit()
         return ledger
 
+    @instrumented
+    @retry_on_conflict
     def validate_charge_asset(self, session: Session, transaction_id: str):
+        if self.write_engine is WriteEngine.STATEMENT:
+            ledger = self.statement_manager.validate_charge_asset(transaction_id, session)
+            if ledger is not None:
+                session.commit()
+                return ledger
+        if self.write_engine is WriteEngine.LEAN:
+            ledger = self._lean_settle(session, transaction_id, TransactionType.WITHDRAWAL)
+            if ledger is not None:
+                session.commit()
+                return ledger
         # ToDo: verify logic
-        transaction = self.transaction_manager.fetch_transaction_by_id(transaction_id, session)
+        transaction = self.transaction_manager.fetch_transaction_by_id(transaction_id, session, self._created_after())
+        if not transaction:
+            raise EntityNotFound('Transaction')
         if transaction.type is not TransactionType.WITHDRAWAL:
             raise Exception('Transaction is not a withdrawal')
         asset = self.asset_manager.fetch_asset_by_id(transaction.asset_id, session)
-        last_ledger = self.ledger_manager.fetch_last_ledger(asset.id, session)
-        pending_balance = last_ledger.pending_balance if last_ledger else 0
-        available_balance = last_ledger.available_balance if last_ledger else 0
+        balance, buckets = self._lock_balance(session, asset, debit=True)
+        pending_balance = balance.pending_balance
+        available_balance = balance.available_balance
         create_ledger_payload = CreateLedgerDTO(
             asset_id=asset.id,
             clerk_type=ClerkType.DEBIT,
@@ -184,11 +617,15 @@ class PgWallet:
             available_balance=available_balance,
             available_delta=0
         )
-        ledger = self.ledger_manager.create_ledger(create_ledger_payload, session)
-        self.transaction_manager.update_transaction(transaction_id, TransactionStatus.SUCCESSFUL, session)
+        ledger = self._create_ledger(session, create_ledger_payload, buckets)
+        self.transaction_manager.update_transaction(
+            transaction_id, TransactionStatus.SUCCESSFUL, session, self._created_after()
+        )
         session.commit()
         return ledger
 
+    @instrumented
+    @retry_on_conflict
     def reverse_charge_asset(
             self,
             session: Session,
@@ -199,15 +636,28 @@ class PgWallet:
             description: str = None,
             metadata: Dict[str, Any] = None,
     ):
-        # TodO: Use transaction, prevent anyone from reading the ledger to prevent race condition
+        if self.write_engine is WriteEngine.STATEMENT:
+            ledger = self.statement_manager.reverse_charge_asset(
+                transaction_id, amount, fee, reason, description, metadata, session
+            )
+            if ledger is not None:
+                session.commit()
+                return ledger
+        if self.write_engine is WriteEngine.LEAN:
+            ledger = self._lean_reverse(session, transaction_id, amount, fee, reason, description, metadata)
+            if ledger is not None:
+                session.commit()
+                return ledger
         # ToDo: Use decrement and increment for the figures
-        transaction = self.transaction_manager.fetch_transaction_by_id(transaction_id, session)
+        transaction = self.transaction_manager.fetch_transaction_by_id(transaction_id, session, self._created_after())
+        if not transaction:
+            raise EntityNotFound('Transaction')
         if transaction.type is not TransactionType.WITHDRAWAL:
             raise Exception('Transaction is not a withdrawal')
-        asset = self.asset_manager.fetch_asset_by_id(transaction.asset, session)
-        last_ledger = self.ledger_manager.fetch_last_ledger(asset.id, session)
-        pending_balance = last_ledger.pending_balance if last_ledger else 0
-        available_balance = last_ledger.available_balance if last_ledger else 0
+        asset = self.asset_manager.fetch_asset_by_id(transaction.asset_id, session)
+        balance, buckets = self._lock_balance(session, asset, debit=False)
+        pending_balance = balance.pending_balance
+        available_balance = balance.available_balance
         create_transaction_payload = CreateTransactionDTO(
             user=asset.user,
             asset_id=asset.id,
@@ -232,6 +682,283 @@ class PgWallet:
             pending_delta=0,
             pending_balance=pending_balance,
         )
-        ledger = self.ledger_manager.create_ledger(create_ledger_payload, session)
+        ledger = self._create_ledger(session, create_ledger_payload, buckets)
         session.commit()
         return ledger
+
+    @instrumented
+    def enable_balance_buckets(self, session: Session, asset_id: str, buckets: int) -> Asset:
+        """Split a hot asset's balance into `buckets` sub-balances so that concurrent writes stop queueing.
+
+        Credits then lock a single bucket no other writer holds and debits
+        lock all of them, each bucket keeping its own ledger chain. The
+        current balance moves to bucket 0; run rebalance_buckets (or the
+        BucketRebalancer) to spread it. The bucket count can only grow.
+        """
+        if buckets < 1:
+            raise ValueError("An asset needs at least one balance bucket")
+        # Holding the balance row keeps unbucketed writers out while its balance moves to bucket 0
+        balance = self.balance_manager.lock_balance(asset_id, session)
+        asset = self.asset_manager.lock_asset(asset_id, session)
+        if not asset:
+            raise ValueError(f"Asset with id {asset_id} not found")
+        if buckets < asset.balance_buckets:
+            raise ValueError(f"Asset with id {asset_id} already has {asset.balance_buckets} balance buckets")
+        asset = self.asset_manager.update_balance_buckets(asset_id, buckets, session)
+        if buckets > 1:
+            self.bucket_manager.create_buckets(asset.id, buckets, balance, session)
+            # A new version fails the flush of writers that read the balance row unlocked before this commit
+            balance.updated_at = func.now()
+        session.commit()
+        if self.asset_cache is not None:
+            self.asset_cache.invalidate(asset_id)
+        return asset
+
+    @instrumented
+    @retry_on_conflict
+    def rebalance_buckets(self, session: Session, asset_id: str) -> List[Ledger]:
+        """Spread a bucketed asset's balance evenly over its buckets and refresh its asset_balances row.
+
+        The moves are recorded as one BUCKET_TRANSFER transaction with a
+        ledger per changed bucket, so every bucket chain stays consistent.
+        """
+        buckets = self.bucket_manager.lock_buckets(asset_id, session)
+        if len(buckets) <= 1:
+            session.rollback()
+            return []
+        asset = self.asset_manager.fetch_asset_by_id(asset_id, session)
+        pending_total = sum(bucket.pending_balance for bucket in buckets)
+        available_total = sum(bucket.available_balance for bucket in buckets)
+        moves = [
+            (bucket, pending_total / len(buckets) - bucket.pending_balance,
+             available_total / len(buckets) - bucket.available_balance)
+            for bucket in buckets
+        ]
+        moves = [move for move in moves if move[1] or move[2]]
+        ledgers = []
+        if moves:
+            transaction = self.transaction_manager.create_transaction(CreateTransactionDTO(
+                user=asset.user,
+                asset_id=asset.id,
+                symbol=asset.symbol,
+                amount=sum(max(available_delta, 0) for _, _, available_delta in moves),
+                fee=0,
+                total_amount=sum(max(available_delta, 0) for _, _, available_delta in moves),
+                clerk_type=ClerkType.CREDIT,
+                type=TransactionType.BUCKET_TRANSFER,
+                reason=None,
+                description=None,
+                metadata=None,
+                status=TransactionStatus.SUCCESSFUL,
+            ), session)
+            for bucket, pending_delta, available_delta in moves:
+                bucket.pending_balance += pending_delta
+                bucket.available_balance += available_delta
+                ledgers.append(self.ledger_manager.create_ledger(CreateLedgerDTO(
+                    asset_id=asset.id,
+                    clerk_type=ClerkType.CREDIT if pending_delta + available_delta >= 0 else ClerkType.DEBIT,
+                    entry_type=TransactionType.BUCKET_TRANSFER,
+                    transaction_id=transaction.id,
+                    pending_balance=bucket.pending_balance,
+                    pending_delta=pending_delta,
+                    available_balance=bucket.available_balance,
+                    available_delta=available_delta,
+                    bucket=bucket.bucket,
+                ), session))
+        self.balance_manager.update_balance(asset.id, pending_total, available_total, session)
+        session.commit()
+        return ledgers
+
+    @instrumented
+    def bulk_fund_assets(self, session: Session, items: List[BulkItem], chunk_size: int = 500) -> List[BulkItemResult]:
+        return self._bulk_write(session, items, ClerkType.CREDIT, TransactionType.WALLET_FUND, chunk_size)
+
+    @instrumented
+    def bulk_charge_assets(self, session: Session, items: List[BulkItem], chunk_size: int = 500) -> List[BulkItemResult]:
+        return self._bulk_write(session, items, ClerkType.DEBIT, TransactionType.WITHDRAWAL, chunk_size)
+
+    def _bulk_write(self, session: Session, items: List[BulkItem], clerk_type: ClerkType,
+                    type: TransactionType, chunk_size: int) -> List[BulkItemResult]:
+        # Each chunk is one DB transaction; a database error only fails the items of its own chunk
+        items = [item if isinstance(item, BulkItemDTO) else BulkItemDTO(*item) for item in items]
+        results = []
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            try:
+                chunk_results = self._bulk_write_chunk(session, chunk, clerk_type, type)
+                session.commit()
+            except SQLAlchemyError as error:
+                session.rollback()
+                chunk_results = [BulkItemResult(item=item, error=str(error), exception=error) for item in chunk]
+            results.extend(chunk_results)
+        return results
+
+    @staticmethod
+    def _fail_item(result: BulkItemResult, error: Exception) -> None:
+        result.error = str(error)
+        result.exception = error
+
+    def _bulk_write_chunk(self, session: Session, chunk: List[BulkItemDTO], clerk_type: ClerkType,
+                          type: TransactionType) -> List[BulkItemResult]:
+        asset_ids = {}
+        for item in chunk:
+            try:
+                asset_ids[item.asset_id] = uuid.UUID(str(item.asset_id))
+            except ValueError:
+                asset_ids[item.asset_id] = None
+        assets = self.asset_manager.fetch_assets_by_ids(
+            [asset_id for asset_id in set(asset_ids.values()) if asset_id], session
+        )
+        # Batches always lock the balance rows they extend, whatever the wallet's locking mode
+        balances = {
+            asset_id: LedgerBalance(pending_balance=balance.pending_balance,
+                                    available_balance=balance.available_balance)
+            for asset_id, balance in self.balance_manager.lock_balances(sorted(assets), session).items()
+        }
+        # Read under the balance locks, as assets may come from a cache that predates enable_balance_buckets
+        bucketed = set(self.bucket_manager.fetch_bucketed_asset_ids(session, list(assets)))
+
+        results = [BulkItemResult(item=item) for item in chunk]
+        accepted = []
+        for result in results:
+            item = result.item
+            asset = assets.get(asset_ids[item.asset_id])
+            if not asset:
+                self._fail_item(result, ValueError(f"Asset with id {item.asset_id} not found"))
+                continue
+            if asset.id in bucketed:
+                self._fail_item(result, ValueError(
+                    f"Asset with id {item.asset_id} has balance buckets; bulk writes are not supported"
+                ))
+                continue
+            balance = balances[asset.id]
+            if clerk_type is ClerkType.DEBIT:
+                if item.amount > balance.available_balance:
+                    self._fail_item(result, InsufficientBalance(asset.id))
+                    continue
+                balance.available_balance -= item.amount
+                pending_delta, available_delta = 0, -item.amount
+            else:
+                balance.pending_balance += item.amount
+                pending_delta, available_delta = item.amount, 0
+            accepted.append((result, asset, pending_delta, available_delta,
+                             balance.pending_balance, balance.available_balance))
+
+        transaction_ids = self.transaction_manager.create_transactions([
+            CreateTransactionDTO(
+                user=asset.user,
+                asset_id=asset.id,
+                symbol=asset.symbol,
+                amount=result.item.amount,
+                fee=result.item.fee,
+                total_amount=result.item.fee + result.item.amount,
+                clerk_type=clerk_type,
+                type=type,
+                reason=result.item.reason,
+                description=None,
+                metadata=result.item.metadata,
+            )
+            for result, asset, *_ in accepted
+        ], session)
+        ledgers = self.ledger_manager.create_ledgers([
+            CreateLedgerDTO(
+                asset_id=asset.id,
+                clerk_type=clerk_type,
+                entry_type=type,
+                transaction_id=transaction_id,
+                pending_balance=pending_balance,
+                pending_delta=pending_delta,
+                available_balance=available_balance,
+                available_delta=available_delta,
+            )
+            for transaction_id, (_, asset, pending_delta, available_delta, pending_balance, available_balance)
+            in zip(transaction_ids, accepted)
+        ], session)
+        for (result, *_), ledger in zip(accepted, ledgers):
+            result.ledger = ledger
+
+        for asset_id in {asset.id for _, asset, *_ in accepted}:
+            self.balance_manager.update_balance(
+                asset_id, balances[asset_id].pending_balance, balances[asset_id].available_balance, session
+            )
+        return results
+
+    @instrumented
+    def settle_transactions(self, session: Session, transaction_ids: List[str],
+                            status: TransactionStatus) -> SettlementResult:
+        """Settle a batch of pending fund and charge transactions in one DB transaction.
+
+        Transactions are loaded and locked with one query that already leaves
+        out settled ones, so replayed webhooks cost a single indexed lookup.
+        Ledgers are chained per asset in transaction creation order and
+        written with one multi-row INSERT, and the statuses are flipped with
+        one UPDATE. Ids that are not UUIDs are reported in skipped rather
+        than failing the batch.
+
+        Balance rows are locked before the transactions, the order
+        validate_fund_asset and validate_charge_asset lock them in, so a
+        settlement and a validation of the same transaction cannot deadlock.
+        """
+        if status not in SETTLED_STATUSES:
+            raise ValueError(f"Transactions can only be settled as {', '.join(s.value for s in SETTLED_STATUSES)}")
+        result = SettlementResult()
+        normalized_ids = {}
+        for transaction_id in transaction_ids:
+            try:
+                normalized_ids[transaction_id] = str(uuid.UUID(str(transaction_id)))
+            except ValueError:
+                normalized_ids[transaction_id] = None
+        valid_ids = sorted({transaction_id for transaction_id in normalized_ids.values() if transaction_id})
+        assets = self.asset_manager.fetch_assets_by_ids(
+            self.transaction_manager.fetch_unsettled_asset_ids(valid_ids, session, self._created_after()), session
+        )
+        # Assets with balance buckets are settled one by one through validate_fund_asset/validate_charge_asset
+        balances = {
+            asset_id: LedgerBalance(pending_balance=balance.pending_balance,
+                                    available_balance=balance.available_balance)
+            for asset_id, balance in self.balance_manager.lock_balances(
+                sorted(asset_id for asset_id, asset in assets.items() if asset.balance_buckets <= 1), session
+            ).items()
+        }
+        # Read under the balance locks, as assets may come from a cache that predates enable_balance_buckets
+        for asset_id in self.bucket_manager.fetch_bucketed_asset_ids(session, list(balances)):
+            del balances[asset_id]
+        transactions = self.transaction_manager.lock_unsettled_transactions(
+            valid_ids, session, self._created_after()
+        )
+        settleable = [transaction for transaction in transactions
+                      if (transaction.type, status) in _SETTLEMENT_ENTRIES and transaction.asset_id in balances]
+        settled_ids = {str(transaction.id) for transaction in settleable}
+        result.skipped = [transaction_id for transaction_id in transaction_ids
+                          if normalized_ids[transaction_id] not in settled_ids]
+        if not settleable:
+            session.rollback()
+            return result
+
+        settleable.sort(key=lambda transaction: (transaction.asset_id, transaction.created_at))
+        ledger_payloads = []
+        for transaction in settleable:
+            clerk_type, pending_sign, available_sign = _SETTLEMENT_ENTRIES[(transaction.type, status)]
+            balance = balances[transaction.asset_id]
+            balance.pending_balance += pending_sign * transaction.amount
+            balance.available_balance += available_sign * transaction.amount
+            ledger_payloads.append(CreateLedgerDTO(
+                asset_id=transaction.asset_id,
+                clerk_type=clerk_type,
+                entry_type=transaction.type,
+                transaction_id=transaction.id,
+                pending_balance=balance.pending_balance,
+                pending_delta=pending_sign * transaction.amount,
+                available_balance=balance.available_balance,
+                available_delta=available_sign * transaction.amount,
+            ))
+        result.ledgers = self.ledger_manager.create_ledgers(ledger_payloads, session)
+        self.transaction_manager.update_transactions(
+            [transaction.id for transaction in settleable], status, session
+        )
+        for asset_id in {transaction.asset_id for transaction in settleable}:
+            self.balance_manager.update_balance(
+                asset_id, balances[asset_id].pending_balance, balances[asset_id].available_balance, session
+            )
+        session.commit()
+        return result
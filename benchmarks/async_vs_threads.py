@@ -0,0 +1,112 @@
+"""Requests/sec of AsyncPgWallet against PgWallet pushed to a thread pool.
+
+A request is fetch_balance followed by initiate_charge_asset on one of
+--assets assets, so requests rarely contend on the same balance row. Both
+sides run from one asyncio event loop with the same number of requests in
+flight; the sync wallet goes through loop.run_in_executor, the way an
+asyncio API tier uses it today.
+
+    python -m benchmarks.async_vs_threads postgresql://localhost/wallet_bench --concurrency 10,50,200
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ReusableWallet.databases.pg.async_wallet import AsyncPgWallet
+from ReusableWallet.databases.pg.engine import PoolConfig
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+def seed_assets(uri, count, opening_balance):
+    wallet = PgWallet(uri)
+    asset_ids = []
+    with wallet.Session() as session:
+        for _ in range(count):
+            asset_ids.append(wallet.create_asset(session, f"bench-{uuid.uuid4()}", 'NGN').id)
+        for asset_id in asset_ids:
+            ledger = wallet.initiate_fund_asset(session, asset_id, opening_balance)
+            wallet.validate_fund_asset(session, ledger.transaction_id)
+    return asset_ids
+
+
+async def run_requests(request, asset_ids, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(index):
+        async with semaphore:
+            await request(asset_ids[index % len(asset_ids)])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(index) for index in range(requests)))
+    return time.perf_counter() - started
+
+
+async def bench_threads(uri, asset_ids, requests, concurrency):
+    wallet = PgWallet(uri, pool_config=PoolConfig(pool_size=concurrency, max_overflow=0))
+    Session = wallet.Session
+    loop = asyncio.get_running_loop()
+
+    def charge(asset_id):
+        with Session() as session:
+            wallet.fetch_balance(session, asset_id)
+            wallet.initiate_charge_asset(session, asset_id, 1)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            async def request(asset_id):
+                await loop.run_in_executor(executor, charge, asset_id)
+            return await run_requests(request, asset_ids, requests, concurrency)
+    finally:
+        wallet.engine.dispose()
+
+
+async def bench_async(uri, asset_ids, requests, concurrency):
+    wallet = AsyncPgWallet(uri, pool_config=PoolConfig(pool_size=concurrency, max_overflow=0))
+    Session = wallet.Session
+
+    async def request(asset_id):
+        async with Session() as session:
+            await wallet.fetch_balance(session, asset_id)
+            await wallet.initiate_charge_asset(session, asset_id, 1)
+
+    try:
+        return await run_requests(request, asset_ids, requests, concurrency)
+    finally:
+        # Each run gets a fresh event loop; connections must not outlive it
+        await wallet.engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('uri')
+    parser.add_argument('--concurrency', default='10,50,200', help='comma separated in-flight request counts')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per run')
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    asset_ids = seed_assets(args.uri, args.assets, opening_balance=args.requests)
+    results = []
+    for concurrency in [int(value) for value in args.concurrency.split(',')]:
+        for name, bench in (('threadpool', bench_threads), ('asyncio', bench_async)):
+            elapsed = asyncio.run(bench(args.uri, asset_ids, args.requests, concurrency))
+            result = {
+                "wallet": name,
+                "concurrency": concurrency,
+                "requests": args.requests,
+                "seconds": round(elapsed, 4),
+                "requests_per_sec": round(args.requests / elapsed, 1),
+            }
+            results.append(result)
+            print("{wallet:<11} concurrency={concurrency:<4} {requests_per_sec:>9} req/s".format(**result))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Charge throughput and retry rates as contention on one asset rises.
+
+Every worker thread runs initiate_charge_asset in a loop with its own session.
+In the "shared" scenario all threads charge the same asset; in the
+"independent" scenario each thread charges its own asset, which is the
+upper bound the locking modes should reach when assets do not collide.
+
+    python -m benchmarks.contention postgresql://localhost/wallet_bench --threads 1,4,16
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from ReusableWallet.databases.pg.engine import PoolConfig
+from ReusableWallet.databases.pg.enums import LockingMode
+from ReusableWallet.databases.pg.exceptions import ConcurrentUpdateError
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+def seed_assets(wallet, Session, count, opening_balance):
+    asset_ids = []
+    with Session() as session:
+        for _ in range(count):
+            asset = wallet.create_asset(session, f"bench-{uuid.uuid4()}", 'NGN')
+            asset_ids.append(asset.id)
+        for asset_id in asset_ids:
+            ledger = wallet.initiate_fund_asset(session, asset_id, opening_balance)
+            wallet.validate_fund_asset(session, ledger.transaction_id)
+    return asset_ids
+
+
+def run_scenario(wallet, Session, threads, operations, shared):
+    asset_ids = seed_assets(wallet, Session, 1 if shared else threads, opening_balance=threads * operations)
+    failures = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        asset_id = asset_ids[0 if shared else index]
+        failed = 0
+        with Session() as session:
+            barrier.wait()
+            for _ in range(operations):
+                try:
+                    wallet.initiate_charge_asset(session, asset_id, 1)
+                except ConcurrentUpdateError:
+                    failed += 1
+        failures.append(failed)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    wallet.contention.reset()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * operations
+    return {
+        "locking": wallet.locking.value,
+        "scenario": "shared" if shared else "independent",
+        "threads": threads,
+        "operations": total,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round((total - sum(failures)) / elapsed, 1),
+        "retries_per_op": round(wallet.contention.retry_rate, 4),
+        "failed": sum(failures),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('uri')
+    parser.add_argument('--threads', default='1,2,4,8,16', help='comma separated worker counts')
+    parser.add_argument('--operations', type=int, default=200, help='charges per worker')
+    parser.add_argument('--modes', default=','.join(mode.value for mode in LockingMode))
+    parser.add_argument('--max-retries', type=int, default=10)
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    thread_counts = [int(value) for value in args.threads.split(',')]
+    pool_config = PoolConfig(pool_size=max(thread_counts) + 1, max_overflow=0)
+
+    results = []
+    for mode in args.modes.split(','):
+        wallet = PgWallet(args.uri, locking=LockingMode(mode), max_retries=args.max_retries, pool_config=pool_config)
+        for threads in thread_counts:
+            for shared in (False, True):
+                result = run_scenario(wallet, wallet.Session, threads, args.operations, shared)
+                results.append(result)
+                print("{locking:<12} {scenario:<12} threads={threads:<3} {ops_per_sec:>9} ops/s "
+                      "retries/op={retries_per_op:<7} failed={failed}".format(**result))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
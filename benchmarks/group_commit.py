@@ -0,0 +1,138 @@
+"""Throughput and latency of small charges through GroupCommitQueue against direct calls.
+
+--callers threads each submit --operations charges of 1 on one of --assets
+assets and wait for each to finish before the next, like request handlers.
+The "direct" row calls initiate_charge_asset with one commit per charge;
+every other row goes through a GroupCommitQueue with one of the
+--batch-sizes and --waits (milliseconds) combinations. Latency is measured
+from submission to the future resolving, so it includes the time spent
+waiting for a batch to fill.
+
+    python -m benchmarks.group_commit postgresql://localhost/wallet_bench --callers 64 --waits 1,5,20
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from ReusableWallet.databases.pg.engine import PoolConfig
+from ReusableWallet.databases.pg.group_commit import GroupCommitQueue
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+from benchmarks.suite import percentile
+
+
+def seed_assets(wallet, count, opening_balance):
+    asset_ids = []
+    with wallet.Session() as session:
+        for _ in range(count):
+            asset_ids.append(wallet.create_asset(session, f"bench-{uuid.uuid4()}", 'NGN').id)
+        for asset_id in asset_ids:
+            ledger = wallet.initiate_fund_asset(session, asset_id, opening_balance)
+            wallet.validate_fund_asset(session, ledger.transaction_id)
+    return asset_ids
+
+
+def run_callers(charge, asset_ids, callers, operations):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(callers + 1)
+
+    def caller(index):
+        own_latencies = []
+        asset_id = asset_ids[index % len(asset_ids)]
+        barrier.wait()
+        for _ in range(operations):
+            started = time.perf_counter()
+            try:
+                charge(asset_id)
+            except Exception as error:
+                errors.append(repr(error))
+                continue
+            own_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own_latencies)
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def bench_direct(wallet, asset_ids, callers, operations):
+    local = threading.local()
+    sessions = []
+
+    def charge(asset_id):
+        if not hasattr(local, 'session'):
+            local.session = wallet.Session()
+            sessions.append(local.session)
+        wallet.initiate_charge_asset(local.session, asset_id, 1)
+
+    result = run_callers(charge, asset_ids, callers, operations)
+    for session in sessions:
+        session.close()
+    return dict(mode="direct", max_batch_size=1, max_wait_ms=0.0, mean_batch_size=1.0, **result)
+
+
+def bench_queue(wallet, asset_ids, callers, operations, max_batch_size, max_wait_ms, workers):
+    with GroupCommitQueue(wallet, max_batch_size=max_batch_size, max_wait=max_wait_ms / 1000,
+                          workers=workers) as group_commit:
+        result = run_callers(lambda asset_id: group_commit.submit_charge(asset_id, 1).result(),
+                             asset_ids, callers, operations)
+    return dict(mode="group-commit", max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                mean_batch_size=round(group_commit.stats.mean_batch_size or 0.0, 1), **result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('uri')
+    parser.add_argument('--callers', type=int, default=64, help='concurrent submitting threads')
+    parser.add_argument('--operations', type=int, default=100, help='charges per caller')
+    parser.add_argument('--assets', type=int, default=64, help='assets the callers charge, round robin')
+    parser.add_argument('--batch-sizes', default='10,50,200', help='comma separated max_batch_size values')
+    parser.add_argument('--waits', default='1,5,20', help='comma separated max_wait values in milliseconds')
+    parser.add_argument('--workers', type=int, default=1, help='queue worker threads')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    wallet = PgWallet(args.uri, pool_config=PoolConfig(pool_size=args.callers + args.workers, max_overflow=0))
+    # Every scenario charges the same assets, so fund them for all of them up front
+    scenarios = len(args.batch_sizes.split(',')) * len(args.waits.split(',')) + 1
+    opening_balance = scenarios * args.callers * args.operations
+    asset_ids = seed_assets(wallet, args.assets, opening_balance)
+
+    results = [bench_direct(wallet, asset_ids, args.callers, args.operations)]
+    for max_batch_size in (int(value) for value in args.batch_sizes.split(',')):
+        for max_wait_ms in (float(value) for value in args.waits.split(',')):
+            results.append(bench_queue(wallet, asset_ids, args.callers, args.operations,
+                                       max_batch_size, max_wait_ms, args.workers))
+    for result in results:
+        print("{mode:<13} batch<={max_batch_size:<4} wait={max_wait_ms:<5}ms mean batch={mean_batch_size:<6} "
+              "{ops_per_sec:>9} ops/s p50={p50_ms}ms p99={p99_ms}ms errors={errors}".format(**result))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Client-side CPU and memory per PgWallet write, for each write engine.
+
+One thread runs --operations cycles of initiate_fund_asset,
+validate_fund_asset, initiate_charge_asset and validate_charge_asset,
+round robin over --assets assets, in one session per engine, as a request
+handler holding a session would. For every engine it reports, per call:
+- CPU: process time spent in this process, which excludes waiting on Postgres;
+- wall: elapsed time, database included;
+- peak: the most Python memory allocated at once during the call;
+- retained: memory still allocated once all calls are done and the session
+  is still open, such as ORM objects held by its identity map.
+Memory is traced with tracemalloc, which slows every engine alike, so CPU
+and wall times come from a separate, untraced pass.
+
+    python -m benchmarks.lean_mode postgresql://localhost/wallet_bench --operations 2000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import uuid
+
+from ReusableWallet.databases.pg.enums import WriteEngine
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+CALLS_PER_CYCLE = 4
+
+
+def seed_assets(wallet, count, opening_balance):
+    asset_ids = []
+    with wallet.Session() as session:
+        for _ in range(count):
+            asset_ids.append(wallet.create_asset(session, f"bench-{uuid.uuid4()}", 'NGN').id)
+        for asset_id in asset_ids:
+            ledger = wallet.initiate_fund_asset(session, asset_id, opening_balance)
+            wallet.validate_fund_asset(session, ledger.transaction_id)
+    return asset_ids
+
+
+def run_cycle(wallet, session, asset_id, after_call=lambda: None):
+    fund = wallet.initiate_fund_asset(session, asset_id, 2)
+    after_call()
+    wallet.validate_fund_asset(session, fund.transaction_id)
+    after_call()
+    charge = wallet.initiate_charge_asset(session, asset_id, 1)
+    after_call()
+    wallet.validate_charge_asset(session, charge.transaction_id)
+    after_call()
+
+
+def time_engine(wallet, asset_ids, operations):
+    with wallet.Session() as session:
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        for operation in range(operations):
+            run_cycle(wallet, session, asset_ids[operation % len(asset_ids)])
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - wall_started
+    calls = operations * CALLS_PER_CYCLE
+    return {"cpu_us_per_call": round(cpu / calls * 1e6, 1), "wall_us_per_call": round(wall / calls * 1e6, 1)}
+
+
+def trace_engine(wallet, asset_ids, operations):
+    peaks = []
+
+    def record_peak():
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline[0])
+        tracemalloc.reset_peak()
+        baseline[0] = tracemalloc.get_traced_memory()[0]
+
+    with wallet.Session() as session:
+        tracemalloc.start()
+        baseline = [tracemalloc.get_traced_memory()[0]]
+        started = baseline[0]
+        for operation in range(operations):
+            run_cycle(wallet, session, asset_ids[operation % len(asset_ids)], record_peak)
+        retained = tracemalloc.get_traced_memory()[0] - started
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        "peak_bytes_per_call_p50": peaks[len(peaks) // 2],
+        "peak_bytes_per_call_max": peaks[-1],
+        "retained_bytes_per_call": round(retained / len(peaks), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('uri')
+    parser.add_argument('--operations', type=int, default=1000, help='write cycles per engine and pass')
+    parser.add_argument('--assets', type=int, default=16, help='assets the cycles write to, round robin')
+    parser.add_argument('--engines', default=','.join(engine.value for engine in WriteEngine))
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for engine in args.engines.split(','):
+        wallet = PgWallet(args.uri, write_engine=WriteEngine(engine))
+        asset_ids = seed_assets(wallet, args.assets, args.operations)
+        # Warm statement caches and the pool before anything is measured
+        time_engine(wallet, asset_ids, min(args.operations, 50))
+        result = {"write_engine": engine}
+        result.update(time_engine(wallet, asset_ids, args.operations))
+        result.update(trace_engine(wallet, asset_ids, args.operations))
+        results.append(result)
+        print("{write_engine:<10} cpu={cpu_us_per_call}us wall={wall_us_per_call}us "
+              "peak p50={peak_bytes_per_call_p50}B max={peak_bytes_per_call_max}B "
+              "retained={retained_bytes_per_call}B".format(**result))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Database round trips per PgWallet write operation, for each write engine.
+
+Counts every statement sent through the cursor plus every COMMIT (the
+driver's implicit BEGIN is not counted). With
+--check the script exits non-zero unless the STATEMENT engine needs exactly
+one statement and one commit per operation, so it can gate CI against a
+local Postgres.
+
+    python -m benchmarks.round_trips postgresql://localhost/wallet_bench --check
+"""
+import argparse
+import sys
+import uuid
+
+from sqlalchemy import event
+
+from ReusableWallet.databases.pg.enums import WriteEngine
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, 'before_cursor_execute', self._on_statement)
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_statement(self, *args):
+        self.statements += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def measure(self, operation):
+        self.statements = self.commits = 0
+        result = operation()
+        return result, (self.statements, self.commits)
+
+
+def count_operations(wallet, Session, counter):
+    counts = {}
+    with Session() as session:
+        asset = wallet.create_asset(session, f"round-trips-{uuid.uuid4()}", 'NGN')
+        asset_id = asset.id
+
+        fund, counts['initiate_fund_asset'] = counter.measure(
+            lambda: wallet.initiate_fund_asset(session, asset_id, 100))
+        fund_transaction_id = fund.transaction_id
+        _, counts['validate_fund_asset'] = counter.measure(
+            lambda: wallet.validate_fund_asset(session, fund_transaction_id))
+        charge, counts['initiate_charge_asset'] = counter.measure(
+            lambda: wallet.initiate_charge_asset(session, asset_id, 10))
+        charge_transaction_id = charge.transaction_id
+        _, counts['validate_charge_asset'] = counter.measure(
+            lambda: wallet.validate_charge_asset(session, charge_transaction_id))
+        _, counts['reverse_charge_asset'] = counter.measure(
+            lambda: wallet.reverse_charge_asset(session, charge_transaction_id, 10, 0))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('uri')
+    parser.add_argument('--check', action='store_true', help='fail unless STATEMENT costs one statement per operation')
+    args = parser.parse_args(argv)
+
+    failures = []
+    counter = None
+    for write_engine in WriteEngine:
+        wallet = PgWallet(args.uri, write_engine=write_engine)
+        # Every wallet on this URI shares one engine, so one counter sees them all
+        counter = counter or RoundTripCounter(wallet.engine)
+        for operation, (statements, commits) in count_operations(wallet, wallet.Session, counter).items():
+            print(f"{write_engine.value:<10} {operation:<22} statements={statements} commits={commits}")
+            if write_engine is WriteEngine.STATEMENT and (statements, commits) != (1, 1):
+                failures.append(operation)
+
+    if args.check and failures:
+        print(f"STATEMENT engine exceeded one round trip for: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
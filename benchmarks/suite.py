@@ -0,0 +1,293 @@
+"""Latency, throughput and statement counts for every PgWallet operation.
+
+Each benchmarked asset is given a synthetic ledger history of every
+--depths size in turn (the history only grows, so depths must be ascending),
+and at each depth every operation runs as its own phase, for each
+--concurrency level and write engine. In a phase each worker thread calls
+the operation --operations times on its own asset, so the numbers reflect
+history depth and pool pressure rather than contention on one balance row
+(benchmarks.contention covers that).
+
+Results go to --output as JSON, one record per (write engine, depth,
+concurrency, operation) with ops/sec, latency percentiles in milliseconds and
+the mean number of SQL statements per call. --compare takes an earlier
+results file and exits non-zero if any operation got slower by more than
+--threshold.
+
+    python -m benchmarks.suite postgresql://localhost/wallet_bench --output results.json
+    python -m benchmarks.suite postgresql://localhost/wallet_bench --compare baseline.json
+
+Seeding uses gen_random_uuid(), so it needs PostgreSQL 13 or later.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import sqlalchemy
+from sqlalchemy import event, text
+
+from ReusableWallet.databases.pg.dto.bulk import BulkItemDTO
+from ReusableWallet.databases.pg.engine import PoolConfig
+from ReusableWallet.databases.pg.enums import TransactionStatus, WriteEngine
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+# Items per bulk_fund_assets call and transactions per settle_transactions call
+BULK_SIZE = 100
+
+# Settled, zero-amount history stamped before anything the benchmark writes, so balances stay consistent
+_SEED_HISTORY = text("""
+WITH new_transactions AS (
+    INSERT INTO transactions (id, "user", asset_id, symbol, status, amount, fee, total_amount,
+                              clerk_type, type, created_at, updated_at)
+    SELECT gen_random_uuid(), a."user", a.id, a.symbol, 'SUCCESSFUL', 0, 0, 0, 'CREDIT', 'WALLET_FUND',
+           TIMESTAMP '2000-01-01' + n * INTERVAL '1 millisecond',
+           TIMESTAMP '2000-01-01' + n * INTERVAL '1 millisecond'
+    FROM assets a, generate_series(:first, :last) AS n
+    WHERE a.id = :asset_id
+    RETURNING id, asset_id, created_at
+)
+INSERT INTO ledgers (id, asset_id, clerk_type, entry_type, transaction_id,
+                     pending_balance, pending_delta, available_balance, available_delta, created_at)
+SELECT gen_random_uuid(), asset_id, 'CREDIT', 'WALLET_FUND', id, 0, 0, 0, 0, created_at
+FROM new_transactions
+""")
+
+
+class StatementCounter:
+    """Counts statements per thread, so concurrent workers do not mix their counts."""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._on_statement)
+
+    def _on_statement(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def count(self) -> int:
+        return getattr(self._local, 'count', 0)
+
+
+class BenchAsset:
+    """A benchmark worker's asset and the ids its earlier phases produced."""
+
+    def __init__(self, asset_id, user, symbol):
+        self.id = asset_id
+        self.user = user
+        self.symbol = symbol
+        self.depth = 0
+        self.funds = []
+        self.charges = []
+        self.validated_charges = []
+        self.bulk_funds = []
+
+
+def create_assets(wallet, count):
+    assets = []
+    with wallet.Session() as session:
+        for _ in range(count):
+            user = f"bench-{uuid.uuid4()}"
+            asset = wallet.create_asset(session, user, 'NGN')
+            assets.append(BenchAsset(asset.id, user, 'NGN'))
+    return assets
+
+
+def grow_history(wallet, assets, depth, batch_size=100000):
+    with wallet.Session() as session:
+        for asset in assets:
+            for first in range(asset.depth + 1, depth + 1, batch_size):
+                last = min(first + batch_size - 1, depth)
+                session.execute(_SEED_HISTORY, {"asset_id": str(asset.id), "first": first, "last": last})
+                session.commit()
+            asset.depth = max(asset.depth, depth)
+        session.execute(text("ANALYZE transactions; ANALYZE ledgers"))
+        session.commit()
+
+
+def _bulk_fund(wallet, session, asset):
+    results = wallet.bulk_fund_assets(session, [BulkItemDTO(asset.id, 1) for _ in range(BULK_SIZE)])
+    asset.bulk_funds.extend(result.ledger.transaction_id for result in results if result.succeeded)
+
+
+def _settle(wallet, session, asset):
+    transaction_ids, asset.bulk_funds = asset.bulk_funds[:BULK_SIZE], asset.bulk_funds[BULK_SIZE:]
+    wallet.settle_transactions(session, transaction_ids, TransactionStatus.SUCCESSFUL)
+
+
+# Phases run in this order: later phases consume the transactions earlier ones created
+OPERATIONS = [
+    ('create_asset', lambda wallet, session, asset: wallet.create_asset(session, f"bench-{uuid.uuid4()}", 'NGN')),
+    ('fetch_user_asset', lambda wallet, session, asset: wallet.fetch_user_asset(session, asset.user, asset.symbol)),
+    ('fetch_balance', lambda wallet, session, asset: wallet.fetch_balance(session, asset.id)),
+    ('fetch_transactions_page', lambda wallet, session, asset: wallet.fetch_transactions_page(
+        session, asset.id, page_size=50)),
+    ('fetch_ledgers_page', lambda wallet, session, asset: wallet.fetch_ledgers_page(session, asset.id, page_size=50)),
+    ('initiate_fund_asset', lambda wallet, session, asset: asset.funds.append(
+        wallet.initiate_fund_asset(session, asset.id, 10).transaction_id)),
+    ('validate_fund_asset', lambda wallet, session, asset: wallet.validate_fund_asset(
+        session, asset.funds.pop())),
+    ('initiate_charge_asset', lambda wallet, session, asset: asset.charges.append(
+        wallet.initiate_charge_asset(session, asset.id, 1).transaction_id)),
+    ('validate_charge_asset', lambda wallet, session, asset: asset.validated_charges.append(
+        wallet.validate_charge_asset(session, asset.charges.pop()).transaction_id)),
+    ('reverse_charge_asset', lambda wallet, session, asset: wallet.reverse_charge_asset(
+        session, asset.validated_charges.pop(), 1, 0)),
+    (f'bulk_fund_assets[{BULK_SIZE}]', _bulk_fund),
+    (f'settle_transactions[{BULK_SIZE}]', _settle),
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_phase(wallet, counter, assets, operation, operations):
+    latencies = []
+    statements = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(assets) + 1)
+
+    def worker(asset):
+        own_latencies, own_statements = [], []
+        with wallet.Session() as session:
+            barrier.wait()
+            for _ in range(operations):
+                before = counter.count()
+                started = time.perf_counter()
+                try:
+                    operation(wallet, session, asset)
+                except Exception as error:
+                    session.rollback()
+                    errors.append(repr(error))
+                    continue
+                own_latencies.append(time.perf_counter() - started)
+                own_statements.append(counter.count() - before)
+        with lock:
+            latencies.extend(own_latencies)
+            statements.extend(own_statements)
+
+    workers = [threading.Thread(target=worker, args=(asset,)) for asset in assets]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "statements_per_call": round(sum(statements) / len(statements), 2) if statements else 0.0,
+    }
+
+
+def environment(wallet):
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    with wallet.engine.connect() as connection:
+        server_version = connection.execute(text("SHOW server_version")).scalar()
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": revision or None,
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "postgres": server_version,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return the records of results that regressed against baseline by more than threshold."""
+    key = lambda record: (record["write_engine"], record["depth"], record["concurrency"], record["operation"])
+    previous = {key(record): record for record in baseline["results"]}
+    regressions = []
+    for record in results:
+        before = previous.get(key(record))
+        if not before or not before["ops_per_sec"]:
+            continue
+        slowdown = before["ops_per_sec"] / record["ops_per_sec"] - 1 if record["ops_per_sec"] else float('inf')
+        more_statements = record["statements_per_call"] > before["statements_per_call"]
+        if slowdown > threshold or more_statements:
+            regressions.append(dict(record, baseline_ops_per_sec=before["ops_per_sec"],
+                                    baseline_statements_per_call=before["statements_per_call"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('uri')
+    parser.add_argument('--depths', default='1000,100000,1000000', help='comma separated ledger rows per asset')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated worker counts')
+    parser.add_argument('--operations', type=int, default=100, help='calls per worker per phase')
+    parser.add_argument('--engines', default=','.join(engine.value for engine in WriteEngine))
+    parser.add_argument('--only', help='comma separated operation names to run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='tolerated ops/sec drop, as a fraction')
+    args = parser.parse_args(argv)
+
+    depths = [int(value) for value in args.depths.split(',')]
+    if depths != sorted(depths):
+        parser.error('--depths must be ascending')
+    concurrency_levels = [int(value) for value in args.concurrency.split(',')]
+    only = set(args.only.split(',')) if args.only else None
+    operations = [(name, operation) for name, operation in OPERATIONS if not only or name in only]
+    pool_config = PoolConfig(pool_size=max(concurrency_levels) + 1, max_overflow=0)
+
+    wallets = {engine: PgWallet(args.uri, write_engine=WriteEngine(engine), pool_config=pool_config)
+               for engine in args.engines.split(',')}
+    any_wallet = next(iter(wallets.values()))
+    # Every wallet shares the engine of (uri, pool_config), so one counter sees them all
+    counter = StatementCounter(any_wallet.engine)
+    assets = create_assets(any_wallet, max(concurrency_levels))
+
+    results = []
+    for depth in depths:
+        grow_history(any_wallet, assets, depth)
+        for engine, wallet in wallets.items():
+            for concurrency in concurrency_levels:
+                for name, operation in operations:
+                    record = dict(write_engine=engine, depth=depth, concurrency=concurrency, operation=name)
+                    record.update(run_phase(wallet, counter, assets[:concurrency], operation, args.operations))
+                    results.append(record)
+                    print("{write_engine:<10} depth={depth:<8} threads={concurrency:<3} {operation:<26} "
+                          "{ops_per_sec:>9} ops/s p50={p50_ms}ms p99={p99_ms}ms "
+                          "statements={statements_per_call} errors={errors}".format(**record))
+
+    report = {"environment": environment(any_wallet), "arguments": vars(args), "results": results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for record in regressions:
+            print("REGRESSION {write_engine} depth={depth} threads={concurrency} {operation}: "
+                  "{baseline_ops_per_sec} -> {ops_per_sec} ops/s, "
+                  "{baseline_statements_per_call} -> {statements_per_call} statements".format(**record))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
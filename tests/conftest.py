@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def database_uri():
+    """A Postgres URI the wallet may create its schema in, from WALLET_TEST_URI."""
+    uri = os.environ.get('WALLET_TEST_URI')
+    if not uri:
+        pytest.skip("set WALLET_TEST_URI to a Postgres database to run this test")
+    return uri
+
+
+@pytest.fixture
+def shard_database_uri(database_uri):
+    """A second Postgres database, from WALLET_TEST_SHARD_URI, to move rows to from database_uri."""
+    uri = os.environ.get('WALLET_TEST_SHARD_URI')
+    if not uri:
+        pytest.skip("set WALLET_TEST_SHARD_URI to a second Postgres database to run this test")
+    return uri
@@ -0,0 +1,25 @@
+import asyncio
+import uuid
+
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from ReusableWallet.databases.pg.async_wallet import AsyncPgWallet  # noqa: E402
+from ReusableWallet.databases.pg.enums import LockingMode  # noqa: E402
+
+
+def test_reused_session_sees_balance_written_by_another(database_uri):
+    async def run():
+        wallet = AsyncPgWallet(database_uri, locking=LockingMode.NONE)
+        async with wallet.Session() as first, wallet.Session() as second:
+            asset_id = (await wallet.create_asset(first, f"async-test-{uuid.uuid4()}", 'NGN')).id
+            await wallet.initiate_fund_asset(first, asset_id, 1)
+            await wallet.initiate_fund_asset(second, asset_id, 2)
+            # first still holds the balance row it wrote, at the version before second's write
+            await wallet.initiate_fund_asset(first, asset_id, 3)
+            balance = await wallet.fetch_balance(first, asset_id)
+        await wallet.engine.dispose()
+        return balance
+
+    assert asyncio.run(run()).pending_balance == 6
@@ -0,0 +1,83 @@
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from ReusableWallet.databases.pg.cache import AssetCache
+from ReusableWallet.databases.pg.enums import LockingMode, WriteEngine
+from ReusableWallet.databases.pg.exceptions import ConcurrentUpdateError
+from ReusableWallet.databases.pg.schema import Ledger
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+WRITERS = 8
+OPERATIONS = 40
+
+
+@pytest.mark.parametrize('locking, write_engine', [
+    (LockingMode.PESSIMISTIC, WriteEngine.ORM),
+    (LockingMode.OPTIMISTIC, WriteEngine.ORM),
+    (LockingMode.NONE, WriteEngine.ORM),
+    (LockingMode.PESSIMISTIC, WriteEngine.STATEMENT),
+    (LockingMode.PESSIMISTIC, WriteEngine.LEAN),
+    (LockingMode.OPTIMISTIC, WriteEngine.LEAN),
+])
+def test_enabling_buckets_under_load_loses_no_writes(database_uri, locking, write_engine):
+    admin = PgWallet(database_uri)
+    # The writers' cache keeps the asset as it was before buckets were enabled, like another process's would
+    writer = PgWallet(database_uri, locking=locking, write_engine=write_engine, max_retries=50,
+                      asset_cache=AssetCache(ttl=3600))
+    with writer.Session() as session:
+        asset_id = writer.create_asset(session, f"bucket-test-{uuid.uuid4()}", 'NGN').id
+        ledger = writer.initiate_fund_asset(session, asset_id, 10000)
+        writer.validate_fund_asset(session, ledger.transaction_id)
+        opening = writer.fetch_balance(session, asset_id)
+
+    completed = {'funds': 0, 'charges': 0}
+    lock = threading.Lock()
+    halfway = threading.Event()
+    errors = []
+
+    def write(index):
+        with writer.Session() as session:
+            for operation in range(OPERATIONS):
+                charge = (index + operation) % 2 == 1
+                try:
+                    if charge:
+                        writer.initiate_charge_asset(session, asset_id, 1)
+                    else:
+                        writer.initiate_fund_asset(session, asset_id, 1)
+                except ConcurrentUpdateError:
+                    session.rollback()
+                    continue
+                except Exception as error:
+                    session.rollback()
+                    errors.append(error)
+                    continue
+                with lock:
+                    completed['charges' if charge else 'funds'] += 1
+                    if sum(completed.values()) >= WRITERS * OPERATIONS // 4:
+                        halfway.set()
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    assert halfway.wait(timeout=60)
+    with admin.Session() as session:
+        admin.enable_balance_buckets(session, asset_id, 4)
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert completed['funds'] and completed['charges']
+    with admin.Session() as session:
+        balance = admin.fetch_balance(session, asset_id, read_your_writes=True)
+        assert balance.pending_balance == opening.pending_balance + completed['funds']
+        assert balance.available_balance == opening.available_balance - completed['charges']
+        # Every ledger written landed on a balance: the deltas add up to what the buckets hold
+        pending_total, available_total = session.execute(
+            select(func.sum(Ledger.pending_delta), func.sum(Ledger.available_delta))
+            .where(Ledger.asset_id == asset_id)
+        ).one()
+        assert (pending_total, available_total) == (balance.pending_balance, balance.available_balance)
+        assert len(admin.bucket_manager.fetch_buckets(asset_id, session)) == 4
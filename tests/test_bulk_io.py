@@ -0,0 +1,112 @@
+import csv
+import io
+import uuid
+
+import pytest
+from sqlalchemy import delete, select
+
+from ReusableWallet.databases.pg.bulk_io import BulkIO
+from ReusableWallet.databases.pg.dto.bulk_io import CopyFilter
+from ReusableWallet.databases.pg.enums import CopyFormat
+from ReusableWallet.databases.pg.schema import Ledger, Transaction
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+@pytest.fixture
+def history(database_uri):
+    """An asset with a settled history, its exported transactions and ledgers, and its chain as written."""
+    wallet = PgWallet(database_uri)
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"bulk-io-test-{uuid.uuid4()}", 'NGN').id
+        for _ in range(3):
+            fund = wallet.initiate_fund_asset(session, asset_id, 10)
+            wallet.validate_fund_asset(session, fund.transaction_id)
+            charge = wallet.initiate_charge_asset(session, asset_id, 4)
+            wallet.validate_charge_asset(session, charge.transaction_id)
+        balance = wallet.fetch_balance(session, asset_id)
+    return wallet, BulkIO(database_uri), asset_id, balance, _chain(wallet, asset_id)
+
+
+def _chain(wallet, asset_id):
+    with wallet.Session() as session:
+        return session.execute(
+            select(Ledger.id, Ledger.created_at, Ledger.pending_delta, Ledger.pending_balance,
+                   Ledger.available_delta, Ledger.available_balance)
+            .where(Ledger.asset_id == asset_id).order_by(Ledger.created_at, Ledger.id)
+        ).all()
+
+
+def _export(bulk_io, table, asset_id, format=CopyFormat.CSV):
+    output = io.BytesIO()
+    assert bulk_io.export_rows(table, output, format, CopyFilter(asset_ids=[asset_id])).rows
+    return output.getvalue()
+
+
+def _delete_ledgers(wallet, asset_id, ledger_ids=None):
+    with wallet.Session() as session:
+        statement = delete(Ledger).where(Ledger.asset_id == asset_id)
+        if ledger_ids is not None:
+            statement = statement.where(Ledger.id.in_(ledger_ids))
+        session.execute(statement)
+        session.commit()
+
+
+@pytest.mark.parametrize('format', list(CopyFormat))
+def test_export_import_round_trip_and_rerun(history, format):
+    wallet, bulk_io, asset_id, balance, chain = history
+    transactions = _export(bulk_io, 'transactions', asset_id, format)
+    ledgers = _export(bulk_io, 'ledgers', asset_id, format)
+    with wallet.Session() as session:
+        session.execute(delete(Ledger).where(Ledger.asset_id == asset_id))
+        session.execute(delete(Transaction).where(Transaction.asset_id == asset_id))
+        session.commit()
+
+    # Three funds and three charges, each with an opening and a settling ledger
+    assert bulk_io.import_rows('transactions', io.BytesIO(transactions), format).rows == 6
+    report = bulk_io.import_rows('ledgers', io.BytesIO(ledgers), format)
+    assert (report.rows, report.skipped_rows, report.corrected_rows) == (12, 0, 0)
+    assert _chain(wallet, asset_id) == chain
+    with wallet.Session() as session:
+        assert wallet.fetch_balance(session, asset_id) == balance
+
+    # Running the import again skips every row it already loaded
+    for table, data, rows in (('transactions', transactions, 6), ('ledgers', ledgers, 12)):
+        report = bulk_io.import_rows(table, io.BytesIO(data), format)
+        assert (report.rows, report.skipped_rows) == (0, rows)
+    assert _chain(wallet, asset_id) == chain
+
+
+def test_ledgers_before_existing_ones_are_rejected(history):
+    wallet, bulk_io, asset_id, balance, chain = history
+    ledgers = _export(bulk_io, 'ledgers', asset_id)
+    _delete_ledgers(wallet, asset_id, [chain[0].id, chain[1].id])
+
+    with pytest.raises(ValueError, match='come before its existing ledgers'):
+        bulk_io.import_rows('ledgers', io.BytesIO(ledgers))
+    assert _chain(wallet, asset_id) == chain[2:]
+
+
+def _break_balance(data: bytes, row: int) -> bytes:
+    # Adds 1 to one ledger's recorded available balance, breaking the chain from that ledger on
+    rows = list(csv.reader(io.StringIO(data.decode())))
+    column = rows[0].index('available_balance')
+    rows[row + 1][column] = str(float(rows[row + 1][column]) + 1)
+    output = io.StringIO()
+    csv.writer(output).writerows(rows)
+    return output.getvalue().encode()
+
+
+def test_broken_running_balance_is_rejected_or_recomputed(history):
+    wallet, bulk_io, asset_id, balance, chain = history
+    ledgers = _break_balance(_export(bulk_io, 'ledgers', asset_id), 4)
+    _delete_ledgers(wallet, asset_id)
+
+    with pytest.raises(ValueError, match='1 imported ledgers break their running balances'):
+        bulk_io.import_rows('ledgers', io.BytesIO(ledgers), recompute=False)
+    assert _chain(wallet, asset_id) == []
+
+    report = bulk_io.import_rows('ledgers', io.BytesIO(ledgers), recompute=True)
+    assert (report.rows, report.corrected_rows) == (12, 1)
+    assert _chain(wallet, asset_id) == chain
+    with wallet.Session() as session:
+        assert wallet.fetch_balance(session, asset_id) == balance
@@ -0,0 +1,88 @@
+import uuid
+
+import pytest
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ReusableWallet.databases.pg.cache import AssetCache
+from ReusableWallet.databases.pg.enums import ActivityStatus
+from ReusableWallet.databases.pg.schema import Asset
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _asset(user='user', symbol='NGN'):
+    # A detached asset with every column loaded, as one read from the database would be
+    asset = Asset(id=uuid.uuid4(), user=user, symbol=symbol, withdrawal_activity=ActivityStatus.ACTIVE,
+                  balance_buckets=1, created_at='2024-01-01', updated_at='2024-01-01')
+    make_transient_to_detached(asset)
+    return asset
+
+
+@pytest.fixture
+def session():
+    # merge(load=False) never queries, so no database is needed
+    with Session() as session:
+        yield session
+
+
+def test_entries_expire_after_ttl(session):
+    clock = Clock()
+    cache = AssetCache(ttl=60, clock=clock)
+    asset = _asset()
+    cache.put(asset)
+    clock.now += 59
+    assert cache.get_by_id(asset.id, session).id == asset.id
+    assert cache.get_by_user_symbol('user', 'NGN', session).id == asset.id
+    clock.now += 1
+    assert cache.get_by_id(asset.id, session) is None
+    assert cache.get_by_user_symbol('user', 'NGN', session) is None
+    assert len(cache) == 0
+    assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+
+
+def test_put_restarts_the_ttl(session):
+    clock = Clock()
+    cache = AssetCache(ttl=60, clock=clock)
+    asset = _asset()
+    cache.put(asset)
+    clock.now += 50
+    cache.put(asset)
+    clock.now += 50
+    assert cache.get_by_id(asset.id, session) is not None
+
+
+def test_least_recently_used_entry_is_evicted(session):
+    cache = AssetCache(max_size=2, clock=Clock())
+    first, second, third = _asset(symbol='NGN'), _asset(symbol='USD'), _asset(symbol='EUR')
+    cache.put(first)
+    cache.put(second)
+    # Reading first makes second the least recently used
+    assert cache.get_by_id(first.id, session) is not None
+    cache.put(third)
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+    assert cache.get_by_id(second.id, session) is None
+    assert cache.get_by_user_symbol('user', 'USD', session) is None
+    assert cache.get_by_id(first.id, session).id == first.id
+    assert cache.get_by_user_symbol('user', 'EUR', session).id == third.id
+
+
+def test_invalidate_by_user_and_symbol(session):
+    cache = AssetCache(clock=Clock())
+    asset = _asset()
+    cache.put(asset)
+    cache.invalidate(user_id='user', symbol='NGN')
+    assert cache.get_by_id(asset.id, session) is None
+    assert cache.stats.invalidations == 1
+
+
+def test_pending_assets_are_not_cached():
+    cache = AssetCache(clock=Clock())
+    cache.put(Asset(id=uuid.uuid4(), user='user', symbol='NGN'))
+    assert len(cache) == 0
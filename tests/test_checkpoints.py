@@ -0,0 +1,56 @@
+import uuid
+
+from sqlalchemy import select
+
+from ReusableWallet.databases.pg.managers.checkpoint import CheckpointManager
+from ReusableWallet.databases.pg.schema import BalanceCheckpoint, Ledger
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+def _write_history(wallet, session, asset_id, cycles):
+    for _ in range(cycles):
+        fund = wallet.initiate_fund_asset(session, asset_id, 5)
+        wallet.validate_fund_asset(session, fund.transaction_id)
+        charge = wallet.initiate_charge_asset(session, asset_id, 2)
+        wallet.validate_charge_asset(session, charge.transaction_id)
+
+
+def _full_replay(session, asset_id, at):
+    ledgers = session.execute(select(Ledger).where(Ledger.asset_id == asset_id)).scalars().all()
+    return (sum(ledger.pending_delta for ledger in ledgers if ledger.created_at <= at),
+            sum(ledger.available_delta for ledger in ledgers if ledger.created_at <= at))
+
+
+def _assert_matches_full_replay(wallet, session, asset_id):
+    stamps = session.execute(
+        select(Ledger.created_at).where(Ledger.asset_id == asset_id).order_by(Ledger.created_at)
+    ).scalars().all()
+    for at in stamps:
+        balance = wallet.fetch_balance_at(session, asset_id, at, read_your_writes=True)
+        assert (balance.pending_balance, balance.available_balance) == _full_replay(session, asset_id, at)
+
+
+def test_balance_at_matches_full_replay_with_and_without_checkpoints(database_uri):
+    wallet = PgWallet(database_uri)
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"checkpoint-test-{uuid.uuid4()}", 'NGN').id
+        _write_history(wallet, session, asset_id, 5)
+        _assert_matches_full_replay(wallet, session, asset_id)
+
+        assert CheckpointManager.write_checkpoints([asset_id], 3, 0, session) == 20 // 3
+        session.commit()
+        _assert_matches_full_replay(wallet, session, asset_id)
+
+        # A later pass continues from the last checkpoint rather than replaying the whole chain
+        _write_history(wallet, session, asset_id, 3)
+        assert CheckpointManager.write_checkpoints([asset_id], 3, 0, session) == (20 % 3 + 12) // 3
+        session.commit()
+        checkpoints = session.execute(
+            select(BalanceCheckpoint).where(BalanceCheckpoint.asset_id == asset_id)
+        ).scalars().all()
+        for checkpoint in checkpoints:
+            assert checkpoint.ledgers == 3
+            assert (checkpoint.pending_balance, checkpoint.available_balance) == _full_replay(
+                session, asset_id, checkpoint.created_at
+            )
+        _assert_matches_full_replay(wallet, session, asset_id)
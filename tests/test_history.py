@@ -0,0 +1,71 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from ReusableWallet.databases.pg.dto.history import HistoryCursor, HistoryFilter, HistoryPage
+from ReusableWallet.databases.pg.pagination import iter_pages
+from ReusableWallet.databases.pg.schema import Ledger
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+@pytest.mark.parametrize('created_at', [
+    datetime(2024, 2, 29, 23, 59, 59, 999999),
+    datetime(2024, 1, 1),
+    datetime(2024, 1, 1, 12, 30, tzinfo=timezone(timedelta(hours=1))),
+])
+def test_cursor_token_round_trip(created_at):
+    cursor = HistoryCursor(created_at=created_at, id=uuid.uuid4())
+    token = cursor.to_token()
+    assert HistoryCursor.from_token(token) == cursor
+    # Safe in a URL query string as it is
+    assert set(token) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=')
+
+
+def test_iter_pages_follows_cursors_until_the_last_page():
+    cursors = [HistoryCursor(datetime(2024, 1, day), uuid.uuid4()) for day in (1, 2)]
+    pages = {None: HistoryPage([1, 2], cursors[0]), cursors[0]: HistoryPage([3, 4], cursors[1]),
+             cursors[1]: HistoryPage([5])}
+    requested = []
+
+    def fetch_page(after):
+        requested.append(after)
+        return pages[after]
+
+    assert list(iter_pages(fetch_page)) == [1, 2, 3, 4, 5]
+    assert requested == [None] + cursors
+
+
+@pytest.mark.parametrize('newest_first', [True, False])
+@pytest.mark.parametrize('page_size', [1, 2, 3, 5])
+def test_pages_skip_and_repeat_no_ledger_when_timestamps_tie(database_uri, newest_first, page_size):
+    wallet = PgWallet(database_uri)
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"history-test-{uuid.uuid4()}", 'NGN').id
+        for _ in range(4):
+            fund = wallet.initiate_fund_asset(session, asset_id, 1)
+            wallet.validate_fund_asset(session, fund.transaction_id)
+        ledger_ids = session.execute(select(Ledger.id).where(Ledger.asset_id == asset_id)).scalars().all()
+        # Three timestamps over eight ledgers, so ties straddle page boundaries
+        stamps = [datetime(2024, 1, 1) + timedelta(seconds=index % 3) for index in range(len(ledger_ids))]
+        for ledger_id, stamp in zip(ledger_ids, stamps):
+            session.execute(update(Ledger).where(Ledger.id == ledger_id).values(created_at=stamp))
+        session.commit()
+        order = (Ledger.created_at.desc(), Ledger.id.desc()) if newest_first else (Ledger.created_at, Ledger.id)
+        expected = session.execute(
+            select(Ledger.id).where(Ledger.asset_id == asset_id).order_by(*order)
+        ).scalars().all()
+
+        history_filter = HistoryFilter(newest_first=newest_first)
+        seen, token = [], None
+        while True:
+            # Cursors travel as tokens, as they would between API requests
+            after = HistoryCursor.from_token(token) if token else None
+            page = wallet.fetch_ledgers_page(session, asset_id, history_filter, after, page_size)
+            assert len(page.items) <= page_size
+            seen.extend(ledger.id for ledger in page.items)
+            if page.next_cursor is None:
+                break
+            token = page.next_cursor.to_token()
+        assert seen == expected
@@ -0,0 +1,110 @@
+import logging
+
+import pytest
+
+from ReusableWallet.databases.pg.instrumentation import (
+    InstrumentationSink, InstrumentedManager, OperationSpan, PrometheusSink, SlowOperationLog, instrumented,
+)
+
+
+def _span(operation, duration_seconds, error=None, **phases):
+    span = OperationSpan(operation, duration_seconds=duration_seconds, statements=2, rows=3,
+                         sql_seconds=0.25, lock_seconds=0.125, error=error)
+    for name, seconds in phases.items():
+        span.add_phase(name, seconds)
+    return span
+
+
+def test_prometheus_render():
+    sink = PrometheusSink(prefix='w', buckets=(1.0, 0.1))
+    sink.record(_span('fund', 0.05, commit=0.5))
+    sink.record(_span('fund', 0.5, error='InsufficientBalance', commit=0.25))
+    sink.record(_span('charge', 2.0))
+    assert sink.render() == "\n".join([
+        '# TYPE w_operations_total counter',
+        'w_operations_total{operation="charge",outcome="ok"} 1',
+        'w_operations_total{operation="fund",outcome="InsufficientBalance"} 1',
+        'w_operations_total{operation="fund",outcome="ok"} 1',
+        '# TYPE w_operation_duration_seconds histogram',
+        'w_operation_duration_seconds_bucket{operation="charge",le="0.1"} 0',
+        'w_operation_duration_seconds_bucket{operation="charge",le="1.0"} 0',
+        'w_operation_duration_seconds_bucket{operation="charge",le="+Inf"} 1',
+        'w_operation_duration_seconds_sum{operation="charge"} 2.0',
+        'w_operation_duration_seconds_count{operation="charge"} 1',
+        'w_operation_duration_seconds_bucket{operation="fund",le="0.1"} 1',
+        'w_operation_duration_seconds_bucket{operation="fund",le="1.0"} 2',
+        'w_operation_duration_seconds_bucket{operation="fund",le="+Inf"} 2',
+        'w_operation_duration_seconds_sum{operation="fund"} 0.55',
+        'w_operation_duration_seconds_count{operation="fund"} 2',
+        '# TYPE w_statements_total counter',
+        'w_statements_total{operation="charge"} 2.0',
+        'w_statements_total{operation="fund"} 4.0',
+        '# TYPE w_rows_total counter',
+        'w_rows_total{operation="charge"} 3.0',
+        'w_rows_total{operation="fund"} 6.0',
+        '# TYPE w_sql_seconds_total counter',
+        'w_sql_seconds_total{operation="charge"} 0.25',
+        'w_sql_seconds_total{operation="fund"} 0.5',
+        '# TYPE w_lock_seconds_total counter',
+        'w_lock_seconds_total{operation="charge"} 0.125',
+        'w_lock_seconds_total{operation="fund"} 0.25',
+        '# TYPE w_phase_seconds_total counter',
+        'w_phase_seconds_total{operation="fund",phase="commit"} 0.75',
+    ]) + "\n"
+
+
+def test_slow_operation_log_only_logs_at_or_above_threshold(caplog):
+    log = SlowOperationLog(0.5)
+    with caplog.at_level(logging.WARNING):
+        log.record(_span('fund', 0.499))
+        log.record(_span('charge', 0.5, error='StaleDataError', flush=0.1, commit=0.3))
+    assert [record.getMessage() for record in caplog.records] == [
+        "Slow wallet operation charge took 500.0ms: statements=2 rows=3 sql=250.0ms lock=125.0ms "
+        "error=StaleDataError phases=[commit=300.0ms, flush=100.0ms]"
+    ]
+
+
+class RecordingSink(InstrumentationSink):
+    def __init__(self):
+        self.spans = []
+
+    def record(self, span):
+        self.spans.append(span)
+
+
+class Manager:
+    @staticmethod
+    def step():
+        return 'stepped'
+
+
+class Wallet:
+    def __init__(self):
+        self.instrumentation = RecordingSink()
+        self.manager = InstrumentedManager(Manager, 'manager')
+
+    @instrumented
+    def operation(self, fail=False):
+        self.manager.step()
+        # Nested operations count towards the outer span
+        self.inner()
+        if fail:
+            raise ValueError('failed')
+        return 'done'
+
+    @instrumented
+    def inner(self):
+        return self.manager.step()
+
+
+def test_instrumented_records_one_span_with_manager_phases():
+    wallet = Wallet()
+    assert wallet.operation() == 'done'
+    with pytest.raises(ValueError):
+        wallet.operation(fail=True)
+    assert [(span.operation, span.error) for span in wallet.instrumentation.spans] == [
+        ('operation', None), ('operation', 'ValueError'),
+    ]
+    assert list(wallet.instrumentation.spans[0].phases) == ['manager.step']
+    # Outside an operation the manager is called untimed
+    assert wallet.manager.step() == 'stepped'
@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+
+from ReusableWallet.databases.pg.dto.ledger import LedgerRecord
+from ReusableWallet.databases.pg.enums import LockingMode, TransactionStatus, WriteEngine
+from ReusableWallet.databases.pg.exceptions import InsufficientBalance
+from ReusableWallet.databases.pg.schema import Ledger
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+def _run_writes(wallet):
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"lean-test-{uuid.uuid4()}", 'NGN').id
+        fund = wallet.initiate_fund_asset(session, asset_id, 100, metadata={'ref': 'fund'})
+        wallet.validate_fund_asset(session, fund.transaction_id)
+        charge = wallet.initiate_charge_asset(session, asset_id, 30)
+        wallet.validate_charge_asset(session, charge.transaction_id)
+        wallet.reverse_charge_asset(session, charge.transaction_id, 30, 0)
+        balance = wallet.fetch_balance(session, asset_id)
+        ledgers = (session.query(Ledger).filter(Ledger.asset_id == asset_id)
+                   .order_by(Ledger.created_at, Ledger.id).all())
+        entries = [(ledger.clerk_type, ledger.entry_type, ledger.pending_balance, ledger.pending_delta,
+                    ledger.available_balance, ledger.available_delta) for ledger in ledgers]
+        statuses = sorted(transaction.status.value for transaction in wallet.fetch_transactions(session, asset_id))
+        return fund, (balance.pending_balance, balance.available_balance), entries, statuses
+
+
+@pytest.mark.parametrize('locking', [LockingMode.PESSIMISTIC, LockingMode.OPTIMISTIC, LockingMode.NONE])
+def test_lean_writes_match_orm_writes(database_uri, locking):
+    _, orm_balance, orm_entries, orm_statuses = _run_writes(PgWallet(database_uri, locking=locking))
+    fund, lean_balance, lean_entries, lean_statuses = _run_writes(
+        PgWallet(database_uri, locking=locking, write_engine=WriteEngine.LEAN)
+    )
+    assert isinstance(fund, LedgerRecord)
+    assert (lean_balance, lean_entries, lean_statuses) == (orm_balance, orm_entries, orm_statuses)
+
+
+def test_lean_charge_rejects_overdraft(database_uri):
+    wallet = PgWallet(database_uri, write_engine=WriteEngine.LEAN)
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"lean-test-{uuid.uuid4()}", 'NGN').id
+        with pytest.raises(InsufficientBalance):
+            wallet.initiate_charge_asset(session, asset_id, 1)
+        session.rollback()
+        assert wallet.fetch_transactions(session, asset_id) == []
+
+
+def test_lean_writes_to_bucketed_assets_go_through_the_orm(database_uri):
+    wallet = PgWallet(database_uri, write_engine=WriteEngine.LEAN)
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"lean-test-{uuid.uuid4()}", 'NGN').id
+        wallet.enable_balance_buckets(session, asset_id, 2)
+        fund = wallet.initiate_fund_asset(session, asset_id, 10)
+        assert isinstance(fund, Ledger)
+        wallet.validate_fund_asset(session, fund.transaction_id)
+        statuses = [transaction.status for transaction in wallet.fetch_transactions(session, asset_id)]
+        assert statuses == [TransactionStatus.SUCCESSFUL]
@@ -0,0 +1,39 @@
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from ReusableWallet.databases.pg.managers.transaction import TransactionManager, _metadata_select
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+def _sql(key, value):
+    return str(_metadata_select(key, value, None, 10).compile(dialect=postgresql.dialect()))
+
+
+def test_lookup_writes_the_key_as_the_index_expression_does():
+    assert "transactions.metadata ->> 'Ref'" in _sql('Ref', 'abc')
+
+
+def test_lookup_on_unindexable_key_uses_containment_only():
+    assert '->>' not in _sql("it's", 'abc')
+    assert '->>' not in _sql('ref', 42)
+
+
+def test_keys_differing_in_case_get_their_own_index(database_uri):
+    wallet = PgWallet(database_uri)
+    with wallet.Session() as session:
+        names = [TransactionManager.create_metadata_index(key, session, concurrently=False) for key in ('Ref', 'ref')]
+        session.commit()
+        assert names == ['ix_transactions_metadata_Ref', 'ix_transactions_metadata_ref']
+        indexed = session.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'transactions' AND indexname = ANY(:names)"
+        ), {"names": names}).scalars().all()
+        assert sorted(indexed) == sorted(names)
+
+        asset_id = wallet.create_asset(session, f"metadata-test-{uuid.uuid4()}", 'NGN').id
+        reference = str(uuid.uuid4())
+        ledger = wallet.initiate_fund_asset(session, asset_id, 1, metadata={'Ref': reference})
+        found = wallet.find_transactions_by_metadata(session, 'Ref', reference, read_your_writes=True)
+        assert [transaction.id for transaction in found] == [ledger.transaction_id]
+        assert wallet.find_transactions_by_metadata(session, 'ref', reference, read_your_writes=True) == []
@@ -0,0 +1,101 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.engine import make_url
+
+from ReusableWallet.databases.pg.enums import PartitionMode
+from ReusableWallet.databases.pg.partitioning import (
+    PARTITIONED_TABLES, _month_start, _monthly_partition_end, _monthly_partition_name, _next_month, _partitions,
+    archive_partitions, ensure_future_partitions, partitioned_metadata,
+)
+from ReusableWallet.databases.pg.schema import BalanceCheckpoint, Ledger, Transaction
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+@pytest.mark.parametrize('day, start, following', [
+    (date(2024, 1, 31), date(2024, 1, 1), date(2024, 2, 1)),
+    (date(2024, 2, 29), date(2024, 2, 1), date(2024, 3, 1)),
+    (date(2024, 12, 15), date(2024, 12, 1), date(2025, 1, 1)),
+])
+def test_month_bounds(day, start, following):
+    assert _month_start(day) == start
+    assert _next_month(start) == following
+
+
+def test_monthly_partition_names_round_trip_to_their_upper_bound():
+    assert _monthly_partition_name('ledgers', date(2024, 3, 1)) == 'ledgers_y2024m03'
+    assert _monthly_partition_end('ledgers_y2024m03') == date(2024, 4, 1)
+    assert _monthly_partition_end('transactions_y2024m12') == date(2025, 1, 1)
+    for name in ('ledgers_default', 'ledgers_p3', 'transactions'):
+        assert _monthly_partition_end(name) is None
+
+
+@pytest.mark.parametrize('mode, key', [(PartitionMode.MONTHLY, 'created_at'), (PartitionMode.HASH, 'asset_id')])
+def test_partitioned_tables_carry_their_key_in_the_primary_key(mode, key):
+    metadata = partitioned_metadata(mode)
+    for name in PARTITIONED_TABLES:
+        assert [column.name for column in metadata.tables[name].primary_key] == ['id', key]
+        assert metadata.tables[name].dialect_options['postgresql']['partition_by'].endswith(f"({key})")
+
+
+@pytest.fixture
+def schema_uri(database_uri):
+    """database_uri with its search_path on a fresh schema, dropped afterwards with any archive schema."""
+    schema = f"partition_test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(database_uri)
+    with admin.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    yield str(make_url(database_uri).update_query_dict({'options': f'-csearch_path={schema}'})), schema
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {schema}_archive CASCADE"))
+        connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    admin.dispose()
+
+
+def test_partitions_take_over_default_rows_and_archive(schema_uri):
+    uri, schema = schema_uri
+    wallet = PgWallet(uri, partitioning=PartitionMode.MONTHLY)
+    try:
+        with wallet.Session() as session:
+            asset_id = wallet.create_asset(session, f"partition-test-{uuid.uuid4()}", 'NGN').id
+            fund = wallet.initiate_fund_asset(session, asset_id, 10)
+            fund_ledger_id, fund_transaction_id = fund.id, fund.transaction_id
+            # Backdate the funding into a month with no partition, so it lands in the default partitions
+            backdated = datetime(2020, 3, 15)
+            session.execute(update(Transaction).where(Transaction.id == fund_transaction_id)
+                            .values(created_at=backdated))
+            session.execute(update(Ledger).where(Ledger.id == fund_ledger_id).values(created_at=backdated))
+            session.commit()
+            wallet.validate_fund_asset(session, fund_transaction_id)
+            balance = wallet.fetch_balance(session, asset_id)
+
+        with wallet.engine.connect() as connection:
+            for table in PARTITIONED_TABLES:
+                assert connection.execute(text(f"SELECT COUNT(*) FROM {table}_default")).scalar() == 1
+
+        created = ensure_future_partitions(wallet.engine, months_ahead=0, start=date(2020, 3, 9))
+        assert created == ['transactions_y2020m03', 'ledgers_y2020m03']
+        assert ensure_future_partitions(wallet.engine, months_ahead=0, start=date(2020, 3, 1)) == []
+        with wallet.engine.connect() as connection:
+            partitions = set(_partitions(connection))
+            for table in PARTITIONED_TABLES:
+                assert {f"{table}_default", f"{table}_y2020m03"} <= partitions
+                assert connection.execute(text(f"SELECT COUNT(*) FROM {table}_default")).scalar() == 0
+                assert connection.execute(text(f"SELECT COUNT(*) FROM {table}_y2020m03")).scalar() == 1
+
+        archived = archive_partitions(wallet.engine, date(2020, 4, 1), archive_schema=f"{schema}_archive")
+        assert sorted(archived) == ['ledgers_y2020m03', 'transactions_y2020m03']
+        with wallet.Session() as session:
+            assert session.execute(text(
+                f"SELECT COUNT(*) FROM {schema}_archive.ledgers_y2020m03"
+            )).scalar() == 1
+            checkpoint = session.execute(
+                select(BalanceCheckpoint).where(BalanceCheckpoint.asset_id == asset_id)
+            ).scalars().one()
+            assert (checkpoint.ledger_id, checkpoint.pending_balance) == (fund_ledger_id, 10)
+            # The archived ledger is summarized by the checkpoint
+            assert wallet.fetch_balance_at(session, asset_id, datetime(2100, 1, 1)) == balance
+    finally:
+        wallet.engine.dispose()
@@ -0,0 +1,88 @@
+import uuid
+
+import pytest
+from sqlalchemy import update
+
+from ReusableWallet.databases.pg.enums import ReconciliationMethod, TransactionStatus, TransactionType
+from ReusableWallet.databases.pg.managers.reconciliation import _expected_signs
+from ReusableWallet.databases.pg.reconciliation import LedgerReconciler
+from ReusableWallet.databases.pg.schema import AssetBalance, Ledger
+from ReusableWallet.databases.pg.wallet import _SETTLEMENT_ENTRIES, PgWallet
+
+# What initiate_fund_asset and initiate_charge_asset write before a transaction is settled
+_OPENING_SIGNS = {TransactionType.WALLET_FUND: (1, 0), TransactionType.WITHDRAWAL: (0, -1)}
+
+
+@pytest.mark.parametrize('type', list(_OPENING_SIGNS))
+@pytest.mark.parametrize('status', [TransactionStatus.SUCCESSFUL, TransactionStatus.FAILED])
+def test_expected_signs_add_the_settlement_entry_to_the_opening_one(type, status):
+    _, pending_sign, available_sign = _SETTLEMENT_ENTRIES[(type, status)]
+    opening = _OPENING_SIGNS[type]
+    assert _expected_signs(type, status) == (opening[0] + pending_sign, opening[1] + available_sign)
+
+
+@pytest.mark.parametrize('type, status, signs', [
+    (TransactionType.WALLET_FUND, TransactionStatus.PENDING, (1, 0)),
+    (TransactionType.WALLET_FUND, TransactionStatus.PROCESSING, (1, 0)),
+    (TransactionType.WITHDRAWAL, TransactionStatus.PENDING, (0, -1)),
+    (TransactionType.WITHDRAWAL, TransactionStatus.PROVIDER_PROCESSING, (0, -1)),
+    (TransactionType.WITHDRAWAL_REVERSAL, TransactionStatus.PENDING, (0, 1)),
+    (TransactionType.BUCKET_TRANSFER, TransactionStatus.SUCCESSFUL, (0, 0)),
+    (TransactionType.PURCHASE, TransactionStatus.SUCCESSFUL, None),
+    (TransactionType.PURCHASE_REFUND, TransactionStatus.PENDING, None),
+])
+def test_expected_signs(type, status, signs):
+    assert _expected_signs(type, status) == signs
+
+
+def _seed(wallet):
+    """A clean asset and one with a broken delta and a tampered balance row."""
+    with wallet.Session() as session:
+        asset_ids = []
+        for _ in range(2):
+            asset_id = wallet.create_asset(session, f"reconcile-test-{uuid.uuid4()}", 'NGN').id
+            for _ in range(3):
+                fund = wallet.initiate_fund_asset(session, asset_id, 10)
+                wallet.validate_fund_asset(session, fund.transaction_id)
+            charge = wallet.initiate_charge_asset(session, asset_id, 4)
+            wallet.validate_charge_asset(session, charge.transaction_id)
+            asset_ids.append(asset_id)
+        clean_id, broken_id = asset_ids
+        broken_ledger = session.query(Ledger).filter(
+            Ledger.transaction_id == fund.transaction_id, Ledger.available_delta == 10
+        ).one()
+        session.execute(update(Ledger).where(Ledger.id == broken_ledger.id)
+                        .values(available_delta=Ledger.available_delta + 1))
+        session.execute(update(AssetBalance).where(AssetBalance.asset_id == broken_id)
+                        .values(pending_balance=AssetBalance.pending_balance + 7))
+        session.commit()
+        return clean_id, broken_id, broken_ledger.id, fund.transaction_id
+
+
+def _findings(report):
+    return (
+        sorted((str(found.ledger_id), found.balance) for found in report.chain_breaks),
+        sorted((str(found.transaction_id), found.available_delta) for found in report.transaction_mismatches),
+        sorted((found.asset_id, found.pending_balance - found.ledger_pending_balance)
+               for found in report.balance_discrepancies),
+        report.failed_assets,
+    )
+
+
+def test_sql_and_numpy_report_the_same_inconsistencies(database_uri):
+    pytest.importorskip('numpy')
+    clean_id, broken_id, broken_ledger_id, broken_transaction_id = _seed(PgWallet(database_uri))
+    reports = {
+        method: LedgerReconciler(database_uri, method=method, chunk_size=2, workers=1).run([clean_id, broken_id])
+        for method in ReconciliationMethod
+    }
+    sql = reports[ReconciliationMethod.SQL]
+    assert sql.assets == 2 and sql.ledgers == 16 and sql.transactions == 8
+    assert _findings(sql) == (
+        [(str(broken_ledger_id), 'available')],
+        [(str(broken_transaction_id), 11)],
+        [(str(broken_id), 7)],
+        [],
+    )
+    assert _findings(reports[ReconciliationMethod.NUMPY]) == _findings(sql)
+    assert reports[ReconciliationMethod.NUMPY].ledgers == sql.ledgers
@@ -0,0 +1,97 @@
+import uuid
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from ReusableWallet.databases.pg.replicas import ReplicaRouter
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+# Engines connect lazily, so routing can be tested without these servers
+REPLICA_URIS = ['postgresql://replica-a/wallet', 'postgresql://replica-b/wallet']
+
+
+class LagProbe:
+    """Reports the lag set for each replica URI and records which replicas were probed."""
+
+    def __init__(self, lags=None):
+        self.lags = dict(lags or {})
+        self.probed = []
+
+    def __call__(self, replica):
+        self.probed.append(replica.uri)
+        lag = self.lags.get(replica.uri, 0.0)
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+
+def test_lagging_replica_is_skipped():
+    probe = LagProbe({REPLICA_URIS[0]: 30.0})
+    router = ReplicaRouter(REPLICA_URIS, max_lag=5.0, check_interval=0, lag_probe=probe)
+    assert {router.choose().uri for _ in range(4)} == {REPLICA_URIS[1]}
+
+
+def test_replica_is_used_again_once_caught_up():
+    probe = LagProbe({REPLICA_URIS[0]: 30.0, REPLICA_URIS[1]: 30.0})
+    router = ReplicaRouter(REPLICA_URIS, max_lag=5.0, check_interval=0, lag_probe=probe)
+    assert router.choose() is None
+    probe.lags[REPLICA_URIS[0]] = 1.0
+    assert router.choose().uri == REPLICA_URIS[0]
+
+
+def test_lag_is_measured_once_per_check_interval():
+    probe = LagProbe()
+    router = ReplicaRouter(REPLICA_URIS[:1], check_interval=3600, lag_probe=probe)
+    for _ in range(3):
+        router.choose()
+    assert probe.probed == REPLICA_URIS[:1]
+
+
+def test_replica_failing_its_lag_check_is_marked_down():
+    probe = LagProbe({REPLICA_URIS[0]: OperationalError('SELECT', {}, Exception('connection refused'))})
+    router = ReplicaRouter(REPLICA_URIS, check_interval=0, down_interval=3600, lag_probe=probe)
+    assert {router.choose().uri for _ in range(4)} == {REPLICA_URIS[1]}
+    assert probe.probed.count(REPLICA_URIS[0]) == 1
+
+
+@pytest.fixture
+def wallet_factory(database_uri):
+    def create(lags=None):
+        probe = LagProbe(lags)
+        # The primary doubles as its own replica, so reads succeed wherever they are routed
+        wallet = PgWallet(database_uri, replica_uris=[database_uri], replica_check_interval=0,
+                          replica_lag_probe=probe)
+        return wallet, probe
+    return create
+
+
+def _create_asset(wallet):
+    with wallet.Session() as session:
+        asset = wallet.create_asset(session, f"replica-test-{uuid.uuid4()}", 'NGN')
+        return asset.user, asset.id
+
+
+def test_reads_fall_back_to_primary_when_replicas_lag(wallet_factory, database_uri):
+    wallet, probe = wallet_factory({database_uri: 60.0})
+    user_id, asset_id = _create_asset(wallet)
+    with wallet.Session() as session:
+        assert wallet.fetch_user_asset(session, user_id, 'NGN').id == asset_id
+    assert probe.probed == [database_uri]
+
+
+def test_read_your_writes_skips_replicas(wallet_factory):
+    wallet, probe = wallet_factory()
+    user_id, asset_id = _create_asset(wallet)
+    with wallet.Session() as session:
+        assert wallet.fetch_user_asset(session, user_id, 'NGN', read_your_writes=True).id == asset_id
+    assert probe.probed == []
+
+
+def test_replica_reads_return_objects_that_can_lazy_load(wallet_factory, database_uri):
+    wallet, probe = wallet_factory()
+    user_id, asset_id = _create_asset(wallet)
+    with wallet.Session() as session:
+        asset = wallet.fetch_user_asset(session, user_id, 'NGN')
+        assert probe.probed == [database_uri]
+        assert asset in session
+        assert asset.balance.available_balance == 0
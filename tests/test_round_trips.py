@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from ReusableWallet.databases.pg.enums import WriteEngine
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+
+class RoundTrips:
+    """Counts statements sent through the cursor and COMMITs on an engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, 'before_cursor_execute', self._on_statement)
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_statement(self, *args):
+        self.statements += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def measure(self, operation):
+        self.statements = self.commits = 0
+        result = operation()
+        return result, (self.statements, self.commits)
+
+    def remove(self):
+        event.remove(self.engine, 'before_cursor_execute', self._on_statement)
+        event.remove(self.engine, 'commit', self._on_commit)
+
+
+@pytest.fixture
+def wallet(database_uri):
+    wallet = PgWallet(database_uri, write_engine=WriteEngine.STATEMENT)
+    round_trips = RoundTrips(wallet.engine)
+    yield wallet, round_trips
+    round_trips.remove()
+
+
+def test_statement_engine_writes_in_one_round_trip(wallet):
+    wallet, round_trips = wallet
+    with wallet.Session() as session:
+        asset_id = wallet.create_asset(session, f"round-trips-{uuid.uuid4()}", 'NGN').id
+
+        fund, counts = round_trips.measure(lambda: wallet.initiate_fund_asset(session, asset_id, 100))
+        assert counts == (1, 1)
+        _, counts = round_trips.measure(lambda: wallet.validate_fund_asset(session, fund.transaction_id))
+        assert counts == (1, 1)
+        charge, counts = round_trips.measure(lambda: wallet.initiate_charge_asset(session, asset_id, 10))
+        assert counts == (1, 1)
+        _, counts = round_trips.measure(lambda: wallet.validate_charge_asset(session, charge.transaction_id))
+        assert counts == (1, 1)
+        _, counts = round_trips.measure(lambda: wallet.reverse_charge_asset(session, charge.transaction_id, 10, 0))
+        assert counts == (1, 1)
@@ -0,0 +1,70 @@
+import uuid
+
+from sqlalchemy import func, select
+
+from ReusableWallet.databases.pg.dto.sharding import ShardMove
+from ReusableWallet.databases.pg.managers.checkpoint import CheckpointManager
+from ReusableWallet.databases.pg.managers.shard import ASSET_TABLES, _asset_column
+from ReusableWallet.databases.pg.sharding import ShardedWallet, ShardRebalancer, ShardRing
+from ReusableWallet.databases.pg.wallet import PgWallet
+
+USERS = [f"user-{index}" for index in range(10000)]
+
+
+def test_placement_is_stable():
+    ring = ShardRing(['a', 'b', 'c'])
+    placement = {user_id: ring.owner(user_id) for user_id in USERS}
+    assert {user_id: ShardRing(['c', 'a', 'b']).owner(user_id) for user_id in USERS} == placement
+    assert set(placement.values()) == {'a', 'b', 'c'}
+
+
+def test_adding_a_shard_moves_only_its_share_of_users():
+    names = [f"shard{index}" for index in range(4)]
+    before = ShardRing(names)
+    after = ShardRing(names + ['shard4'])
+    moved = [user_id for user_id in USERS if before.owner(user_id) != after.owner(user_id)]
+    assert {after.owner(user_id) for user_id in moved} == {'shard4'}
+    assert abs(len(moved) / len(USERS) - 1 / 5) < 0.03
+
+
+def _counts(uri, asset_ids):
+    wallet = PgWallet(uri)
+    with wallet.Session() as session:
+        return {table.name: session.execute(
+            select(func.count()).select_from(table).where(_asset_column(table).in_(asset_ids))
+        ).scalar() for table in ASSET_TABLES}
+
+
+def test_move_user_carries_every_asset_row(database_uri, shard_database_uri):
+    shards = {'source': database_uri, 'target': shard_database_uri}
+    user_id = f"shard-test-{uuid.uuid4()}"
+    source = PgWallet(database_uri)
+    with source.Session() as session:
+        asset_ids = [source.create_asset(session, user_id, symbol).id for symbol in ('NGN', 'USD')]
+        for asset_id in asset_ids:
+            fund = source.initiate_fund_asset(session, asset_id, 50, metadata={'ref': str(asset_id)})
+            source.validate_fund_asset(session, fund.transaction_id)
+            charge_transaction_id = source.initiate_charge_asset(session, asset_id, 20).transaction_id
+        source.enable_balance_buckets(session, asset_ids[1], 2)
+        CheckpointManager.write_checkpoints(asset_ids, 1, 0, session)
+        session.commit()
+        balances = source.fetch_balances(session, asset_ids)
+    copied = _counts(database_uri, asset_ids)
+    # Every per-asset table has rows to carry
+    assert all(copied.values()), copied
+
+    assets, rows = ShardRebalancer(shards).move_user(ShardMove(user_id, 'source', 'target'))
+
+    assert (assets, rows) == (2, sum(copied.values()))
+    assert _counts(shard_database_uri, asset_ids) == copied
+    assert set(_counts(database_uri, asset_ids).values()) == {0}
+
+    sharded = ShardedWallet(shards)
+    try:
+        assert sharded.fetch_balances(asset_ids) == balances
+        assert sharded.fetch_user_asset(user_id, 'NGN').id == asset_ids[0]
+        # The pending charge of the last asset is found and settled where it now lives
+        sharded.validate_charge_asset(charge_transaction_id)
+        assert sharded.fetch_balance(asset_ids[1]).pending_balance == balances[asset_ids[1]].pending_balance - 20
+    finally:
+        sharded.close()